@@ -25,6 +25,8 @@ EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 # AWS S3 Settings
 AWS_STORAGE_BUCKET_NAME = "phardev"
 AWS_S3_REGION_NAME = "eu-west-3"
+# Optional S3-compatible endpoint (MinIO, moto server...) for local runs and tests
+AWS_S3_ENDPOINT_URL = os.getenv("AWS_S3_ENDPOINT_URL")
 AWS_S3_FILE_OVERWRITE = False
 AWS_DEFAULT_ACL = None
 AWS_S3_VERIFY = True
@@ -244,6 +246,8 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Data upload settings
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10 MB
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 5000
+# Maximum size of a gzip request body once decompressed (data.parsers.GzipJSONParser)
+DATA_UPLOAD_MAX_DECOMPRESSED_SIZE = 100 * 1024 * 1024  # 100 MB
 
 # ============================================================================
 # CONFIGURATION SPÉCIFIQUE POUR TESTS
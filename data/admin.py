@@ -8,7 +8,8 @@ from data.models import (
     InventorySnapshot,
     Order,
     ProductOrder,
-    Sales
+    Sales,
+    DexterFile
 )
 
 
@@ -93,3 +94,14 @@ class SalesAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at', )
     list_per_page = 25
     raw_id_fields = ('product',)
+
+
+@admin.register(DexterFile)
+class DexterFileAdmin(admin.ModelAdmin):
+    list_display = ("key", "file_type", "cip_code", "period_start", "period_end", "status")
+
+    search_fields = ["key", "cip_code", "gers_code"]
+    list_filter = ["file_type", "status"]
+
+    readonly_fields = ('created_at', 'updated_at', )
+    list_per_page = 25
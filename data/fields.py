@@ -0,0 +1,72 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+import os
+import threading
+import time
+import uuid
+
+INTEGER_MIN, INTEGER_MAX = -2147483648, 2147483647
+
+_uuid7_lock = threading.Lock()
+_uuid7_last_ms = 0
+_uuid7_counter = 0
+
+
+def uuid7():
+    """
+    Time-ordered UUID (RFC 9562 version 7), default primary key of the UUID models.
+
+    The first 48 bits are the Unix time in milliseconds, so new rows are appended to the right
+    of the primary key and foreign key B-trees instead of landing on random pages like uuid4.
+    The 12 following bits are a counter, seeded randomly every millisecond and incremented
+    within it, so keys generated by a process are strictly increasing; the last 62 bits are
+    random and keep keys from different processes unique.
+    """
+    global _uuid7_last_ms, _uuid7_counter
+    with _uuid7_lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _uuid7_last_ms:
+            _uuid7_last_ms = now_ms
+            # Upper half left free so that the counter rarely overflows within a millisecond
+            _uuid7_counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            _uuid7_counter += 1
+            if _uuid7_counter > 0xFFF:
+                # Counter exhausted (or clock moved backwards): borrow the next millisecond
+                _uuid7_last_ms += 1
+                _uuid7_counter = 0
+        timestamp, counter = _uuid7_last_ms, _uuid7_counter
+
+    random_bits = int.from_bytes(os.urandom(8), 'big') & 0x3FFFFFFFFFFFFFFF
+    return uuid.UUID(int=(timestamp & 0xFFFFFFFFFFFF) << 80 | 0x7 << 76 | counter << 64 | 0b10 << 62 | random_bits)
+
+
+def to_cents(value):
+    """Integer cents of an amount (Decimal, float, int or str), rounded half up; None if missing or invalid."""
+    if value is None or value == '':
+        return None
+    try:
+        cents = int((Decimal(str(value)) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        return None
+    return max(INTEGER_MIN, min(cents, INTEGER_MAX))
+
+
+def from_cents(cents):
+    """Decimal amount (2 decimal places) of integer cents, None if missing."""
+    return None if cents is None else Decimal(cents).scaleb(-2)
+
+
+def decimal_cents(cents_field, doc=None):
+    """
+    Decimal property of a model, stored as integer cents in the cents_field column.
+
+    Reading returns a Decimal with 2 decimal places (None if missing); assigning a Decimal,
+    float, int or str stores its rounded cents (clamped to the integer range, ±21 474 836.47).
+    Model constructors accept the property name, e.g. InventorySnapshot(price_with_tax=...),
+    but queries (filter, values, update_fields) use the cents column.
+    """
+    return property(
+        lambda instance: from_cents(getattr(instance, cents_field)),
+        lambda instance, value: setattr(instance, cents_field, to_cents(value)),
+        doc=doc,
+    )
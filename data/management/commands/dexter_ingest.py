@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from data.services import dexter_s3
+
+
+class Command(BaseCommand):
+    help = "Ingest Dexter .json.gz files directly from the S3 bucket (keys file or prefix listing)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('keys', nargs='*', help="Object keys to ingest")
+        parser.add_argument('--keys-file', help="File with one object key per line (e.g. files_to_reprocess.txt)")
+        parser.add_argument('--prefix', help="Ingest every object under this prefix (e.g. Dexter/)")
+        parser.add_argument('--workers', type=int, default=4, help="Pharmacies processed concurrently")
+        parser.add_argument('--no-move', action='store_true', help="Do not move ingested objects to History_dexter/")
+
+    def handle(self, *args, **options):
+        keys = list(options['keys'])
+        s3_client = dexter_s3.get_s3_client(options['workers'])
+
+        if options['keys_file']:
+            with open(options['keys_file'], encoding='utf-8') as f:
+                keys.extend(line.strip() for line in f if line.strip())
+
+        if options['prefix']:
+            paginator = s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Prefix=options['prefix']):
+                keys.extend(obj['Key'] for obj in page.get('Contents', []) if obj.get('Size', 0) > 0)
+
+        if not keys:
+            raise CommandError("No keys to ingest: pass keys, --keys-file or --prefix")
+
+        result = dexter_s3.ingest_keys(
+            keys,
+            max_workers=options['workers'],
+            move=not options['no_move'],
+            s3_client=s3_client
+        )
+
+        for item in result['results']:
+            if item['status'] != 'success':
+                self.stderr.write(f"{item['key']}: {item['status']} {item.get('error', '')}")
+            elif item.get('move_error') or item.get('manifest_error'):
+                self.stderr.write(f"{item['key']}: ingested, but {item.get('move_error') or item.get('manifest_error')}")
+
+        self.stdout.write(self.style.SUCCESS(f"{result['success']} files ingested, {result['errors']} errors"))
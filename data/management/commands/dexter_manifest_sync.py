@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from data.models import DexterFile
+from data.services import dexter_manifest, dexter_s3
+
+
+class Command(BaseCommand):
+    help = "Register the Dexter objects of a prefix that are missing from the manifest."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default=dexter_s3.SOURCE_PREFIX, help="Prefix to list (default: Dexter/)")
+        parser.add_argument('--status', default=None, choices=dict(DexterFile.STATUS_CHOICES).keys(),
+                            help="Status of the new rows (default: processed for the archive prefixes, pending otherwise)")
+        parser.add_argument('--start-after', help="Start the listing after this key (default: last registered key)")
+        parser.add_argument('--full', action='store_true', help="List the whole prefix instead of the keys added since the last sync")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        status = options['status'] or (
+            DexterFile.STATUS_PROCESSED if prefix.startswith(dexter_s3.ARCHIVE_PREFIXES) else DexterFile.STATUS_PENDING
+        )
+
+        created = dexter_manifest.sync_prefix(
+            dexter_s3.get_s3_client(), prefix, status=status, start_after=options['start_after'], full=options['full']
+        )
+        self.stdout.write(self.style.SUCCESS(f"{created} new objects registered from {prefix}"))
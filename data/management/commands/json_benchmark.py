@@ -0,0 +1,64 @@
+import gzip
+import io
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from data import parsers, renderers
+
+
+class _Request:
+    META = {'HTTP_CONTENT_ENCODING': 'gzip'}
+
+
+def _best_of(func, repeat):
+    """Best wall time (ms) of repeat calls."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class Command(BaseCommand):
+    help = ("Compare DRF's default JSON parser/renderer with the orjson-based ones of the data app "
+            "on payload samples (e.g. resultats_api/achats.json).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', default=['resultats_api/achats.json'], help="JSON payload samples")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per measure (best time kept)")
+
+    def handle(self, *args, **options):
+        if parsers.orjson is None:
+            raise CommandError("orjson is not installed: the data app parser and renderer use the stdlib json module")
+
+        for path in options['files']:
+            try:
+                with open(path, 'rb') as f:
+                    body = f.read()
+            except OSError as e:
+                raise CommandError(f"{path}: {e}")
+            compressed = gzip.compress(body)
+            data = JSONParser().parse(io.BytesIO(body))
+            if parsers.GzipJSONParser().parse(io.BytesIO(body)) != data:
+                raise CommandError(f"{path}: orjson and stdlib parsers disagree")
+            if renderers.OrjsonRenderer().render(data) != JSONRenderer().render(data):
+                raise CommandError(f"{path}: orjson and stdlib renderers disagree")
+
+            measures = [
+                ("parse", lambda: JSONParser().parse(io.BytesIO(body)),
+                 lambda: parsers.GzipJSONParser().parse(io.BytesIO(body))),
+                ("parse gzip", lambda: JSONParser().parse(gzip.GzipFile(fileobj=io.BytesIO(compressed))),
+                 lambda: parsers.GzipJSONParser().parse(io.BytesIO(compressed), None, {'request': _Request()})),
+                ("render", lambda: JSONRenderer().render(data), lambda: renderers.OrjsonRenderer().render(data)),
+            ]
+            self.stdout.write(f"{path} ({len(body) / 1024:.0f} KB, {len(compressed) / 1024:.0f} KB gzip)")
+            for name, default, fast in measures:
+                default_ms = _best_of(default, options['repeat'])
+                fast_ms = _best_of(fast, options['repeat'])
+                self.stdout.write(f"  {name:<10} stdlib {default_ms:8.2f} ms   orjson {fast_ms:8.2f} ms   "
+                                  f"x{default_ms / fast_ms:.1f}")
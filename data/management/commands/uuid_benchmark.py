@@ -0,0 +1,70 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from data.fields import uuid7
+
+GENERATORS = {'uuid4': uuid.uuid4, 'uuid7': uuid7}
+
+
+class Command(BaseCommand):
+    help = ("Compare insert throughput and index size of uuid4 and uuid7 primary keys, in scratch "
+            "tables shaped like ProductOrder (uuid primary key + uuid foreign key index).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help="Rows inserted per generator")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per INSERT statement")
+
+    def handle(self, *args, **options):
+        rows, batch_size = options['rows'], options['batch_size']
+        self.stdout.write(f"{rows} rows per table, {batch_size} rows per INSERT")
+        for name, generator in GENERATORS.items():
+            elapsed, table_size, pk_size, fk_size = self._run(name, generator, rows, batch_size)
+            self.stdout.write(
+                f"  {name}: {rows / elapsed:10.0f} rows/s   table {table_size / 2 ** 20:7.1f} MB   "
+                f"pkey {pk_size / 2 ** 20:7.1f} MB   fk index {fk_size / 2 ** 20:7.1f} MB"
+            )
+
+    @staticmethod
+    def _run(name, generator, rows, batch_size):
+        """
+        Inserts rows into a scratch table keyed by generator, one transaction per INSERT, then drops it.
+
+        Returns:
+            tuple (elapsed seconds, table size, primary key index size, foreign key index size in bytes)
+        """
+        table = f"uuid_benchmark_{name}"
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(f"CREATE TABLE {table} (id uuid PRIMARY KEY, order_id uuid NOT NULL, qte smallint NOT NULL)")
+            cursor.execute(f"CREATE INDEX {table}_order_id ON {table} (order_id)")
+            try:
+                start = time.perf_counter()
+                order_id = generator()
+                for offset in range(0, rows, batch_size):
+                    count = min(batch_size, rows - offset)
+                    params = []
+                    for i in range(count):
+                        # About 20 lines per order, like ProductOrder
+                        if (offset + i) % 20 == 0:
+                            order_id = generator()
+                        params.extend((str(generator()), str(order_id), 1))
+                    with transaction.atomic():
+                        cursor.execute(
+                            f"INSERT INTO {table} (id, order_id, qte) VALUES "
+                            + ', '.join(['(%s::uuid, %s::uuid, %s)'] * count),
+                            params
+                        )
+                elapsed = time.perf_counter() - start
+
+                cursor.execute(
+                    "SELECT pg_relation_size(%s::regclass), pg_relation_size(%s::regclass), "
+                    "pg_relation_size(%s::regclass)",
+                    [table, f"{table}_pkey", f"{table}_order_id"]
+                )
+                table_size, pk_size, fk_size = cursor.fetchone()
+            finally:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        return elapsed, table_size, pk_size, fk_size
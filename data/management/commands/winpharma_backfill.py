@@ -0,0 +1,91 @@
+import os
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from data.services import winpharma_backfill
+
+
+class Command(BaseCommand):
+    help = ("Backfill WinPharma history in-process: fetch from the vendor API and call the "
+            "winpharma_historical services directly, with worker processes and a resumable checkpoint.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('pharmacies', nargs='*', help="Pharmacy national ids (id_nat)")
+        parser.add_argument('--pharmacies-file', help="File with one id_nat per line")
+        parser.add_argument('--start', required=True, help="First day (YYYY-MM-DD)")
+        parser.add_argument('--end', help="Last day (YYYY-MM-DD, default: yesterday)")
+        parser.add_argument('--streams', default='products,sales,orders',
+                            help="Comma-separated streams among products, sales, orders")
+        parser.add_argument('--api-url', default=os.environ.get('API_URL'), help="WinPharma API URL segment (default: $API_URL)")
+        parser.add_argument('--api-password', default=os.environ.get('API_PASSWORD'),
+                            help="WinPharma API password (default: $API_PASSWORD)")
+        parser.add_argument('--batch-size', type=int, default=10, help="Pharmacies per API call (Idnats)")
+        parser.add_argument('--workers', type=int, default=4, help="Worker processes")
+        parser.add_argument('--rate', type=float, default=2.0, help="Total requests per second to WinPharma")
+        parser.add_argument('--checkpoint', default='winpharma_backfill_checkpoint.jsonl',
+                            help="Checkpoint file (delete it to start over)")
+        parser.add_argument('--cache-dir', default=os.environ.get('RESPONSE_CACHE_DIR'),
+                            help="Cache vendor responses on disk and replay them (default: $RESPONSE_CACHE_DIR)")
+        parser.add_argument('--cache-ttl-hours', type=float, default=0,
+                            help="Download cached responses again after this many hours (0: never)")
+        parser.add_argument('--refresh', action='store_true', help="Ignore cached responses and download them again")
+        parser.add_argument('--bulk-load', action='store_true',
+                            help="Merge snapshots, sales and order lines through staging tables, then ANALYZE")
+        parser.add_argument('--defer-indexes', action='store_true',
+                            help="With --bulk-load, drop secondary indexes during the run and rebuild them at the end")
+        parser.add_argument('--progress-interval', type=int, default=10, help="Seconds between throughput reports")
+
+    def handle(self, *args, **options):
+        pharmacy_ids = list(options['pharmacies'])
+        if options['pharmacies_file']:
+            with open(options['pharmacies_file'], encoding='utf-8') as f:
+                pharmacy_ids.extend(line.strip() for line in f if line.strip())
+        pharmacy_ids = list(dict.fromkeys(pharmacy_ids))
+        if not pharmacy_ids:
+            raise CommandError("No pharmacies: pass ids or --pharmacies-file")
+
+        if not options['api_url'] or not options['api_password']:
+            raise CommandError("WinPharma credentials missing: --api-url/--api-password or $API_URL/$API_PASSWORD")
+
+        streams = [stream.strip() for stream in options['streams'].split(',') if stream.strip()]
+        unknown = set(streams) - set(winpharma_backfill.STREAMS)
+        if unknown:
+            raise CommandError(f"Unknown streams: {', '.join(sorted(unknown))}")
+
+        try:
+            start = date.fromisoformat(options['start'])
+            end = date.fromisoformat(options['end']) if options['end'] else date.today() - timedelta(days=1)
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+        if start > end:
+            raise CommandError("--start is after --end")
+        if options['defer_indexes'] and not options['bulk_load']:
+            raise CommandError("--defer-indexes requires --bulk-load")
+
+        totals = winpharma_backfill.run_backfill(
+            pharmacy_ids,
+            start,
+            end,
+            api_url=options['api_url'],
+            api_password=options['api_password'],
+            streams=streams,
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            rate_per_second=options['rate'],
+            checkpoint_path=options['checkpoint'],
+            progress_interval=options['progress_interval'],
+            cache_dir=options['cache_dir'],
+            cache_ttl_hours=options['cache_ttl_hours'],
+            refresh=options['refresh'],
+            bulk_load=options['bulk_load'],
+            defer_indexes_until_end=options['defer_indexes'],
+            log=self.stdout.write,
+        )
+
+        for batch in totals['failed_batches']:
+            self.stderr.write(f"Incomplete batch: {','.join(batch)} (rerun to resume)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['steps']} steps imported, {totals['failed']} failed, {totals['records']} records"
+        ))
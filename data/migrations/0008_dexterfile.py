@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0007_alter_globalproduct_universe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DexterFile',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('key', models.CharField(max_length=512, unique=True, verbose_name='Clé S3')),
+                ('file_type', models.CharField(max_length=10, verbose_name='Type')),
+                ('cip_code', models.CharField(max_length=32, verbose_name='Code CIP')),
+                ('gers_code', models.CharField(max_length=32, verbose_name='Code GERS')),
+                ('extracted_at', models.DateTimeField(blank=True, null=True, verbose_name="Date d'extraction")),
+                ('period_start', models.DateField(blank=True, null=True, verbose_name='Début de période')),
+                ('period_end', models.DateField(blank=True, null=True, verbose_name='Fin de période')),
+                ('size', models.PositiveBigIntegerField(default=0, verbose_name='Taille')),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('processed', 'Traité'), ('error', 'Erreur')], default='pending', max_length=16, verbose_name='Statut')),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['cip_code', 'gers_code', 'file_type', 'period_start'], name='dexterfile_pharmacy_idx'),
+                    models.Index(fields=['file_type', 'period_start'], name='dexterfile_type_period_idx'),
+                    models.Index(fields=['status'], name='dexterfile_status_idx'),
+                ],
+            },
+        ),
+    ]
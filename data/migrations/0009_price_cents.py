@@ -0,0 +1,87 @@
+# Generated by Django 5.1.3 on 2026-10-19 09:40
+
+from django.db import migrations, models
+
+# Rows filled per UPDATE statement; each batch is committed on its own (non-atomic migration)
+BATCH_SIZE = 50000
+INTEGER_MIN, INTEGER_MAX = -2147483648, 2147483647
+
+# (model, Decimal column, integer cents column)
+PRICE_COLUMNS = [
+    ('InventorySnapshot', 'price_with_tax', 'price_with_tax_cents'),
+    ('InventorySnapshot', 'weighted_average_price', 'weighted_average_price_cents'),
+    ('Sales', 'unit_price_ttc', 'unit_price_ttc_cents'),
+]
+
+
+def _columns(schema_editor, table):
+    with schema_editor.connection.cursor() as cursor:
+        return {column.name for column in schema_editor.connection.introspection.get_table_description(cursor, table)}
+
+
+def _copy_by_batches(apps, schema_editor, assignment):
+    """
+    Runs assignment(source, target) -> (SET clause, WHERE clause) on every price column pair,
+    by ranges of primary keys. Pairs whose Decimal column does not exist are skipped.
+
+    Rows written by the running code after their range was filled are caught up by 0011,
+    which drops the Decimal columns.
+    """
+    quote = schema_editor.quote_name
+    for model_name, source, target in PRICE_COLUMNS:
+        table = apps.get_model('data', model_name)._meta.db_table
+        if source not in _columns(schema_editor, table):
+            continue
+        set_clause, where_clause = assignment(quote(source), quote(target))
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"SELECT MIN(id), MAX(id) FROM {quote(table)}")
+            first_id, last_id = cursor.fetchone()
+            if first_id is None:
+                continue
+            for start in range(first_id, last_id + 1, BATCH_SIZE):
+                cursor.execute(
+                    f"UPDATE {quote(table)} SET {set_clause} WHERE id >= %s AND id < %s AND {where_clause}",
+                    [start, start + BATCH_SIZE]
+                )
+
+
+def fill_cents(apps, schema_editor):
+    """Copies the Decimal prices into the cents columns, rounded half up and clamped to the integer range."""
+    def assignment(source, target):
+        cents = f"{source} * 100"
+        return (
+            f"{target} = CASE WHEN {cents} >= {INTEGER_MAX} THEN {INTEGER_MAX} "
+            f"WHEN {cents} <= {INTEGER_MIN} THEN {INTEGER_MIN} ELSE CAST(ROUND({cents}) AS INTEGER) END",
+            # Only rows not filled yet: an interrupted migration resumes where it stopped
+            f"{source} IS NOT NULL AND {target} IS NULL",
+        )
+    _copy_by_batches(apps, schema_editor, assignment)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('data', '0008_dexterfile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorysnapshot',
+            name='price_with_tax_cents',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Prix TTC (centimes)'),
+        ),
+        # Added without default so that the rows still to fill stay NULL (default set by 0011)
+        migrations.AddField(
+            model_name='inventorysnapshot',
+            name='weighted_average_price_cents',
+            field=models.IntegerField(blank=True, null=True, verbose_name='PMP (centimes)'),
+        ),
+        migrations.AddField(
+            model_name='sales',
+            name='unit_price_ttc_cents',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Prix unitaire TTC avec promo (centimes)'),
+        ),
+        # Reversed by 0011, which fills the Decimal columns back before they are needed
+        migrations.RunPython(fill_cents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-19 10:05
+
+import data.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0009_price_cents'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='internalproduct',
+            name='id',
+            field=models.UUIDField(default=data.fields.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='id',
+            field=models.UUIDField(default=data.fields.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='pharmacy',
+            name='id',
+            field=models.UUIDField(default=data.fields.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='productorder',
+            name='id',
+            field=models.UUIDField(default=data.fields.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='supplier',
+            name='id',
+            field=models.UUIDField(default=data.fields.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
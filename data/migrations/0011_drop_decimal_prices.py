@@ -0,0 +1,109 @@
+# Generated by Django 5.1.3 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+INTEGER_MIN, INTEGER_MAX = -2147483648, 2147483647
+
+# (model, Decimal column, integer cents column), as in 0009
+PRICE_COLUMNS = [
+    ('InventorySnapshot', 'price_with_tax', 'price_with_tax_cents'),
+    ('InventorySnapshot', 'weighted_average_price', 'weighted_average_price_cents'),
+    ('Sales', 'unit_price_ttc', 'unit_price_ttc_cents'),
+]
+
+
+def _columns(schema_editor, table):
+    with schema_editor.connection.cursor() as cursor:
+        return {column.name for column in schema_editor.connection.introspection.get_table_description(cursor, table)}
+
+
+def _price_columns(apps, schema_editor):
+    """Yields (quoted table, quoted Decimal column, quoted cents column) for the pairs whose Decimal column exists."""
+    quote = schema_editor.quote_name
+    for model_name, source, target in PRICE_COLUMNS:
+        table = apps.get_model('data', model_name)._meta.db_table
+        if source in _columns(schema_editor, table):
+            yield quote(table), quote(source), quote(target)
+
+
+def sync_cents(apps, schema_editor):
+    """
+    Catches up the rows whose cents no longer match their Decimal price: rows inserted or
+    updated by the running code after 0009 filled their range.
+
+    On PostgreSQL the tables are locked against writes (reads go on) until the Decimal
+    columns are dropped by the end of this atomic migration, so no write is lost in between.
+    """
+    columns = list(_price_columns(apps, schema_editor))
+    if schema_editor.connection.vendor == 'postgresql':
+        for table in sorted({table for table, _, _ in columns}):
+            schema_editor.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+
+    for table, source, target in columns:
+        cents = f"{source} * 100"
+        rounded = (f"CASE WHEN {cents} >= {INTEGER_MAX} THEN {INTEGER_MAX} WHEN {cents} <= {INTEGER_MIN} "
+                   f"THEN {INTEGER_MIN} ELSE CAST(ROUND({cents}) AS INTEGER) END")
+        schema_editor.execute(
+            f"UPDATE {table} SET {target} = CASE WHEN {source} IS NULL THEN NULL ELSE {rounded} END "
+            f"WHERE ({source} IS NULL AND {target} IS NOT NULL) "
+            f"OR ({source} IS NOT NULL AND ({target} IS NULL OR {target} <> {rounded}))"
+        )
+
+    if schema_editor.connection.vendor == 'postgresql':
+        # Fires the deferred foreign key checks queued by the updates: PostgreSQL refuses to
+        # ALTER a table with pending trigger events in the same transaction
+        schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        schema_editor.execute("SET CONSTRAINTS ALL DEFERRED")
+
+
+def fill_decimals(apps, schema_editor):
+    """Reverse of sync_cents and 0009, once the Decimal columns have been added back."""
+    # Re-added Decimal columns hold their default: every row is overwritten
+    for table, source, target in _price_columns(apps, schema_editor):
+        schema_editor.execute(f"UPDATE {table} SET {source} = CASE WHEN {target} IS NULL THEN NULL "
+                              f"ELSE {target} / 100.0 END")
+
+
+def drop_unit_price_ttc(apps, schema_editor):
+    """
+    Drops Sales.unit_price_ttc where it exists: the column was added to the model without a
+    migration, so it is only present on the databases it was created on by hand.
+    """
+    table = apps.get_model('data', 'Sales')._meta.db_table
+    if 'unit_price_ttc' in _columns(schema_editor, table):
+        quote = schema_editor.quote_name
+        schema_editor.execute(f"ALTER TABLE {quote(table)} DROP COLUMN {quote('unit_price_ttc')}")
+
+
+def restore_unit_price_ttc(apps, schema_editor):
+    """Adds Sales.unit_price_ttc back (filled by fill_decimals), as the model had it before 0009."""
+    table = apps.get_model('data', 'Sales')._meta.db_table
+    if 'unit_price_ttc' not in _columns(schema_editor, table):
+        quote = schema_editor.quote_name
+        column_type = models.DecimalField(max_digits=10, decimal_places=2).db_type(schema_editor.connection)
+        schema_editor.execute(f"ALTER TABLE {quote(table)} ADD COLUMN {quote('unit_price_ttc')} {column_type} NULL")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0010_uuid7_primary_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(sync_cents, fill_decimals),
+        migrations.AlterField(
+            model_name='inventorysnapshot',
+            name='weighted_average_price_cents',
+            field=models.IntegerField(blank=True, default=0, null=True, verbose_name='PMP (centimes)'),
+        ),
+        migrations.RemoveField(
+            model_name='inventorysnapshot',
+            name='price_with_tax',
+        ),
+        migrations.RemoveField(
+            model_name='inventorysnapshot',
+            name='weighted_average_price',
+        ),
+        migrations.RunPython(drop_unit_price_ttc, restore_unit_price_ttc),
+    ]
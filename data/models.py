@@ -1,12 +1,13 @@
-import uuid
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 from django.db import models
 from django.db.models import UniqueConstraint
 
+from data.fields import decimal_cents, uuid7
+
 
 class Pharmacy(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     id_nat = models.CharField(max_length=255, null=True, blank=True,)
@@ -22,7 +23,7 @@ class Pharmacy(models.Model):
 
 
 class Supplier(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -64,7 +65,7 @@ class GlobalProduct(models.Model):
 
 
 class InternalProduct(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     internal_id = models.PositiveBigIntegerField()
     code_13_ref = models.ForeignKey(GlobalProduct, null=True, blank=True, on_delete=models.CASCADE)
 
@@ -101,8 +102,13 @@ class InventorySnapshot(models.Model):
     date = models.DateField()
 
     stock = models.SmallIntegerField(default=0, verbose_name="Stock")
-    price_with_tax = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
-    weighted_average_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, null=True, blank=True)
+    # Prices in integer cents; price_with_tax and weighted_average_price are their Decimal accessors
+    price_with_tax_cents = models.IntegerField(null=True, blank=True, verbose_name="Prix TTC (centimes)")
+    weighted_average_price_cents = models.IntegerField(default=0, null=True, blank=True,
+                                                       verbose_name="PMP (centimes)")
+
+    price_with_tax = decimal_cents('price_with_tax_cents', "Prix TTC")
+    weighted_average_price = decimal_cents('weighted_average_price_cents', "PMP")
 
     class Meta:
         constraints = [
@@ -116,7 +122,7 @@ class InventorySnapshot(models.Model):
 
 
 class Order(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     internal_id = models.PositiveBigIntegerField()
@@ -137,7 +143,7 @@ class Order(models.Model):
 
 
 class ProductOrder(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     product = models.ForeignKey(
@@ -182,18 +188,58 @@ class Sales(models.Model):
 
     quantity = models.SmallIntegerField()
     date = models.DateField(db_index=True, verbose_name="Date")
-    unit_price_ttc = models.DecimalField(
-        max_digits=10, 
-        decimal_places=2, 
-        null=True, 
+    unit_price_ttc_cents = models.IntegerField(
+        null=True,
         blank=True,
-        verbose_name="Prix unitaire TTC avec promo"
+        verbose_name="Prix unitaire TTC avec promo (centimes)"
     )
 
+    unit_price_ttc = decimal_cents('unit_price_ttc_cents', "Prix unitaire TTC avec promo")
+
     def __str__(self):
         return f"{self.quantity} Sales for {self.product} on {self.date}"
 
     class Meta:
         constraints = [
             UniqueConstraint(fields=['date', 'product'], name='unique_dateproductsale_constraint')
-        ]
\ No newline at end of file
+        ]
+
+class DexterFile(models.Model):
+    """
+    Manifest of the Dexter objects stored in the S3 bucket (one row per object).
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSED = 'processed'
+    STATUS_ERROR = 'error'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'En attente'),
+        (STATUS_PROCESSED, 'Traité'),
+        (STATUS_ERROR, 'Erreur'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    key = models.CharField(max_length=512, unique=True, verbose_name="Clé S3")
+    file_type = models.CharField(max_length=10, verbose_name="Type")
+    cip_code = models.CharField(max_length=32, verbose_name="Code CIP")
+    gers_code = models.CharField(max_length=32, verbose_name="Code GERS")
+    extracted_at = models.DateTimeField(null=True, blank=True, verbose_name="Date d'extraction")
+    period_start = models.DateField(null=True, blank=True, verbose_name="Début de période")
+    period_end = models.DateField(null=True, blank=True, verbose_name="Fin de période")
+    size = models.PositiveBigIntegerField(default=0, verbose_name="Taille")
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Statut")
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return self.key
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['cip_code', 'gers_code', 'file_type', 'period_start'], name='dexterfile_pharmacy_idx'),
+            models.Index(fields=['file_type', 'period_start'], name='dexterfile_type_period_idx'),
+            models.Index(fields=['status'], name='dexterfile_status_idx'),
+        ]
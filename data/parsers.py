@@ -0,0 +1,74 @@
+import gzip
+import io
+import zlib
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib json module
+    orjson = None
+
+# Decompressed bytes read at a time from a gzip body
+GZIP_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_DECOMPRESSED_SIZE = 100 * 1024 * 1024
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Request body too large.'
+    default_code = 'payload_too_large'
+
+
+def decompress_body(stream, max_size):
+    """
+    Decompresses a gzip request body by chunks into memory.
+
+    Raises:
+        ParseError: the body is not valid gzip (400).
+        PayloadTooLarge: the decompressed body exceeds max_size bytes (413).
+    """
+    body = io.BytesIO()
+    try:
+        with gzip.GzipFile(fileobj=stream) as gz:
+            while chunk := gz.read(GZIP_CHUNK_SIZE):
+                if body.tell() + len(chunk) > max_size:
+                    raise PayloadTooLarge(f"Decompressed body larger than {max_size} bytes.")
+                body.write(chunk)
+    except (OSError, EOFError, zlib.error) as e:
+        raise ParseError(f"Gzip parse error - {e}")
+    body.seek(0)
+    return body
+
+
+class GzipJSONParser(JSONParser):
+    """
+    JSONParser that also accepts gzip-compressed bodies (Content-Encoding: gzip).
+
+    The body is decompressed by chunks, so the Lambdas can forward the original .json.gz
+    objects without decoding them first. Invalid gzip is a 400 and bodies larger than
+    DATA_UPLOAD_MAX_DECOMPRESSED_SIZE once decompressed are rejected with a 413.
+
+    UTF-8 bodies are decoded with orjson when it is installed. Other charsets, the
+    non-strict mode and bodies orjson rejects go through the stdlib parser, so the
+    accepted payloads and the error messages stay those of DRF's JSONParser.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get('request')
+        if request is not None and request.META.get('HTTP_CONTENT_ENCODING', '').lower() == 'gzip':
+            max_size = getattr(settings, 'DATA_UPLOAD_MAX_DECOMPRESSED_SIZE', DEFAULT_MAX_DECOMPRESSED_SIZE)
+            stream = decompress_body(stream, max_size)
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+
@@ -0,0 +1,128 @@
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db.models import OuterRef, Subquery
+
+from data.fields import to_cents
+from data.models import InternalProduct, InventorySnapshot, Sales
+from data.services import common
+
+logger = logging.getLogger(__name__)
+
+
+def process_aggregated_sales(pharmacy, records):
+    """
+    Upserts sales already aggregated per (product, day) by the Lambdas.
+
+    The Lambdas reduce the raw ticket lines to one record per product and day, so this
+    skips the line preprocessing of the vendor services and goes straight to snapshot
+    resolution and upsert.
+
+    Expected record format:
+    [{"product_id": "123", "date": "2025-05-20", "qte": 5, "ttc": 21.50}]
+    "ttc" (optional) is the TTC amount of the lines that carry a price; the unit price is
+    then ttc / qte, like the weighted average computed by dexter.process_vente.
+    Records whose product_id is not a non-negative integer, or whose date cannot be parsed,
+    are counted in "invalid".
+
+    Args:
+        pharmacy: Pharmacy instance associated with the data.
+        records: List of aggregated sales records.
+
+    Returns:
+        dict: Counters of received, upserted and skipped records.
+    """
+    # Merge records sharing a (product, day) key, in case a window was split by the sender
+    aggregated = {}
+    invalid = 0
+    for record in records or []:
+        try:
+            # InternalProduct.internal_id is a PositiveBigIntegerField: other ids would fail the whole lookup
+            product_id = int(record['product_id'])
+            day = common.parse_date(record['date'], is_datetime=False)
+            if product_id < 0 or not day:
+                invalid += 1
+                continue
+
+            qte = int(record.get('qte', 0))
+            ttc = record.get('ttc')
+            ttc = Decimal(str(ttc)) if ttc is not None else None
+        except (ValueError, TypeError, KeyError, ArithmeticError) as e:
+            logger.warning(f"Invalid aggregated sales record {record}: {e}")
+            invalid += 1
+            continue
+
+        agg = aggregated.setdefault((str(product_id), day), {'qte': 0, 'ttc': None})
+        agg['qte'] += qte
+        if ttc is not None:
+            agg['ttc'] = (agg['ttc'] or Decimal('0')) + ttc
+
+    logger.info(f"Processing {len(aggregated)} aggregated sales records for pharmacy {pharmacy.id_nat}")
+    if not aggregated:
+        return {"received": len(records or []), "upserted": 0, "missing_snapshots": 0, "invalid": invalid}
+
+    product_ids = {product_id for product_id, _ in aggregated}
+    latest_snapshots = (
+        InventorySnapshot.objects
+        .filter(product=OuterRef('id'))
+        .order_by('-created_at')
+        .values('id')[:1])
+    internal_products = InternalProduct.objects.filter(pharmacy=pharmacy, internal_id__in=product_ids).annotate(
+        latest_snapshot_id=Subquery(latest_snapshots)
+    )
+    internal_products_map = {str(product.internal_id): product.latest_snapshot_id for product in internal_products}
+
+    # Records without a price must not erase a unit price stored by a priced source
+    priced_sales, quantity_sales = [], []
+    missing_snapshots = 0
+    for (product_id, day), agg in aggregated.items():
+        snapshot_id = internal_products_map.get(product_id)
+        if not snapshot_id:
+            missing_snapshots += 1
+            continue
+
+        if agg['qte'] > 10000:
+            logger.warning(f"Quantité élevée le {day} pour produit {product_id}: {agg['qte']}")
+
+        row = {
+            'product_id': snapshot_id,
+            'quantity': common.clamp(agg['qte'], -32768, 32767),
+            'date': day,
+        }
+        if agg['ttc'] is None:
+            quantity_sales.append(row)
+            continue
+
+        unit_price_ttc = None
+        if agg['qte'] > 0 and agg['ttc'] > 0:
+            unit_price_ttc = (agg['ttc'] / agg['qte']).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        priced_sales.append({**row, 'unit_price_ttc_cents': to_cents(unit_price_ttc) or None})
+
+    if missing_snapshots:
+        logger.warning(f"{missing_snapshots} aggregated sales skipped due to missing product snapshots")
+
+    try:
+        if priced_sales:
+            common.bulk_process(
+                model=Sales,
+                data=priced_sales,
+                unique_fields=['product_id', 'date'],
+                update_fields=['quantity', 'unit_price_ttc_cents']
+            )
+        if quantity_sales:
+            common.bulk_process(
+                model=Sales,
+                data=quantity_sales,
+                unique_fields=['product_id', 'date'],
+                update_fields=['quantity']
+            )
+    except Exception as e:
+        logger.error(f"Error processing aggregated sales: {e}")
+        raise
+
+    return {
+        "received": len(records),
+        "upserted": len(priced_sales) + len(quantity_sales),
+        "missing_snapshots": missing_snapshots,
+        "invalid": invalid,
+    }
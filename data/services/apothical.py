@@ -1,7 +1,6 @@
 import os
 import logging
 from datetime import date, datetime, timedelta
-from decimal import Decimal, ROUND_HALF_UP
 from typing import List, Dict, Any, Optional
 import requests
 from requests.exceptions import RequestException, Timeout
@@ -15,7 +14,7 @@ from data.models import (
     GlobalProduct, InternalProduct, InventorySnapshot, 
     Order, ProductOrder, Supplier, Sales
 )
-from data.services import common
+from data.services import columnar, common
 
 logger = logging.getLogger(__name__)
 
@@ -182,54 +181,18 @@ def process_products(pharmacy, finess: str):
         logger.warning(f"Aucun produit récupéré pour FINESS {finess}")
         return {"products": [], "snapshots": []}
     
-    # Pré-traitement des données
-    preprocessed_data = []
-    
-    for product in products_data:
-        try:
-            # Extraction des données importantes
-            product_id = product.get('productId')
-            if not product_id or int(product_id) < 0:
-                continue
-            
-            # Code officiel (CIP/EAN)
-            official_code = product.get('officialProductCode') or product.get('ean13')
-            
-            # TVA (déjà en décimal dans l'API)
-            vat_rate = product.get('vatRate', 0)
-            tva_converted = Decimal(str(vat_rate)) if vat_rate else Decimal('0')
-            
-            # Prix
-            selling_price = product.get('sellingPrice', 0)
-            price_ttc = min(
-                Decimal(str(selling_price)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP),
-                Decimal("99999999.99")
-            ) if selling_price else Decimal('0.00')
-            
-            # Prix moyen pondéré
-            avg_cost = product.get('averageTotalCost', 0)
-            weighted_price = min(
-                Decimal(str(avg_cost)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP),
-                Decimal("99999999.99")
-            ) if avg_cost else Decimal('0.00')
-            
-            # Stock
-            stock_qty = product.get('stockQuantity', 0)
-            stock_val = common.clamp(int(stock_qty) if stock_qty else 0, -32768, 32767)
-            
-            preprocessed_data.append({
-                "product_id": str(product_id),
-                "name": product.get('description', ''),
-                "code_13_ref": official_code,
-                "TVA": tva_converted,
-                "stock": stock_val,
-                "price_with_tax": price_ttc,
-                "weighted_average_price": weighted_price,
-            })
-            
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Produit Apothical ignoré ({product.get('productId')}): {e}")
-            continue
+    # Pré-traitement des données (TVA déjà en décimal dans l'API, code officiel CIP/EAN)
+    preprocessed_data = columnar.normalize_products(
+        products_data,
+        id_field='productId',
+        name_field='description',
+        code_field=lambda product: product.get('officialProductCode') or product.get('ean13'),
+        stock_field='stockQuantity',
+        price_field='sellingPrice',
+        wap_field='averageTotalCost',
+        tva_field='vatRate',
+        tva_percent=False,
+    )
     
     if not preprocessed_data:
         return {"products": [], "snapshots": []}
@@ -281,7 +244,7 @@ def process_products(pharmacy, finess: str):
             )
         )
         .filter(row_number=1)
-        .values("product_id", "stock", "price_with_tax", "weighted_average_price")
+        .values("product_id", "stock", "price_with_tax_cents", "weighted_average_price_cents")
     )
     latest_map = {s["product_id"]: s for s in latest}
     
@@ -295,14 +258,14 @@ def process_products(pharmacy, finess: str):
         if (
             not last
             or last["stock"] != obj["stock"]
-            or last["price_with_tax"] != obj["price_with_tax"]
-            or last["weighted_average_price"] != obj["weighted_average_price"]
+            or last["price_with_tax_cents"] != obj["price_with_tax_cents"]
+            or last["weighted_average_price_cents"] != obj["weighted_average_price_cents"]
         ):
             snapshots.append({
                 "product_id": p.id,
                 "stock": obj["stock"],
-                "price_with_tax": obj["price_with_tax"],
-                "weighted_average_price": obj["weighted_average_price"],
+                "price_with_tax_cents": obj["price_with_tax_cents"],
+                "weighted_average_price_cents": obj["weighted_average_price_cents"],
                 "date": date.today(),
             })
     
@@ -311,7 +274,7 @@ def process_products(pharmacy, finess: str):
             model=InventorySnapshot,
             data=snapshots,
             unique_fields=["product_id", "date"],
-            update_fields=["stock", "price_with_tax", "weighted_average_price"],
+            update_fields=["stock", "price_with_tax_cents", "weighted_average_price_cents"],
         )
     
     return {"products": products, "snapshots": snapshots}
@@ -540,43 +503,20 @@ def process_sales(pharmacy, finess: str):
         logger.info(f"Aucune vente récente pour FINESS {finess}")
         return
     
-    # Pré-traitement des données
-    preprocessed_data = []
+    # Une ligne (produit, date, quantité) par ligne de vente non nulle
+    lines = [
+        (line.get('productId'), sale.get('date'), line.get('quantitySold'))
+        for sale in sales_data
+        for line in sale.get('saleLines', [])
+        if line.get('quantitySold')
+    ]
+    aggregated = columnar.aggregate_sales(lines)
     
-    for sale in sales_data:
-        try:
-            sale_date = sale.get('date')
-            sale_lines = sale.get('saleLines', [])
-            
-            for line in sale_lines:
-                try:
-                    product_id = line.get('productId')
-                    if not product_id or int(product_id) < 0:
-                        continue
-                    
-                    quantity = line.get('quantitySold', 0)
-                    if not quantity:
-                        continue
-                    
-                    preprocessed_data.append({
-                        "product_id": str(product_id),
-                        "date": sale_date,
-                        "qte": int(quantity),
-                    })
-                    
-                except (ValueError, TypeError) as e:
-                    logger.warning(f"Ligne vente ignorée: {e}")
-                    continue
-                    
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Vente Apothical ignorée: {e}")
-            continue
-    
-    if not preprocessed_data:
+    if aggregated.empty:
         return
     
     # Récupération des snapshots associés
-    product_ids = {obj["product_id"] for obj in preprocessed_data}
+    product_ids = set(aggregated["product_id"])
     
     latest_snapshot_sub = (
         InventorySnapshot.objects.filter(product=OuterRef("id"))
@@ -590,30 +530,8 @@ def process_sales(pharmacy, finess: str):
     )
     snapshot_map = {str(p.internal_id): p.latest_snapshot_id for p in products}
     
-    # Agrégation des quantités par produit et date
-    aggregated_sales = {}
-    for obj in preprocessed_data:
-        product_id = obj["product_id"]
-        sale_date = common.parse_date(obj["date"], False)
-        key = (product_id, sale_date)
-        
-        if key not in aggregated_sales:
-            aggregated_sales[key] = obj["qte"]
-        else:
-            aggregated_sales[key] += obj["qte"]
-    
-    # Construction des données de vente
-    sales_rows = []
-    for (product_id, sale_date), total_qty in aggregated_sales.items():
-        snapshot_id = snapshot_map.get(product_id)
-        if not snapshot_id:
-            continue
-        
-        sales_rows.append({
-            "product_id": snapshot_id,
-            "quantity": common.clamp(total_qty, -32768, 32767),
-            "date": sale_date,
-        })
+    # Construction des données de vente agrégées par produit et date
+    sales_rows, _ = columnar.sales_rows(aggregated, snapshot_map)
     
     if not sales_rows:
         return
@@ -0,0 +1,270 @@
+"""
+Columnar preprocessing of vendor payloads with pandas.
+
+Full-catalogue product payloads hold tens of thousands of rows. Normalising them column by
+column (numeric parsing, cent rounding, clamping, TVA rescaling) replaces the per-row
+Decimal arithmetic of the process_* functions. Rows that cannot be parsed are flagged in an
+error mask and logged in a single message instead of one warning per row.
+
+Sales ticket lines are aggregated the same way: one group-by over (product, day) with
+quantities and TTC amounts in integer cents, instead of a Python dict keyed per line.
+"""
+from decimal import Decimal
+import logging
+
+import numpy as np
+import pandas as pd
+
+from data.fields import INTEGER_MAX
+from data.services import common
+
+logger = logging.getLogger(__name__)
+
+SMALLINT_MIN, SMALLINT_MAX = -32768, 32767
+# Bound of the integer cents price columns
+MAX_PRICE_CENTS = INTEGER_MAX
+# Daily quantity above which a sale is logged as suspicious
+HIGH_QUANTITY = 10000
+# Absorbs binary float error, so that 2.675 rounds half up to 2.68 like Decimal('2.675')
+CENT_EPSILON = 1e-6
+
+
+def _columns(records, *fields):
+    """
+    Raw columns of the records, one per field: a key of the records, a callable receiving
+    the record, or None (column of None). Columns keep the original Python values (object
+    dtype), so that integer ids are never converted to float.
+    """
+    keys = list(dict.fromkeys(field for field in fields if isinstance(field, str)))
+    frame = pd.DataFrame(records, columns=keys, dtype=object)
+    columns = []
+    for field in fields:
+        if field is None:
+            columns.append(pd.Series([None] * len(records), dtype=object))
+        elif callable(field):
+            columns.append(pd.Series([field(record) for record in records], dtype=object))
+        else:
+            columns.append(frame[field])
+    return columns
+
+
+def _is_missing(raw):
+    return raw.isna() | raw.eq('')
+
+
+def _numeric(raw):
+    """
+    Parses a raw column; missing values (None, '') become 0.
+
+    Returns:
+        tuple (float64 ndarray, bool ndarray of unparseable values)
+    """
+    missing = _is_missing(raw).to_numpy()
+    values = pd.to_numeric(raw.mask(missing, 0), errors='coerce').to_numpy(dtype='float64')
+    invalid = ~np.isfinite(values)
+    return np.where(invalid, 0, values), invalid
+
+
+def to_cents(values):
+    """Rounds amounts half up (away from zero) to integer cents, within the price column bounds."""
+    cents = np.sign(values) * np.floor(np.abs(values) * 100 + 0.5 + CENT_EPSILON)
+    return np.clip(cents, -MAX_PRICE_CENTS, MAX_PRICE_CENTS).astype('int64')
+
+
+def cents_to_decimals(cents):
+    """Decimal amounts (2 decimal places) from integer cents; each distinct value is built once."""
+    cents = cents.tolist()
+    decimals = {value: Decimal(value).scaleb(-2) for value in set(cents)}
+    return [decimals[value] for value in cents]
+
+
+def normalize_products(records, id_field, name_field, code_field, stock_field, price_field, wap_field,
+                       tva_field=None, tva_percent=True, skip_zero_id=True):
+    """
+    Normalises a product payload into the preprocessed rows expected by the process_* functions.
+
+    Args:
+        records: List of product dicts from the vendor.
+        id_field, name_field, code_field, stock_field, price_field, wap_field: Keys of the
+            product id, name, EAN13, stock, TTC price and weighted average price. A callable
+            receiving the record can be given instead of a key.
+        tva_field: Key of the TVA rate, or None when the payload has none (TVA stays None).
+        tva_percent (bool): Rates above 1 are percentages and are divided by 100.
+        skip_zero_id (bool): Also skip products whose id is 0.
+
+    Returns:
+        list: dicts with product_id, name, code_13_ref, TVA, stock, price_with_tax_cents and
+        weighted_average_price_cents (integers, as stored in InventorySnapshot), plus the
+        same prices as Decimals in price_with_tax and weighted_average_price. product_id is str() of
+        the vendor value, like the keys built by the order and sale processors. Products
+        without id or with a negative id are skipped; rows with an unparseable (or not
+        integral) id, stock or price are logged and skipped.
+    """
+    if not records:
+        return []
+
+    raw_ids, raw_names, raw_codes, raw_stock, raw_price, raw_wap, raw_tva = _columns(
+        records, id_field, name_field, code_field, stock_field, price_field, wap_field, tva_field
+    )
+    ids = pd.to_numeric(raw_ids, errors='coerce').to_numpy(dtype='float64')
+    absent = _is_missing(raw_ids).to_numpy()
+    invalid_ids = ~absent & (np.isnan(ids) | (ids != np.trunc(ids)))
+    skipped = absent | invalid_ids | (ids < 0) | ((ids == 0) if skip_zero_id else False)
+
+    stock, invalid_stock = _numeric(raw_stock)
+    price, invalid_price = _numeric(raw_price)
+    wap, invalid_wap = _numeric(raw_wap)
+    tva, invalid_tva = _numeric(raw_tva)
+
+    errors = invalid_ids | ((invalid_stock | invalid_price | invalid_wap | invalid_tva) & ~skipped)
+    if errors.any():
+        sample = ', '.join(str(value) for value in raw_ids[errors].head(10))
+        logger.warning(f"{int(errors.sum())} products ignored (invalid id, stock, price or TVA): {sample}")
+
+    keep = ~(skipped | errors)
+    if not keep.any():
+        return []
+
+    # Ids are only validated numerically: the key is the original value ('00123' stays '00123')
+    product_ids = raw_ids[keep].astype(str).tolist()
+    names = raw_names[keep].fillna('').astype(str).tolist()
+    codes = raw_codes[keep].astype(object)
+    codes = codes.where(~_is_missing(codes), None).tolist()
+    stocks = np.clip(np.trunc(stock[keep]), SMALLINT_MIN, SMALLINT_MAX).astype('int64').tolist()
+    price_cents = to_cents(price[keep])
+    wap_cents = to_cents(wap[keep])
+    prices = cents_to_decimals(price_cents)
+    waps = cents_to_decimals(wap_cents)
+    price_cents = price_cents.tolist()
+    wap_cents = wap_cents.tolist()
+
+    if tva_field is None:
+        rates = [None] * len(product_ids)
+    else:
+        tva = tva[keep]
+        if tva_percent:
+            tva = np.where(tva > 1, tva / 100, tva)
+        rates = [Decimal(str(value)) for value in np.round(tva, 4).tolist()]
+
+    return [
+        {
+            'product_id': product_id,
+            'name': name,
+            'code_13_ref': code,
+            'TVA': rate,
+            'stock': stock_value,
+            'price_with_tax': price_value,
+            'weighted_average_price': wap_value,
+            'price_with_tax_cents': price_cents_value,
+            'weighted_average_price_cents': wap_cents_value,
+        }
+        for product_id, name, code, rate, stock_value, price_value, wap_value, price_cents_value, wap_cents_value
+        in zip(product_ids, names, codes, rates, stocks, prices, waps, price_cents, wap_cents)
+    ]
+
+
+def parse_days(values):
+    """
+    Days of raw sale dates, like common.parse_date(value, False) for each value.
+
+    ISO dates and datetimes are sliced and parsed in one vectorised call; other formats go
+    through common.parse_date once per distinct value.
+
+    Returns:
+        Series of datetime64 (NaT when the date is missing or invalid)
+    """
+    raw = pd.Series(values, dtype=object)
+    days = pd.to_datetime(raw.str.slice(0, 10), format='%Y-%m-%d', errors='coerce')
+    fallback = days.isna() & ~_is_missing(raw)
+    if fallback.any():
+        parsed = {value: common.parse_date(value, False) for value in raw[fallback].unique()}
+        days[fallback] = pd.to_datetime(raw[fallback].map(parsed), errors='coerce')
+    return days
+
+
+def aggregate_sales(lines, with_amounts=False):
+    """
+    Aggregates sale lines per (product, day).
+
+    Args:
+        lines: Sequence of (product_id, date, quantity) tuples, or (product_id, date, quantity,
+            ttc_amount) with with_amounts. Values are raw vendor values.
+        with_amounts (bool): Compute the weighted average TTC unit price of each group: the sum of
+            the positive amounts of lines with a positive quantity, over the group quantity.
+
+    Returns:
+        DataFrame with product_id (str() of the vendor value), date (datetime.date), quantity and, with_amounts,
+        unit_price_ttc_cents (int rounded half up, None without priced line), in order of
+        first appearance. Lines without product id, with a negative id or without a valid date
+        or quantity are dropped (invalid ones are logged).
+    """
+    columns = ['product_id', 'date', 'quantity'] + (['amount'] if with_amounts else [])
+    frame = pd.DataFrame(list(lines), columns=columns, dtype=object)
+
+    ids = pd.to_numeric(frame['product_id'], errors='coerce').to_numpy(dtype='float64')
+    absent = _is_missing(frame['product_id']).to_numpy()
+    quantities, invalid_quantities = _numeric(frame['quantity'])
+    days = parse_days(frame['date'])
+    invalid = (~absent & (np.isnan(ids) | (ids != np.trunc(ids)))) | invalid_quantities | days.isna().to_numpy()
+    keep = ~absent & ~invalid & ~(ids <= 0)
+    if invalid.any():
+        logger.warning(f"{int(invalid.sum())} sale lines ignored (invalid product id, date or quantity)")
+
+    grouped = pd.DataFrame({
+        'product_id': frame['product_id'][keep].astype(str).to_numpy(),
+        'day': days.to_numpy()[keep],
+        'quantity': np.trunc(quantities[keep]).astype('int64'),
+    })
+    aggregations = {'quantity': ('quantity', 'sum')}
+    if with_amounts:
+        amounts, _ = _numeric(frame['amount'])
+        amounts = amounts[keep]
+        priced = (amounts > 0) & (grouped['quantity'].to_numpy() > 0)
+        grouped['cents'] = np.where(priced, to_cents(amounts), 0)
+        grouped['priced'] = priced
+        aggregations.update(cents=('cents', 'sum'), priced=('priced', 'any'))
+
+    result = grouped.groupby(['product_id', 'day'], sort=False).agg(**aggregations).reset_index()
+    result['date'] = result['day'].dt.date
+    if with_amounts:
+        quantity = result['quantity'].to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            unit_cents = np.floor(result['cents'].to_numpy() / quantity + 0.5 + CENT_EPSILON)
+        has_price = result['priced'].to_numpy() & (quantity > 0) & (unit_cents > 0)
+        unit_cents = np.clip(np.where(has_price, unit_cents, 0), 0, MAX_PRICE_CENTS).astype('int64')
+        result['unit_price_ttc_cents'] = pd.Series(unit_cents.tolist(), dtype=object)
+        result.loc[~has_price, 'unit_price_ttc_cents'] = None
+        return result[['product_id', 'date', 'quantity', 'unit_price_ttc_cents']]
+    return result[['product_id', 'date', 'quantity']]
+
+
+def sales_rows(aggregated, snapshot_map):
+    """
+    Upsert-ready Sales rows from aggregate_sales() output.
+
+    Args:
+        aggregated: DataFrame returned by aggregate_sales.
+        snapshot_map: {internal product id (str): latest InventorySnapshot id}.
+
+    Returns:
+        tuple (list of dicts with product_id (snapshot id), quantity, date and unit_price_ttc_cents
+        when aggregated, number of groups skipped for lack of snapshot)
+    """
+    snapshots = aggregated['product_id'].map(snapshot_map)
+    found = snapshots.notna().to_numpy()
+    rows = aggregated[found]
+
+    high = rows['quantity'].to_numpy() > HIGH_QUANTITY
+    if high.any():
+        sample = ', '.join(f"{product_id} le {day}: {quantity}" for product_id, day, quantity
+                           in rows.loc[high, ['product_id', 'date', 'quantity']].head(5).itertuples(index=False))
+        logger.warning(f"Quantités élevées pour {int(high.sum())} ventes ({sample})")
+
+    columns = {
+        'product_id': snapshots[found].tolist(),
+        'quantity': np.clip(rows['quantity'].to_numpy(), SMALLINT_MIN, SMALLINT_MAX).tolist(),
+        'date': rows['date'].tolist(),
+    }
+    if 'unit_price_ttc_cents' in rows:
+        columns['unit_price_ttc_cents'] = rows['unit_price_ttc_cents'].tolist()
+    return [dict(zip(columns, values)) for values in zip(*columns.values())], int((~found).sum())
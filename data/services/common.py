@@ -1,13 +1,18 @@
+from datetime import date, datetime
 from decimal import Decimal
+from functools import lru_cache
 from uuid import UUID
+import io
 import logging
 
 import dateutil.parser
-from django.db import transaction
+from django.db import connection, transaction
 from django.utils import timezone
 from tqdm import tqdm
 import pytz
 
+from data.models import Pharmacy
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,10 +25,25 @@ def chunked_iterable(iterable, chunk_size):
         yield iterable[i:i + chunk_size]
 
 
+@lru_cache(maxsize=4096)
+def _parse_day(value):
+    """Date of a date string (ISO dates through date.fromisoformat, other formats through dateutil)."""
+    try:
+        if 'W' in value:
+            raise ValueError
+        return date.fromisoformat(value)
+    except ValueError:
+        return dateutil.parser.parse(value).date()
+
+
 def parse_date(date_str, is_datetime=True):
     """
     Converts a date string into a timezone-aware datetime object or a date object.
 
+    ISO 8601 strings take a datetime.fromisoformat fast path, other formats fall back to
+    dateutil; results are the same as dateutil's. Date-only strings and non-ISO dates are
+    memoised, so the lines of a day are only parsed once.
+
     Args:
         date_str (str): The date string to parse.
         is_datetime (bool): Whether to parse as datetime (True) or date (False).
@@ -35,22 +55,84 @@ def parse_date(date_str, is_datetime=True):
         return None
 
     try:
-        parsed_date = dateutil.parser.parse(date_str)
+        # ISO week dates are accepted by fromisoformat but not by dateutil: they keep going through dateutil
+        iso = 'W' not in date_str
 
-        if is_datetime:
-            if timezone.is_naive(parsed_date):
-                parsed_date = timezone.make_aware(parsed_date, pytz.UTC)
-            else:
-                parsed_date = parsed_date.astimezone(pytz.UTC)
-            return parsed_date
+        if not is_datetime:
+            # Like dateutil: the date as written, without timezone conversion
+            if iso and len(date_str) > 10:
+                try:
+                    return datetime.fromisoformat(date_str).date()
+                except ValueError:
+                    pass
+            return _parse_day(date_str)
 
-        else:
-            return parsed_date.date()
-    except (ValueError, TypeError) as e:
+        try:
+            if not iso:
+                raise ValueError
+            parsed_date = datetime.fromisoformat(date_str)
+        except ValueError:
+            parsed_date = dateutil.parser.parse(date_str)
+
+        if timezone.is_naive(parsed_date):
+            return parsed_date.replace(tzinfo=pytz.UTC)
+        return parsed_date.astimezone(pytz.UTC)
+    except (ValueError, TypeError, OverflowError) as e:
         logger.warning(f"Error parsing date '{date_str}': {e}")
         return None
 
 
+def _same_id_nat(first, second):
+    """Whether two pharmacy identifiers are the same once formatting is ignored (062044623 == 62044623)."""
+    return str(first).strip().lstrip('0') == str(second).strip().lstrip('0')
+
+
+def iter_pharmacy_blocks(pharmacy, data):
+    """
+    Iterates over the per-pharmacy wrappers of a WinPharma new API response.
+
+    A request with several Idnats returns one wrapper per pharmacy:
+    [{"cip_pharma": "062044623", "produits": [...]}, {"cip_pharma": "062000111", "produits": [...]}]
+
+    With a pharmacy from the request header, every wrapper is attached to it, as before:
+    wrappers whose cip_pharma is another pharmacy are skipped, formatting differences
+    (leading zeros, number or string) are ignored. Without a header, each wrapper is routed
+    to the Pharmacy whose id_nat is its cip_pharma (created if needed).
+
+    Args:
+        pharmacy: Pharmacy from the request header, or None for multi-pharmacy payloads.
+        data: Response from new API - list of pharmacy data wrappers.
+
+    Yields:
+        tuple (Pharmacy, wrapper dict)
+    """
+    if not data or not isinstance(data, list):
+        logger.warning("No data or invalid data structure received")
+        return
+
+    pharmacies = {}
+    for pharmacy_data in data:
+        if not isinstance(pharmacy_data, dict):
+            logger.warning(f"Skipping invalid pharmacy wrapper: {type(pharmacy_data).__name__}")
+            continue
+
+        id_nat = str(pharmacy_data.get('cip_pharma') or '').strip()
+        if pharmacy:
+            if id_nat and not _same_id_nat(id_nat, pharmacy.id_nat):
+                logger.warning(f"Skipping wrapper of pharmacy {id_nat} in a request for pharmacy {pharmacy.id_nat}")
+                continue
+            yield pharmacy, pharmacy_data
+            continue
+
+        if not id_nat:
+            logger.warning("Skipping pharmacy wrapper without cip_pharma")
+            continue
+        if id_nat not in pharmacies:
+            pharmacies[id_nat], _ = Pharmacy.objects.get_or_create(id_nat=id_nat)
+
+        yield pharmacies[id_nat], pharmacy_data
+
+
 def bulk_process(model, data, unique_fields, update_fields, chunk_size=1000):
     """
     Efficiently creates or updates a batch of objects in the database.
@@ -117,4 +199,121 @@ def bulk_process(model, data, unique_fields, update_fields, chunk_size=1000):
     # because conflicting objects are not returned by bulk_create
     print(f"Created: {len(objects_to_create)}, Updated: {len(objects_to_update)}")
 
-    return all_objects
\ No newline at end of file
+    return all_objects
+
+
+def _copy_value(value):
+    """Formats a value for COPY ... FROM STDIN (text format)."""
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def bulk_upsert(model, data, unique_fields, update_fields):
+    """
+    Bulk-load variant of bulk_process, for large historical imports.
+
+    Rows are COPYed into a temporary staging table (not WAL-logged, without indexes or
+    constraints), then merged into the model's table with a single
+    INSERT ... ON CONFLICT (unique_fields) DO UPDATE. Existing rows are neither fetched
+    nor compared in Python.
+
+    Args:
+        model: Django model to operate on (e.g., MyModel).
+        data: List of dictionaries representing the objects to process.
+        unique_fields: Fields of a unique constraint of the model.
+        update_fields: Fields to update for existing objects.
+
+    Returns:
+        int: Number of rows inserted or updated.
+    """
+    if not data:
+        return 0
+
+    meta = model._meta
+    quote = connection.ops.quote_name
+    # Auto-increment keys are left to the table's sequence; defaults and auto_now are filled in Python
+    fields = [field for field in meta.concrete_fields if field is not meta.auto_field]
+    columns = [field.column for field in fields]
+    unique_columns = [meta.get_field(name).column for name in unique_fields]
+    update_columns = [meta.get_field(name).column for name in update_fields]
+
+    buffer = io.StringIO()
+    for item in data:
+        obj = model(**item)
+        buffer.write('\t'.join(
+            _copy_value(field.get_db_prep_save(field.pre_save(obj, add=True), connection)) for field in fields
+        ))
+        buffer.write('\n')
+
+    table = quote(meta.db_table)
+    staging = quote(f"staging_{meta.db_table}")
+    column_list = ', '.join(quote(column) for column in columns)
+    unique_list = ', '.join(quote(column) for column in unique_columns)
+    conflict_action = 'DO UPDATE SET ' + ', '.join(
+        f"{quote(column)} = EXCLUDED.{quote(column)}" for column in update_columns
+    ) if update_columns else 'DO NOTHING'
+    copy_sql = f"COPY {staging} ({column_list}) FROM STDIN"
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Left over when called inside an outer transaction that has not committed yet
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS SELECT {column_list} FROM {table} WITH NO DATA"
+        )
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy'):
+            # psycopg 3
+            with raw_cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            buffer.seek(0)
+            raw_cursor.copy_expert(copy_sql, buffer)
+
+        # A row may only be merged once per statement: duplicates within the batch keep one row
+        cursor.execute(
+            f"INSERT INTO {table} ({column_list}) "
+            f"SELECT DISTINCT ON ({unique_list}) {column_list} FROM {staging} ORDER BY {unique_list} "
+            f"ON CONFLICT ({unique_list}) {conflict_action}"
+        )
+        merged = cursor.rowcount
+
+    print(f"Bulk-loaded {model.__name__}: {len(data)} rows, {merged} inserted or updated")
+    return merged
+
+
+def drop_secondary_indexes(model):
+    """
+    Drops the non-unique indexes of the model's table, to rebuild them once after a bulk load.
+
+    Unique and primary key indexes are kept: bulk_upsert relies on them for ON CONFLICT.
+
+    Returns:
+        list: CREATE INDEX statements of the dropped indexes (see restore_indexes).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_indexdef(c.oid) FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE i.indrelid = %s::regclass AND NOT i.indisunique AND NOT i.indisprimary",
+            [model._meta.db_table]
+        )
+        indexes = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX IF EXISTS {connection.ops.quote_name(name)}")
+    logger.info(f"Dropped {len(indexes)} indexes on {model._meta.db_table}")
+    return [definition for _, definition in indexes]
+
+
+def restore_indexes(definitions):
+    """Recreates indexes dropped by drop_secondary_indexes (already existing ones are skipped)."""
+    with connection.cursor() as cursor:
+        for definition in definitions:
+            cursor.execute(definition.replace('CREATE INDEX ', 'CREATE INDEX IF NOT EXISTS ', 1))
+    logger.info(f"Rebuilt {len(definitions)} indexes")
+
+
+def analyze(*models):
+    """Refreshes the planner statistics of the models' tables after a bulk load."""
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
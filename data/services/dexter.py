@@ -1,6 +1,4 @@
-from decimal import Decimal, ROUND_HALF_UP
 import logging
-import traceback
 from datetime import date
 
 from django.db import transaction
@@ -8,12 +6,21 @@ from django.db.models import OuterRef, Subquery, F, Window
 from django.db.models.functions import RowNumber
 
 
-from data.models import GlobalProduct, InternalProduct, ProductOrder, Supplier, Order, Sales, InventorySnapshot
-from data.services import common
+from data.fields import to_cents
+from data.models import GlobalProduct, InternalProduct, ProductOrder, Supplier, Order, Sales, InventorySnapshot, Pharmacy
+from data.services import columnar, common, schemas
 
 logger = logging.getLogger(__name__)
 
 
+def _referent_code(obj):
+    """EAN13 flagged as referent among the product codes."""
+    for code in obj.get('code_produit') or []:
+        if code.get('referent'):
+            return code.get('code')
+    return None
+
+
 def process_stock(pharmacy, data, date_str):
     """
     Creates or updates products and their inventory snapshots using common.bulk_process.
@@ -26,41 +33,11 @@ def process_stock(pharmacy, data, date_str):
     Returns:
         A dictionary containing lists of created products and snapshots.
     """
-    preprocessed_data = []
-    for obj in data:
-        try:
-            if int(obj.get('produit_id')) < 0:
-                continue
-            code_13_ref = None
-            for code in obj.get('code_produit') or []:
-                if code.get('referent'):
-                    code_13_ref = code.get('code')
-                    break
-
-            tva_value = float(obj['taux_Tva']) if obj.get('taux_Tva') is not None else 0.0
-            if tva_value > 1:
-                tva_converted = Decimal(tva_value / 100)
-            else:
-                tva_converted = Decimal(tva_value)
-
-            preprocessed_data.append({
-                'product_id': str(obj['produit_id']),
-                'name': str(obj['libelle_produit']) if obj.get('libelle_produit') else "",
-                'code_13_ref': code_13_ref or "",
-                'TVA': tva_converted,
-                'stock': common.clamp(int(obj['qte_stock']) if obj.get('qte_stock') else 0, -32768, 32767),
-                'weighted_average_price': Decimal(str(obj['px_achat_PMP_HT'])).quantize(Decimal('0.01'),
-                                                                                        rounding=ROUND_HALF_UP) if obj.get(
-                    'px_achat_PMP_HT') else Decimal('0.00'),
-                'price_with_tax': Decimal(str(obj['px_vte_TTC'])).quantize(Decimal('0.01'),
-                                                                           rounding=ROUND_HALF_UP) if obj.get(
-                    'px_vte_TTC') else Decimal('0.00')
-            })
-
-        except (ValueError, TypeError) as e:
-            logger.warning(
-                f"Error preprocessing data for product {obj.get('produit_id', 'unknown')}: {traceback.format_exc()}")
-            continue
+    preprocessed_data = columnar.normalize_products(
+        data, id_field='produit_id', name_field='libelle_produit', code_field=_referent_code,
+        stock_field='qte_stock', price_field='px_vte_TTC', wap_field='px_achat_PMP_HT', tva_field='taux_Tva',
+        skip_zero_id=False
+    )
 
     # Collect unique GlobalProduct references
     code_13_refs = {obj['code_13_ref'] for obj in preprocessed_data if obj['code_13_ref']}
@@ -121,7 +98,7 @@ def process_stock(pharmacy, data, date_str):
             partition_by=F('product_id'),
             order_by=F('date').desc()
         )
-    ).filter(row_number=1).values('product_id', 'stock', 'price_with_tax', 'weighted_average_price')
+    ).filter(row_number=1).values('product_id', 'stock', 'price_with_tax_cents', 'weighted_average_price_cents')
 
     # Create a mapping of the latest snapshots by internal_id
     latest_snapshots_map = {snapshot['product_id']: snapshot for snapshot in latest_snapshots}
@@ -138,16 +115,16 @@ def process_stock(pharmacy, data, date_str):
         needs_update = (
                 not last_snapshot or
                 last_snapshot['stock'] != obj['stock'] or
-                last_snapshot['price_with_tax'] != obj['price_with_tax'] or
-                last_snapshot['weighted_average_price'] != obj['weighted_average_price']
+                last_snapshot['price_with_tax_cents'] != obj['price_with_tax_cents'] or
+                last_snapshot['weighted_average_price_cents'] != obj['weighted_average_price_cents']
         )
 
         if needs_update:
             inventory_snapshots_data.append({
                 'product_id': product.id,
                 'stock': obj['stock'],
-                'price_with_tax': obj['price_with_tax'],
-                'weighted_average_price': obj['weighted_average_price'],
+                'price_with_tax_cents': obj['price_with_tax_cents'],
+                'weighted_average_price_cents': obj['weighted_average_price_cents'],
                 'date': snapshot_date
             })
 
@@ -157,10 +134,34 @@ def process_stock(pharmacy, data, date_str):
             model=InventorySnapshot,
             data=inventory_snapshots_data,
             unique_fields=['product_id', 'date'],
-            update_fields=['stock', 'price_with_tax', 'weighted_average_price']
+            update_fields=['stock', 'price_with_tax_cents', 'weighted_average_price_cents']
         )
 
 
+def process_stock_delta(pharmacy, data, date_str, delta=None):
+    """
+    Processes the products of a Stock file that changed since the previous file of the pharmacy.
+
+    The Dexter Lambda diffs each Stock file against the last one it sent and only ships new or
+    changed products. Unchanged products keep their latest snapshot, which is exactly what
+    process_stock would do with the full file.
+
+    Args:
+        pharmacy: Pharmacy instance associated with the data.
+        data: List of changed Stock products (same format as process_stock).
+        date_str (str): Date string representing the snapshot date.
+        delta (dict): Optional counters sent by the Lambda ('total', 'changed', 'base_key').
+    """
+    delta = delta or {}
+    logger.info(
+        f"Stock delta for pharmacy {pharmacy.id_nat}: {len(data)}/{delta.get('total', '?')} products "
+        f"changed since {delta.get('base_key') or 'full file'}"
+    )
+    if not data:
+        return
+    process_stock(pharmacy, data, date_str)
+
+
 def process_achat(pharmacy, data):
     """
     Creates or updates orders and their associated product lines using common.bulk_process.
@@ -172,69 +173,20 @@ def process_achat(pharmacy, data):
     Returns:
         dict: A dictionary containing lists of created suppliers, products, orders, and product-order associations.
     """
-    preprocessed_data = []
-    for obj in data:
-        try:
-            # Clean and validate order data
-            order_id = str(obj['commande_id'])
-            supplier_id = str(obj['id_fournisseur'])
-            supplier_name = str(obj.get('libelle_fournisseur', obj.get('id_fournisseur', '')))
-            step = str(obj.get('etat_commande', ''))
-            sent_date = common.parse_date(obj.get('date_transmission'))
-            delivery_date = common.parse_date(obj.get('date_reception'), is_datetime=False)
-
-            products = []
-            for line in obj.get('lignes', []):
-                try:
-                    if int(line.get('produit_id')) < 0:
-                        continue
-
-                    product_id = str(line['produit_id'])
-                    qte_cde = int(line.get('qte_cde', 0))
-                    total_recu = int(line.get('total_recu', 0))
-                    total_ug_liv = int(line.get('total_ug_liv', 0))
-                    px_achat_net_ht = line.get('px_achat_net_ht')
-
-                    products.append({
-                        'product_id': product_id,
-                        'qte_cde': qte_cde,
-                        'total_recu': total_recu,
-                        'total_ug_liv': total_ug_liv,
-                        'px_achat_net_ht': px_achat_net_ht
-                    })
-                except (ValueError, TypeError, KeyError) as e:
-                    logger.warning(f"Error preprocessing product line in order {order_id}: {e}")
-                    continue
-
-            preprocessed_data.append({
-                'order_id': order_id,
-                'supplier_id': supplier_id,
-                'supplier_name': supplier_name,
-                'step': step,
-                'sent_date': sent_date,
-                'delivery_date': delivery_date,
-                'products': products
-            })
-
-        except (ValueError, TypeError, KeyError) as e:
-            logger.warning(f"Error preprocessing order {obj.get('commande_id', 'unknown')}: {e}")
-            continue
+    preprocessed_data = schemas.decode_dexter_orders(data)
 
-    # Prepare a set of supplier IDs
-    supplier_ids = {obj['supplier_id'] for obj in preprocessed_data}
-
-    # Prepare data for bulk processing of suppliers
-    supplier_data = []
-    for supplier_id in supplier_ids:
-        # Find the first occurrence with supplier name
-        supplier_name = next(
-            (obj['supplier_name'] for obj in preprocessed_data if obj['supplier_id'] == supplier_id), ''
-        )
-        supplier_data.append({
+    # Prepare data for bulk processing of suppliers, named after their first order
+    supplier_names = {}
+    for obj in preprocessed_data:
+        supplier_names.setdefault(obj.supplier_id, obj.supplier_name)
+    supplier_data = [
+        {
             'code_supplier': supplier_id,
             'pharmacy_id': pharmacy.id,
             'name': supplier_name
-        })
+        }
+        for supplier_id, supplier_name in supplier_names.items()
+    ]
 
     # Create or update suppliers
     try:
@@ -252,10 +204,7 @@ def process_achat(pharmacy, data):
     suppliers_map = {supplier.code_supplier: supplier for supplier in suppliers}
 
     # Prepare a set of product IDs
-    product_ids = set()
-    for obj in preprocessed_data:
-        for line in obj['products']:
-            product_ids.add(line['product_id'])
+    product_ids = {line.product_id for obj in preprocessed_data for line in obj.lines}
 
     # Query existing InternalProduct instances to get their names
     existing_products = InternalProduct.objects.filter(
@@ -304,12 +253,12 @@ def process_achat(pharmacy, data):
     for obj in preprocessed_data:
         try:
             order_data.append({
-                'internal_id': obj['order_id'],
+                'internal_id': obj.order_id,
                 'pharmacy_id': pharmacy.id,
-                'supplier_id': suppliers_map[obj['supplier_id']].id,
-                'step': obj['step'],
-                'sent_date': obj['sent_date'],
-                'delivery_date': obj['delivery_date'],
+                'supplier_id': suppliers_map[obj.supplier_id].id,
+                'step': obj.step,
+                'sent_date': obj.sent_date,
+                'delivery_date': obj.delivery_date,
             })
         except KeyError as e:
             logger.warning(f"Missing key in order {obj}: {e}")
@@ -338,29 +287,19 @@ def process_achat(pharmacy, data):
     existing_associations = set()  # Set to keep track of existing associations
 
     for obj in preprocessed_data:
-        internal_id = obj['order_id']
+        internal_id = obj.order_id
         order = order_map.get(internal_id)
         if not order:
             logger.warning(f"Order with internal_id {internal_id} not found.")
             continue
 
-        for line in obj['products']:
-            product_id = line['product_id']
+        for line in obj.lines:
+            product_id = line.product_id
             product = internal_products_map.get(product_id)
             if not product:
                 logger.warning(f"InternalProduct with internal_id {product_id} not found.")
                 continue
 
-            # Ensure quantities are integers
-            qte = common.clamp(int(line.get('qte_cde', 0)), -32768, 32767)  # SmallIntegerField
-            qte_a = common.clamp(int(line.get('qte_cde', 0)), -32768, 32767)  # SmallIntegerField
-            qte_ug = common.clamp(int(line.get('total_ug_liv', 0)), -32768, 32767)  # SmallIntegerField
-            qte_r = common.clamp(int(line.get('total_recu', 0)), -32768, 32767)  # SmallIntegerField
-
-            # Calcul des valeurs et common.clamping
-            qte_ec = common.clamp(qte - qte_r, -32768, 32767)  # Écart entre commandé et reçu
-            qte_ar = common.clamp(qte - qte_r, -32768, 32767)  # Quantité à réceptionner
-
             # Create a unique key for the association
             association_key = (order.id, product.id)
             if association_key in existing_associations:
@@ -372,12 +311,12 @@ def process_achat(pharmacy, data):
             product_order_data.append({
                 'product': product,
                 'order': order,
-                'qte': qte,
-                'qte_a': qte_a,
-                'qte_ug': qte_ug,
-                'qte_r': qte_r,
-                'qte_ec': qte_ec,
-                'qte_ar': qte_ar
+                'qte': line.qte,
+                'qte_a': line.qte_a,
+                'qte_ug': line.qte_ug,
+                'qte_r': line.qte_r,
+                'qte_ec': line.qte_ec,
+                'qte_ar': line.qte_ar
             })
 
     # Create or update ProductOrder instances
@@ -398,17 +337,17 @@ def process_achat(pharmacy, data):
     
     # Collecter les produits avec PMP disponible
     for obj in preprocessed_data:
-        order = order_map.get(obj['order_id'])
+        order = order_map.get(obj.order_id)
         if not order or not order.delivery_date:
             continue
             
-        for line in obj['products']:
-            product_id = line['product_id']
+        for line in obj.lines:
+            product_id = line.product_id
             product = internal_products_map.get(product_id)
             if not product:
                 continue
             
-            pmp_value = line.get('px_achat_net_ht')
+            pmp_value = line.purchase_price
             if pmp_value is None or pmp_value <= 0:
                 continue
             
@@ -437,11 +376,8 @@ def process_achat(pharmacy, data):
                 snapshot_updates.append({
                     'product_id': item['product'].id,
                     'stock': 0,
-                    'price_with_tax': Decimal('0.00'),
-                    'weighted_average_price': Decimal(str(item['pmp'])).quantize(
-                        Decimal('0.01'), 
-                        rounding=ROUND_HALF_UP
-                    ),
+                    'price_with_tax_cents': 0,
+                    'weighted_average_price_cents': to_cents(item['pmp']),
                     'date': date.today()
                 })
         
@@ -452,7 +388,7 @@ def process_achat(pharmacy, data):
                     model=InventorySnapshot,
                     data=snapshot_updates,
                     unique_fields=['product_id', 'date'],
-                    update_fields=['weighted_average_price']
+                    update_fields=['weighted_average_price_cents']
                 )
                 logger.info(f"Created {len(snapshot_updates)} snapshots with PMP from Achat")
             except Exception as e:
@@ -470,36 +406,19 @@ def process_vente(pharmacy, data):
     Returns:
         dict: A dictionary containing lists of created products, sales, and product-order associations.
     """
-    preprocessed_data = []
-    for obj in data:
-        try:
-            # Extract and validate sales data
-            for invoice in obj.get('factures', []):
-                for line in invoice.get('lignes_de_facture', []):
-                    product_id = line.get('produit_id')
-                    if not product_id:
-                        continue
-
-                    quantite = int(line.get('quantite', 0))
-                    total_net_ttc = line.get('total_net_ttc')
-                    
-                    # Calculer le prix unitaire TTC
-                    unit_price = None
-                    if quantite > 0 and total_net_ttc is not None and total_net_ttc > 0:
-                        unit_price = Decimal(str(total_net_ttc)) / quantite
-
-                    preprocessed_data.append({
-                        'product_id': str(product_id),
-                        'qte': quantite,
-                        'date': obj.get('date_acte'),
-                        'unit_price_ttc': unit_price
-                    })
-        except (ValueError, TypeError, KeyError) as e:
-            logger.warning(f"Error preprocessing sales data for object {obj.get('commande_id', 'unknown')}: {e}")
-            continue
+    # One (product, date, quantity, TTC amount) tuple per invoice line, dated by the act
+    lines = [
+        (line.get('produit_id'), obj.get('date_acte'), line.get('quantite', 0), line.get('total_net_ttc'))
+        for obj in data
+        for invoice in obj.get('factures', [])
+        for line in invoice.get('lignes_de_facture', [])
+    ]
+
+    # Agréger par (produit, date) avec calcul du prix moyen pondéré
+    aggregated = columnar.aggregate_sales(lines, with_amounts=True)
 
     # Prepare a set of product IDs to process
-    product_ids = {obj['product_id'] for obj in preprocessed_data}
+    product_ids = set(aggregated['product_id'])
 
     latest_snapshots = (
         InventorySnapshot.objects
@@ -511,48 +430,7 @@ def process_vente(pharmacy, data):
     )
     internal_products_map = {str(product.internal_id): product.latest_snapshot_id for product in internal_products}
 
-    # Agréger par (produit, date) avec calcul du prix moyen pondéré
-    aggregated_sales = {}
-    for obj in preprocessed_data:
-        product_id = obj['product_id']
-        day = common.parse_date(obj['date'], is_datetime=False)
-        key = (product_id, day)
-        
-        if key not in aggregated_sales:
-            aggregated_sales[key] = {
-                'qte': obj['qte'],
-                'total_montant': (obj['unit_price_ttc'] * obj['qte']) if obj['unit_price_ttc'] else Decimal('0'),
-                'has_price': obj['unit_price_ttc'] is not None
-            }
-        else:
-            aggregated_sales[key]['qte'] += obj['qte']
-            if obj['unit_price_ttc']:
-                aggregated_sales[key]['total_montant'] += obj['unit_price_ttc'] * obj['qte']
-                aggregated_sales[key]['has_price'] = True
-
-    sales_data = []
-    for (product_id, day), agg in aggregated_sales.items():
-        snapshot_id = internal_products_map.get(product_id)
-        if not snapshot_id:
-            continue
-        
-        # Calculer le prix unitaire moyen
-        unit_price_ttc = None
-        if agg['has_price'] and agg['qte'] > 0:
-            unit_price_ttc = (agg['total_montant'] / agg['qte']).quantize(
-                Decimal('0.01'), 
-                rounding=ROUND_HALF_UP
-            )
-        
-        if agg['qte'] > 10000:
-            logger.warning(f"Quantité élevée le {day} pour produit {product_id}: {agg['qte']}")
-        
-        sales_data.append({
-            'product_id': snapshot_id,
-            'quantity': common.clamp(agg['qte'], -32768, 32767),
-            'date': day,
-            'unit_price_ttc': float(unit_price_ttc) if unit_price_ttc else None
-        })
+    sales_data, _ = columnar.sales_rows(aggregated, internal_products_map)
 
     # Process sales in bulk
     try:
@@ -560,8 +438,39 @@ def process_vente(pharmacy, data):
             model=Sales,
             data=sales_data,
             unique_fields=['product_id', 'date'],
-            update_fields=['quantity', 'unit_price_ttc']
+            update_fields=['quantity', 'unit_price_ttc_cents']
         )
     except Exception as e:
         logger.error(f"Error processing sales: {e}")
-        raise
\ No newline at end of file
+        raise
+
+def process_file(file_type, payload):
+    """
+    Dispatches a full Dexter file (stock, achat or vente) to the matching process function.
+
+    Args:
+        file_type (str): 'stock', 'achat' or 'vente'.
+        payload: Decoded Dexter file, with its 'organization' header.
+
+    Returns:
+        Pharmacy instance the file was processed for.
+    """
+    orga = payload.get('organization', {})
+    if not orga:
+        raise ValueError('Missing organization data')
+
+    pharmacy, _ = Pharmacy.objects.update_or_create(
+        id_nat=orga.get('id_national'),
+        defaults={'name': orga.get('nom_pharmacie', 'Pharmacie inconnue')}
+    )
+
+    if file_type == 'stock':
+        process_stock(pharmacy, payload.get('produits', []), orga.get('date_fichier'))
+    elif file_type == 'achat':
+        process_achat(pharmacy, payload.get('achats', []))
+    elif file_type == 'vente':
+        process_vente(pharmacy, payload.get('ventes', []))
+    else:
+        raise ValueError(f"Unknown Dexter file type '{file_type}'")
+
+    return pharmacy
@@ -0,0 +1,216 @@
+import logging
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, Max, Sum, Value, When
+from django.db.models.functions import Collate, TruncMonth
+from django.utils import timezone
+
+from data.models import DexterFile
+from data.services import common
+
+logger = logging.getLogger(__name__)
+
+
+def describe_key(key, size=0):
+    """
+    Parses a Dexter object key into manifest fields.
+
+    Expected file name: "<Type>_<cip>_<gers>_<YYYY-mm-dd-HH-MM-SS>_<start>_<end>.json.gz"
+
+    Returns:
+        dict of DexterFile fields or None if the key is not a Dexter file.
+    """
+    filename = key.rsplit('/', 1)[-1].split('.json.gz')[0]
+    parts = filename.split('_')
+    if len(parts) < 6 or parts[0].lower() not in ('stock', 'achat', 'vente'):
+        return None
+
+    try:
+        extracted_at = timezone.make_aware(datetime.strptime(parts[3], '%Y-%m-%d-%H-%M-%S'))
+    except ValueError:
+        extracted_at = None
+
+    try:
+        period_start = datetime.strptime(parts[4], '%Y-%m-%d').date()
+        period_end = datetime.strptime(parts[5], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+    return {
+        'key': key,
+        'file_type': parts[0].lower(),
+        'cip_code': parts[1],
+        'gers_code': parts[2],
+        'extracted_at': extracted_at,
+        'period_start': period_start,
+        'period_end': period_end,
+        'size': size or 0,
+    }
+
+
+def register_objects(objects, status=DexterFile.STATUS_PENDING):
+    """
+    Adds objects to the manifest, ignoring keys that are already known.
+
+    Args:
+        objects: Iterable of S3 listing entries ({'Key': ..., 'Size': ...}) or plain keys.
+        status (str): Status given to the new rows.
+
+    Returns:
+        int: Number of keys that were not already in the manifest.
+    """
+    rows = {}
+    for obj in objects:
+        key, size = (obj['Key'], obj.get('Size', 0)) if isinstance(obj, dict) else (obj, 0)
+        fields = describe_key(key, size)
+        if fields:
+            rows[key] = fields
+
+    known_keys = set()
+    for chunk in common.chunked_iterable(list(rows), 1000):
+        known_keys.update(DexterFile.objects.filter(key__in=chunk).values_list('key', flat=True))
+
+    new_rows = [
+        DexterFile(status=status, processed_at=timezone.now() if status == DexterFile.STATUS_PROCESSED else None,
+                   **fields)
+        for key, fields in rows.items() if key not in known_keys
+    ]
+    DexterFile.objects.bulk_create(new_rows, batch_size=1000, ignore_conflicts=True)
+    return len(new_rows)
+
+
+def last_registered_key(prefix):
+    """Greatest manifest key under prefix, in the byte order of S3 listings (None if none)."""
+    keys = DexterFile.objects.filter(key__startswith=prefix)
+    if connection.vendor == 'postgresql':
+        # The database collation may not sort like S3: compare the raw bytes
+        return keys.aggregate(last=Max(Collate('key', 'C')))['last']
+    return keys.aggregate(last=Max('key'))['last']
+
+
+def sync_prefix(s3_client, prefix, status=DexterFile.STATUS_PENDING, start_after=None, full=False):
+    """
+    Lists a prefix and registers the keys missing from the manifest.
+
+    The listing is incremental: it starts after the greatest key already registered under
+    the prefix (or after start_after), so only keys added since the last sync are listed.
+    Keys landing before that point in S3 order are registered by the code that produces
+    them (pending keys reported by the Dexter Lambda, archives by the movers); full=True
+    lists the whole prefix again to reconcile.
+
+    Returns:
+        int: Number of new rows.
+    """
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    paginator = s3_client.get_paginator('list_objects_v2')
+    params = {'Bucket': bucket, 'Prefix': prefix}
+    start_after = start_after or (None if full else last_registered_key(prefix))
+    if start_after:
+        params['StartAfter'] = start_after
+
+    created = 0
+    for page in paginator.paginate(**params):
+        objects = [obj for obj in page.get('Contents', []) if obj.get('Size', 0) > 0]
+        created += register_objects(objects, status=status)
+    logger.info(f"Manifest sync of {prefix} after {start_after or 'start'}: {created} new objects")
+    return created
+
+
+def mark_processed(key, new_key=None):
+    """
+    Marks an object as processed, following its move to the archive prefix if any.
+
+    When the archive key is already in the manifest (e.g. registered by a sync of the
+    archive prefix), that row is updated and the row of the source key is removed.
+    """
+    target_key = new_key or key
+    fields = describe_key(target_key)
+    if not fields:
+        return
+    fields.pop('key')
+    size = fields.pop('size')
+    defaults = {**fields, 'status': DexterFile.STATUS_PROCESSED, 'processed_at': timezone.now(), 'error': None}
+
+    with transaction.atomic():
+        if target_key != key:
+            source = DexterFile.objects.filter(key=key).values('size').first()
+            if source:
+                size = source['size']
+                DexterFile.objects.filter(key=key).delete()
+        if size:
+            defaults['size'] = size
+        DexterFile.objects.update_or_create(key=target_key, defaults=defaults)
+
+
+def mark_error(key, error):
+    """Marks an object as failed with the given error message."""
+    fields = describe_key(key)
+    if not fields:
+        return
+    fields.pop('key')
+    fields.pop('size')
+    DexterFile.objects.update_or_create(
+        key=key, defaults={**fields, 'status': DexterFile.STATUS_ERROR, 'error': str(error)}
+    )
+
+
+def select_files(file_type=None, cip_code=None, gers_code=None, status=None, start=None, end=None, prefix=None):
+    """
+    Returns the manifest rows matching the filters, ordered like the processors expect them
+    (pharmacy, period end, then Stock -> Achat -> Vente). prefix restricts the keys to a
+    folder of the bucket (e.g. History_dexter/).
+
+    Returns:
+        list of dicts with the manifest fields.
+    """
+    qs = DexterFile.objects.all()
+    if file_type:
+        qs = qs.filter(file_type=file_type.lower())
+    if cip_code:
+        qs = qs.filter(cip_code=cip_code)
+    if gers_code:
+        qs = qs.filter(gers_code=gers_code)
+    if status:
+        qs = qs.filter(status=status)
+    if prefix:
+        qs = qs.filter(key__startswith=prefix)
+    if start:
+        qs = qs.filter(period_start__gte=start)
+    if end:
+        qs = qs.filter(period_end__lte=end)
+
+    type_order = Case(
+        When(file_type='stock', then=Value(0)),
+        When(file_type='achat', then=Value(1)),
+        When(file_type='vente', then=Value(2)),
+        default=Value(3),
+    )
+    return list(
+        qs.order_by('cip_code', 'gers_code', 'period_end', type_order)
+        .values('key', 'file_type', 'cip_code', 'gers_code', 'period_start', 'period_end', 'size', 'status')
+    )
+
+
+def monthly_coverage(file_type=None):
+    """
+    Counts manifest objects per pharmacy and month of period start.
+
+    Returns:
+        list of dicts {'cip_code', 'gers_code', 'file_type', 'month', 'files', 'total_size'}
+    """
+    qs = DexterFile.objects.all()
+    if file_type:
+        qs = qs.filter(file_type=file_type.lower())
+
+    rows = (
+        qs.annotate(month=TruncMonth('period_start'))
+        .values('cip_code', 'gers_code', 'file_type', 'month')
+        .annotate(files=Count('id'), total_size=Sum('size'))
+        .order_by('cip_code', 'gers_code', 'file_type', 'month')
+    )
+    return [
+        {**row, 'month': row['month'].strftime('%Y-%m') if row['month'] else None}
+        for row in rows
+    ]
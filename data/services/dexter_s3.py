@@ -0,0 +1,218 @@
+import gzip
+import json
+import logging
+import traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
+from django.db import connection
+
+from data.services import dexter, dexter_manifest
+
+logger = logging.getLogger(__name__)
+
+SOURCE_PREFIX = 'Dexter/'
+HISTORY_PREFIX = 'History_dexter/'
+# Former archive folder, still read by the analysis scripts
+LEGACY_HISTORY_PREFIX = 'Dexter_history/'
+ARCHIVE_PREFIXES = (HISTORY_PREFIX, LEGACY_HISTORY_PREFIX)
+# Stock fingerprints of the last file sent by the Dexter Lambda in DEXTER_STOCK_DELTA mode
+STATE_PREFIX = 'Dexter_state/'
+
+FILE_TYPE_PRIORITY = {
+    'stock': 0,
+    'achat': 1,
+    'vente': 2
+}
+
+
+def get_s3_client(max_workers=4):
+    """
+    Builds an S3 client from the project settings.
+
+    AWS_S3_ENDPOINT_URL can point to a local S3-compatible server (MinIO, moto...)
+    so the same ingestion path can be exercised without AWS.
+    """
+    return boto3.client(
+        's3',
+        endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None),
+        region_name=settings.AWS_S3_REGION_NAME,
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        config=Config(max_pool_connections=max(10, 2 * max_workers)),
+    )
+
+
+def parse_key(key):
+    """
+    Parses a Dexter object key.
+
+    Expected file name: "<Type>_<cip>_<gers>_<timestamp>_<start>_<end>.json.gz"
+
+    Returns:
+        tuple (cip_code, gers_code, end_date, file_type) or None if the name is not a Dexter file.
+    """
+    filename = key.rsplit('/', 1)[-1].split('.json.gz')[0]
+    parts = filename.split('_')
+    if len(parts) < 6 or parts[0].lower() not in FILE_TYPE_PRIORITY:
+        return None
+
+    try:
+        end_date = datetime.strptime(parts[5], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+    return parts[1], parts[2], end_date, parts[0].lower()
+
+
+def group_keys_by_pharmacy(keys):
+    """
+    Groups keys by pharmacy (CIP + GERS), each group ordered by end date then Stock -> Achat -> Vente.
+
+    Returns:
+        tuple (groups, invalid_keys)
+    """
+    groups = defaultdict(list)
+    invalid_keys = []
+    for key in keys:
+        parsed = parse_key(key)
+        if not parsed:
+            invalid_keys.append(key)
+            continue
+        cip_code, gers_code, end_date, file_type = parsed
+        groups[(cip_code, gers_code)].append((end_date, FILE_TYPE_PRIORITY[file_type], file_type, key))
+
+    for files in groups.values():
+        files.sort(key=lambda x: (x[0], x[1]))
+
+    return groups, invalid_keys
+
+
+def load_object(s3_client, key, bucket=None):
+    """Downloads and decodes a .json.gz object, decompressing it while streaming."""
+    response = s3_client.get_object(Bucket=bucket or settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+    with gzip.GzipFile(fileobj=response['Body']) as gz:
+        return json.load(gz)
+
+
+def move_to_history(s3_client, key, bucket=None):
+    """Moves a processed object from Dexter/ to History_dexter/."""
+    bucket = bucket or settings.AWS_STORAGE_BUCKET_NAME
+    new_key = key.replace(SOURCE_PREFIX, HISTORY_PREFIX, 1)
+    s3_client.copy_object(Bucket=bucket, CopySource={'Bucket': bucket, 'Key': key}, Key=new_key)
+    s3_client.delete_object(Bucket=bucket, Key=key)
+    return new_key
+
+
+def stock_state_key(cip_code, gers_code):
+    """Key of a pharmacy's Stock fingerprints, as written by the Dexter Lambda."""
+    return f"{STATE_PREFIX}stock_{cip_code}_{gers_code}.json.gz"
+
+
+def invalidate_stock_state(s3_client, key, bucket=None):
+    """
+    Deletes the Lambda's Stock fingerprints of the pharmacy of an ingested Stock file.
+
+    The Lambda diffs each Stock file against its own fingerprints: once the server has
+    ingested a Stock file itself, they no longer match the database, and the Lambda's next
+    Stock file must be sent in full.
+    """
+    cip_code, gers_code, _, _ = parse_key(key)
+    s3_client.delete_object(Bucket=bucket or settings.AWS_STORAGE_BUCKET_NAME, Key=stock_state_key(cip_code, gers_code))
+
+
+def _update_manifest(update, *args):
+    """Runs a manifest update; returns the error message instead of raising."""
+    try:
+        update(*args)
+    except Exception as e:
+        logger.error(f"Error updating the Dexter manifest for {args[0]}: {e}")
+        return str(e)
+    return None
+
+
+def _ingest_pharmacy_files(s3_client, files, move):
+    """
+    Ingests the files of one pharmacy sequentially to keep their order.
+
+    Runs in a worker thread: the thread's own DB connection is closed on exit.
+    """
+    results = []
+    try:
+        for _, _, file_type, key in files:
+            try:
+                payload = load_object(s3_client, key)
+                dexter.process_file(file_type, payload)
+            except Exception as e:
+                logger.error(f"Error ingesting {key}: {traceback.format_exc()}")
+                results.append({'key': key, 'status': 'error', 'error': str(e)})
+                _update_manifest(dexter_manifest.mark_error, key, e)
+                continue
+
+            # The data is in the database from here on: archiving or manifest failures
+            # are reported next to the success, not as an ingestion error
+            result = {'key': key, 'status': 'success'}
+            if file_type == 'stock':
+                try:
+                    invalidate_stock_state(s3_client, key)
+                except Exception as e:
+                    logger.error(f"Error invalidating the Stock state of {key}: {e}")
+                    result['state_error'] = str(e)
+            if move and key.startswith(SOURCE_PREFIX):
+                try:
+                    result['moved_to'] = move_to_history(s3_client, key)
+                except Exception as e:
+                    logger.error(f"Error moving {key} to {HISTORY_PREFIX}: {e}")
+                    result['move_error'] = str(e)
+            manifest_error = _update_manifest(dexter_manifest.mark_processed, key, result.get('moved_to'))
+            if manifest_error:
+                result['manifest_error'] = manifest_error
+            results.append(result)
+    finally:
+        connection.close()
+    return results
+
+
+def ingest_keys(keys, max_workers=4, move=True, s3_client=None):
+    """
+    Fetches, decompresses and ingests Dexter objects directly from the bucket.
+
+    Pharmacies are processed in parallel (at most max_workers at a time); within a
+    pharmacy the files keep the Stock -> Achat -> Vente order. Successfully ingested
+    objects under Dexter/ are moved to History_dexter/ when move is True. Ingesting a Stock
+    file deletes the Lambda's Stock fingerprints of its pharmacy (see invalidate_stock_state).
+
+    Args:
+        keys: Iterable of object keys in the bucket.
+        max_workers (int): Number of pharmacies processed concurrently.
+        move (bool): Whether to archive successful objects.
+        s3_client: Optional boto3 client (defaults to get_s3_client()).
+
+    Returns:
+        dict: Per-key results and counters. An ingested object whose move, manifest update or
+        Stock state invalidation failed stays a success, with a 'move_error', 'manifest_error'
+        or 'state_error' entry.
+    """
+    s3_client = s3_client or get_s3_client(max_workers)
+    groups, invalid_keys = group_keys_by_pharmacy(keys)
+
+    logger.info(f"Ingesting {sum(len(f) for f in groups.values())} Dexter files for {len(groups)} pharmacies")
+
+    results = [{'key': key, 'status': 'invalid_key'} for key in invalid_keys]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_ingest_pharmacy_files, s3_client, files, move)
+            for files in groups.values()
+        ]
+        for future in futures:
+            results.extend(future.result())
+
+    return {
+        'success': sum(1 for r in results if r['status'] == 'success'),
+        'errors': sum(1 for r in results if r['status'] != 'success'),
+        'results': results,
+    }
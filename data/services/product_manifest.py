@@ -0,0 +1,93 @@
+import hashlib
+import logging
+from decimal import Decimal
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from data.fields import from_cents
+from data.models import InternalProduct, InventorySnapshot, Pharmacy
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_ALGORITHM = 'blake2b-64'
+
+
+def _format_price(value):
+    return f"{Decimal(value):.2f}" if value is not None else ''
+
+
+def product_fingerprint(stock, price_with_tax, weighted_average_price, name, code_13_ref):
+    """
+    Hashes the product fields a sync can change (stock, TTC price, PMP, name, EAN).
+
+    The Lambdas compute the same value from the vendor data (see
+    lambda/winpharma_new_api/app.py): both sides must keep this exact normalisation.
+
+    Returns:
+        str: 16 hex characters.
+    """
+    raw = '|'.join([
+        str(int(stock or 0)),
+        _format_price(price_with_tax),
+        _format_price(weighted_average_price),
+        name or '',
+        code_13_ref or '',
+    ])
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def pharmacy_manifest(pharmacy):
+    """
+    Builds the fingerprint of every product of a pharmacy from its latest snapshot.
+
+    Products without any snapshot are left out, so senders always transmit them.
+
+    Args:
+        pharmacy: Pharmacy instance.
+
+    Returns:
+        dict: {internal_id (str): fingerprint}
+    """
+    products = {
+        product_id: (internal_id, name, code_13_ref)
+        for product_id, internal_id, name, code_13_ref in InternalProduct.objects.filter(
+            pharmacy=pharmacy
+        ).values_list('id', 'internal_id', 'name', 'code_13_ref_id')
+    }
+
+    latest_snapshots = InventorySnapshot.objects.filter(
+        product__pharmacy=pharmacy
+    ).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=F('product_id'),
+            order_by=F('date').desc()
+        )
+    ).filter(row_number=1).values_list('product_id', 'stock', 'price_with_tax_cents', 'weighted_average_price_cents')
+
+    manifest = {}
+    for product_id, stock, price_cents, weighted_average_price_cents in latest_snapshots:
+        internal_id, name, code_13_ref = products[product_id]
+        manifest[str(internal_id)] = product_fingerprint(
+            stock, from_cents(price_cents), from_cents(weighted_average_price_cents), name, code_13_ref
+        )
+
+    logger.info(f"Product manifest for pharmacy {pharmacy.id_nat}: {len(manifest)} products")
+    return manifest
+
+
+def build_manifests(id_nats):
+    """
+    Builds the product manifests of several pharmacies.
+
+    Args:
+        id_nats: Iterable of pharmacy national ids.
+
+    Returns:
+        dict: {id_nat: {internal_id: fingerprint}}; unknown pharmacies get an empty manifest.
+    """
+    manifests = {id_nat: {} for id_nat in id_nats}
+    for pharmacy in Pharmacy.objects.filter(id_nat__in=manifests.keys()):
+        manifests[pharmacy.id_nat].update(pharmacy_manifest(pharmacy))
+    return manifests
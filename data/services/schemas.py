@@ -0,0 +1,186 @@
+"""
+Typed records of the vendor order payloads.
+
+Each decoder walks an order payload already parsed by the request parser, validates and
+converts every field, and returns immutable NamedTuple records with a fixed set of fields.
+Invalid orders and lines are counted during the pass and reported in a single warning.
+
+Scope: only the WinPharma new API (and historical import) and Dexter 'achat' order streams
+are decoded here. The legacy WinPharma, WinPharma 2 and Apothical order paths and the
+product/sales payloads (columnar.py) keep their dict-based preprocessing. The records give
+the services one validated shape per stream; they are not a faster decoder, as the JSON is
+still parsed into dicts first and no decoding library is used.
+"""
+import logging
+from typing import Any, List, NamedTuple, Optional
+
+from data.services import common
+
+logger = logging.getLogger(__name__)
+
+SMALLINT_MIN, SMALLINT_MAX = -32768, 32767
+
+# WinPharma new API: order channel -> Order.step
+NEW_API_CHANNEL_STEPS = {'pml': 1, 'email': 2, 'autre': 3, '': 0}
+
+
+class OrderLineRecord(NamedTuple):
+    product_id: str
+    qte: int  # Ordered quantity
+    qte_r: int  # Received quantity
+    qte_a: int  # Expected quantity
+    qte_ug: int  # Free units
+    qte_ec: int  # Gap quantity
+    qte_ar: int  # Quantity still to receive
+    purchase_price: Optional[float] = None  # Net purchase price (HT), when the vendor sends it
+
+
+class OrderRecord(NamedTuple):
+    order_id: Any  # Order.internal_id, in the type used by the service's lookups
+    supplier_id: str
+    supplier_name: str
+    step: Any
+    sent_date: Any
+    delivery_date: Any
+    lines: List[OrderLineRecord]
+
+
+def _smallint(value):
+    """SmallIntegerField value of a raw quantity (missing = 0)."""
+    return common.clamp(int(value or 0), SMALLINT_MIN, SMALLINT_MAX)
+
+
+def _product_id(value):
+    """
+    Product id as str() of the vendor value (the key used for the products), or None for
+    lines to skip (missing or negative id).
+    """
+    if not value or int(value) < 0:
+        return None
+    return str(value)
+
+
+def _number(value):
+    """Float of an optional raw number, None when missing."""
+    return float(value) if value is not None and value != '' else None
+
+
+def _report(stream, invalid_orders, invalid_lines, sample):
+    if invalid_orders or invalid_lines:
+        logger.warning(f"{stream}: {invalid_orders} orders and {invalid_lines} lines ignored "
+                       f"(first errors: {'; '.join(sample)})")
+
+
+def decode_new_api_orders(orders_raw):
+    """
+    Decodes the 'achats' list of a WinPharma new API wrapper (new API and historical imports).
+
+    Expected format:
+    [{"id": 123, "codeFourn": "...", "nomFourn": "...", "channel": "pml", "dateEnvoi": "...",
+      "dateLivraison": "...", "lignes": [{"prodId": 1, "qteC": 2, "qteR": 2, "qteUG": 0, "qteEC": 0}]}]
+
+    Returns:
+        list of OrderRecord, order_id as int. The expected quantity is the ordered one and the
+        quantity to receive is ordered - received (not sent by this API).
+    """
+    orders = []
+    invalid_orders = invalid_lines = 0
+    sample = []
+    for obj in orders_raw or []:
+        try:
+            if not obj.get('id'):
+                continue
+            order_id = int(obj['id'])
+            supplier_id = obj.get('codeFourn')
+            if not supplier_id:
+                raise ValueError("Missing 'codeFourn'")
+
+            lines = []
+            for line in obj.get('lignes') or []:
+                try:
+                    product_id = _product_id(line.get('prodId'))
+                    if product_id is None:
+                        continue
+                    qte_c = _smallint(line.get('qteC'))
+                    qte_r = _smallint(line.get('qteR'))
+                    lines.append(OrderLineRecord(
+                        product_id, qte_c, qte_r, qte_c, _smallint(line.get('qteUG')), _smallint(line.get('qteEC')),
+                        max(0, qte_c - qte_r),
+                    ))
+                except (ValueError, TypeError, AttributeError) as e:
+                    invalid_lines += 1
+                    if len(sample) < 5:
+                        sample.append(f"order {order_id}: {e}")
+
+            orders.append(OrderRecord(
+                order_id,
+                supplier_id,
+                obj.get('nomFourn', supplier_id),
+                NEW_API_CHANNEL_STEPS.get((obj.get('channel') or '').lower(), 0),
+                common.parse_date(obj.get('dateEnvoi')),
+                common.parse_date(obj.get('dateLivraison'), False),
+                lines,
+            ))
+        except (ValueError, TypeError, AttributeError) as e:
+            invalid_orders += 1
+            if len(sample) < 5:
+                sample.append(f"order {obj.get('id', 'unknown') if isinstance(obj, dict) else obj}: {e}")
+
+    _report('WinPharma orders', invalid_orders, invalid_lines, sample)
+    return orders
+
+
+def decode_dexter_orders(data):
+    """
+    Decodes a Dexter 'achat' payload.
+
+    Expected format:
+    [{"commande_id": 1, "id_fournisseur": 2, "libelle_fournisseur": "...", "etat_commande": "...",
+      "date_transmission": "...", "date_reception": "...",
+      "lignes": [{"produit_id": 3, "qte_cde": 5, "total_recu": 4, "total_ug_liv": 0, "px_achat_net_ht": 1.2}]}]
+
+    Returns:
+        list of OrderRecord, order_id as str. The gap and the quantity to receive are both
+        ordered - received.
+    """
+    orders = []
+    invalid_orders = invalid_lines = 0
+    sample = []
+    for obj in data or []:
+        try:
+            order_id = str(obj['commande_id'])
+            supplier_id = str(obj['id_fournisseur'])
+
+            lines = []
+            for line in obj.get('lignes') or []:
+                try:
+                    if int(line.get('produit_id')) < 0:
+                        continue
+                    qte = _smallint(line.get('qte_cde'))
+                    qte_r = _smallint(line.get('total_recu'))
+                    gap = common.clamp(qte - qte_r, SMALLINT_MIN, SMALLINT_MAX)
+                    lines.append(OrderLineRecord(
+                        str(line['produit_id']), qte, qte_r, qte, _smallint(line.get('total_ug_liv')), gap, gap,
+                        _number(line.get('px_achat_net_ht')),
+                    ))
+                except (ValueError, TypeError, KeyError, AttributeError) as e:
+                    invalid_lines += 1
+                    if len(sample) < 5:
+                        sample.append(f"commande {order_id}: {e}")
+
+            orders.append(OrderRecord(
+                order_id,
+                supplier_id,
+                str(obj.get('libelle_fournisseur', obj.get('id_fournisseur', ''))),
+                str(obj.get('etat_commande', '')),
+                common.parse_date(obj.get('date_transmission')),
+                common.parse_date(obj.get('date_reception'), is_datetime=False),
+                lines,
+            ))
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            invalid_orders += 1
+            if len(sample) < 5:
+                sample.append(f"commande {obj.get('commande_id', 'unknown') if isinstance(obj, dict) else obj}: {e}")
+
+    _report('Dexter achats', invalid_orders, invalid_lines, sample)
+    return orders
@@ -1,5 +1,4 @@
 from datetime import date
-from decimal import Decimal, ROUND_HALF_UP
 import logging
 
 from django.db import transaction
@@ -7,7 +6,7 @@ from django.db.models import OuterRef, Subquery, F, Window
 from django.db.models.functions import RowNumber
 
 from data.models import GlobalProduct, InternalProduct, ProductOrder, Supplier, Order, Sales, InventorySnapshot
-from data.services import common
+from data.services import columnar, common
 logger = logging.getLogger(__name__)
 
 
@@ -22,34 +21,11 @@ def process_product(pharmacy, data):
     Returns:
         A dictionary containing lists of created products and snapshots.
     """
-    preprocessed_data = []
-    for obj in data:
-        try:
-            if int(obj.get('id')) < 0:
-                continue
-            tva_value = float(obj.get('TVA', 0.0))
-            if tva_value > 1:
-                tva_converted = Decimal(tva_value / 100)
-            else:
-                tva_converted = Decimal(tva_value)
-
-            # Cap prices to a maximum value
-            preprocessed_data.append({
-                'product_id': str(obj.get('id')),
-                'name': obj.get('nom', ''),
-                'code_13_ref': obj.get('code13Ref') or None,
-                'TVA': tva_converted,
-                'stock': common.clamp(int(obj.get('stock', 0)), -32768, 32767),
-                'price_with_tax': min(Decimal(obj.get('prixTtc', 0)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
-                                      Decimal('99999999.99')),
-                'weighted_average_price': min(
-                    Decimal(obj.get('prixMP', 0)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
-                    Decimal('99999999.99')),
-            })
-
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Error preprocessing data for product {obj.get('id', 'unknown')}: {e}")
-            continue
+    # Prices are capped to the column maximum
+    preprocessed_data = columnar.normalize_products(
+        data, id_field='id', name_field='nom', code_field='code13Ref', stock_field='stock',
+        price_field='prixTtc', wap_field='prixMP', tva_field='TVA', skip_zero_id=False
+    )
 
     # Collect unique GlobalProduct references
     code_13_refs = {obj['code_13_ref'] for obj in preprocessed_data if obj['code_13_ref']}
@@ -106,7 +82,7 @@ def process_product(pharmacy, data):
             partition_by=F('product_id'),
             order_by=F('date').desc()
         )
-    ).filter(row_number=1).values('product_id', 'stock', 'price_with_tax', 'weighted_average_price')
+    ).filter(row_number=1).values('product_id', 'stock', 'price_with_tax_cents', 'weighted_average_price_cents')
 
     # Create a mapping of the latest snapshots by internal_id
     latest_snapshots_map = {snapshot['product_id']: snapshot for snapshot in latest_snapshots}
@@ -122,16 +98,16 @@ def process_product(pharmacy, data):
         needs_update = (
                 not last_snapshot or
                 last_snapshot['stock'] != obj['stock'] or
-                last_snapshot['price_with_tax'] != obj['price_with_tax'] or
-                last_snapshot['weighted_average_price'] != obj['weighted_average_price']
+                last_snapshot['price_with_tax_cents'] != obj['price_with_tax_cents'] or
+                last_snapshot['weighted_average_price_cents'] != obj['weighted_average_price_cents']
         )
 
         if needs_update:
             inventory_snapshots_data.append({
                 'product_id': product.id,
                 'stock': obj['stock'],
-                'price_with_tax': obj['price_with_tax'],
-                'weighted_average_price': obj['weighted_average_price'],
+                'price_with_tax_cents': obj['price_with_tax_cents'],
+                'weighted_average_price_cents': obj['weighted_average_price_cents'],
                 'date': date.today()
             })
 
@@ -141,7 +117,7 @@ def process_product(pharmacy, data):
             model=InventorySnapshot,
             data=inventory_snapshots_data,
             unique_fields=['product_id', 'date'],
-            update_fields=['stock', 'price_with_tax', 'weighted_average_price']
+            update_fields=['stock', 'price_with_tax_cents', 'weighted_average_price_cents']
         )
 
 
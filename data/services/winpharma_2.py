@@ -1,5 +1,4 @@
 from datetime import date
-from decimal import Decimal, ROUND_HALF_UP
 import logging
 from typing import Any, Dict, List, Set, cast
 
@@ -8,7 +7,7 @@ from django.db.models import OuterRef, Subquery, F, Window
 from django.db.models.functions import RowNumber
 
 from data.models import GlobalProduct, InternalProduct, ProductOrder, Supplier, Order, Sales, InventorySnapshot
-from data.services import common
+from data.services import columnar, common
 
 logger = logging.getLogger(__name__)
 
@@ -24,48 +23,11 @@ def process_product(pharmacy, data):
     Returns:
         A dictionary containing lists of created products and snapshots.
     """
-    preprocessed: List[Dict[str, Any]] = []
-    for block in data:
-        for obj in block.get("produits", []):
-            try:
-                prod_id_raw = obj.get("ProdId")
-                if prod_id_raw is None or int(prod_id_raw) < 0:
-                    continue
-
-                # -- TVA ------------------------------------------------
-                tva_value = Decimal(str(obj.get("TVA", 0) or 0))
-                tva_converted = (tva_value / Decimal(100)) if tva_value > 1 else tva_value
-
-                # -- Prix ---------------------------------------------
-                price_ttc = min(
-                    Decimal(str(obj.get("PrixTTC", 0) or 0)).quantize(
-                        Decimal("0.01"), rounding=ROUND_HALF_UP
-                    ),
-                    Decimal("99999999.99"),
-                )
-                weighted_price = min(
-                    Decimal(str(obj.get("PrixMP", 0) or 0)).quantize(
-                        Decimal("0.01"), rounding=ROUND_HALF_UP
-                    ),
-                    Decimal("99999999.99"),
-                )
-
-                stock_val = common.clamp(int(obj.get("Stock", 0) or 0), -32768, 32767)
-
-                preprocessed.append(
-                    {
-                        "product_id": str(prod_id_raw),
-                        "name": obj.get("Nom", ""),
-                        "code_13_ref": obj.get("Code13Ref") or None,
-                        "TVA": tva_converted,
-                        "stock": stock_val,
-                        "price_with_tax": price_ttc,
-                        "weighted_average_price": weighted_price,
-                    }
-                )
-            except (ValueError, TypeError) as err:
-                logger.warning("Produit ignoré (%s) : %s", obj.get("ProdId", "unknown"), err)
-                continue
+    preprocessed: List[Dict[str, Any]] = columnar.normalize_products(
+        [obj for block in data for obj in block.get("produits", [])],
+        id_field="ProdId", name_field="Nom", code_field="Code13Ref", stock_field="Stock",
+        price_field="PrixTTC", wap_field="PrixMP", tva_field="TVA", skip_zero_id=False,
+    )
 
     if not preprocessed:
         return {"products": [], "snapshots": []}
@@ -122,7 +84,7 @@ def process_product(pharmacy, data):
             )
         )
         .filter(row_number=1)
-        .values("product_id", "stock", "price_with_tax", "weighted_average_price")
+        .values("product_id", "stock", "price_with_tax_cents", "weighted_average_price_cents")
     )
     latest_map = {s["product_id"]: s for s in latest}
 
@@ -135,15 +97,15 @@ def process_product(pharmacy, data):
         if (
                 not last
                 or last["stock"] != o["stock"]
-                or last["price_with_tax"] != o["price_with_tax"]
-                or last["weighted_average_price"] != o["weighted_average_price"]
+                or last["price_with_tax_cents"] != o["price_with_tax_cents"]
+                or last["weighted_average_price_cents"] != o["weighted_average_price_cents"]
         ):
             snapshots.append(
                 {
                     "product_id": p.id,
                     "stock": o["stock"],
-                    "price_with_tax": o["price_with_tax"],
-                    "weighted_average_price": o["weighted_average_price"],
+                    "price_with_tax_cents": o["price_with_tax_cents"],
+                    "weighted_average_price_cents": o["weighted_average_price_cents"],
                     "date": date.today(),
                 }
             )
@@ -153,7 +115,7 @@ def process_product(pharmacy, data):
             model=InventorySnapshot,
             data=snapshots,
             unique_fields=["product_id", "date"],
-            update_fields=["stock", "price_with_tax", "weighted_average_price"],
+            update_fields=["stock", "price_with_tax_cents", "weighted_average_price_cents"],
         )
 
     # ------------------------------------------------------------------
@@ -0,0 +1,325 @@
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connections
+
+from data.models import InventorySnapshot, Pharmacy, ProductOrder, Sales
+from data.services import common, winpharma_historical
+
+# The fetch plan (HTTP client, adaptive windows, checkpoints) is shared with the Lambdas
+# and the recup_*.py scripts
+SHARED_DIR = os.path.join(settings.BASE_DIR, 'lambda', 'shared')
+if SHARED_DIR not in sys.path:
+    sys.path.append(SHARED_DIR)
+
+import backfill  # noqa: E402
+import http_client  # noqa: E402
+import periods  # noqa: E402
+import response_cache  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+WINPHARMA_HOST = "grpstat.winpharma.com"
+
+# Stream -> (vendor endpoint, historical service)
+STREAMS = {
+    'products': ('produits', winpharma_historical.process_product),
+    'sales': ('ventes', winpharma_historical.process_sales),
+    'orders': ('achats', winpharma_historical.process_order),
+}
+
+# Stream -> tables merged through common.bulk_upsert in bulk-load mode
+BULK_MODELS = {
+    'products': [InventorySnapshot],
+    'sales': [Sales],
+    'orders': [ProductOrder],
+}
+
+
+def build_batches(pharmacy_ids, batch_size):
+    """Splits pharmacy ids into Idnats batches of at most batch_size ids."""
+    batch_size = max(1, batch_size)
+    return [pharmacy_ids[i:i + batch_size] for i in range(0, len(pharmacy_ids), batch_size)]
+
+
+def count_pending_steps(checkpoint, pharmacy_ids, plan_periods, streams):
+    """Number of (pharmacy, stream, period) steps not yet in the checkpoint."""
+    steps = 0
+    for stream in streams:
+        if stream == 'products':
+            steps += len(checkpoint.pending(pharmacy_ids, stream))
+        else:
+            steps += sum(len(checkpoint.pending(pharmacy_ids, stream, *period)) for period in plan_periods)
+    return steps
+
+
+def _count_records(data, endpoint):
+    if not isinstance(data, list):
+        return 0
+    return sum(len(block.get(endpoint) or []) for block in data if isinstance(block, dict))
+
+
+def _process(stream, pharmacy_ids, data, bulk_load=False):
+    """Calls the historical service, as the winpharma_historical endpoints would."""
+    # Like the views: the header pharmacy is only known for single-pharmacy requests
+    pharmacy = Pharmacy.objects.get_or_create(id_nat=pharmacy_ids[0])[0] if len(pharmacy_ids) == 1 else None
+    STREAMS[stream][1](pharmacy, data, bulk_load=bulk_load)
+
+
+def defer_indexes(models, index_file):
+    """
+    Drops the secondary indexes of the bulk-loaded tables until restore_deferred_indexes().
+
+    The definitions are kept in index_file first, so indexes dropped by a run that was
+    killed are rebuilt by the next one.
+    """
+    definitions = []
+    if os.path.exists(index_file):
+        with open(index_file, encoding='utf-8') as f:
+            definitions = json.load(f)
+    for model in models:
+        dropped = common.drop_secondary_indexes(model)
+        definitions.extend(definition for definition in dropped if definition not in definitions)
+        with open(index_file, 'w', encoding='utf-8') as f:
+            json.dump(definitions, f, indent=2)
+
+
+def restore_deferred_indexes(index_file, log=logger.info):
+    """Rebuilds the indexes listed by defer_indexes(), if any, and forgets them."""
+    if not os.path.exists(index_file):
+        return
+    with open(index_file, encoding='utf-8') as f:
+        definitions = json.load(f)
+    log(f"Rebuilding {len(definitions)} deferred indexes")
+    common.restore_indexes(definitions)
+    os.remove(index_file)
+
+
+def run_batch(pharmacy_ids, plan_periods, streams, api_url, api_password, checkpoint_path,
+              rate_per_second=None, progress=None, cache_options=None, bulk_load=False):
+    """
+    Fetches and imports every pending step of an Idnats batch. Runs inside a worker process.
+
+    Products come first (sales and orders need their snapshots), then each stream is walked
+    over the runs of pending periods with adaptive windows (see lambda/shared/periods.py).
+    A period is checkpointed once every window covering it has been imported.
+
+    Args:
+        pharmacy_ids: Pharmacies sharing the credentials, requested together.
+        plan_periods: Ordered list of (dt1, dt2) checkpoint periods.
+        streams: Subset of STREAMS keys.
+        api_url, api_password: WinPharma credentials.
+        checkpoint_path: JSON Lines checkpoint file shared by all workers.
+        rate_per_second: Share of the WinPharma request rate given to this worker.
+        progress: Optional queue receiving ThroughputMeter.add() keyword dicts.
+        cache_options: Optional ResponseCache keyword arguments (directory, ttl_seconds, refresh).
+        bulk_load: Merge the imported rows through common.bulk_upsert.
+
+    Returns:
+        dict: Counters for the batch.
+    """
+    checkpoint = backfill.CheckpointStore(checkpoint_path)
+    http = http_client.HttpClient(host_limits={
+        WINPHARMA_HOST: {'max_concurrency': 1, 'rate_per_second': rate_per_second}
+    })
+    cache = response_cache.ResponseCache(**cache_options) if cache_options else None
+    calendar = periods.VendorCalendar()
+    stats = {'pharmacy_ids': pharmacy_ids, 'steps': 0, 'failed': 0, 'records': 0, 'status': 'completed'}
+
+    def report(**counters):
+        for key in ('steps', 'failed', 'records'):
+            stats[key] += counters.get(key, 0)
+        if progress is not None:
+            progress.put(counters)
+
+    def fetch(endpoint, idnats, dt1='', dt2=''):
+        params = {'password': api_password, 'Idnats': idnats}
+        if dt1:
+            params.update({'dt1': dt1, 'dt2': dt2})
+        result = periods.winpharma_result(http, f"https://{WINPHARMA_HOST}/ApiWp/{api_url}/{endpoint}", params,
+                                          cache=cache)
+        if result.status not in ('ok', 'empty', 'late'):
+            logger.warning(f"{endpoint} {idnats} {dt1}-{dt2}: {result.status} {result.error}")
+        report(size=result.size)
+        return result
+
+    def import_data(stream, ids, data):
+        try:
+            _process(stream, ids, data, bulk_load)
+            return True
+        except Exception:
+            logger.error(f"Import of {stream} failed for {','.join(ids)}: {traceback.format_exc()}")
+            return False
+
+    try:
+        for stream in streams:
+            endpoint = STREAMS[stream][0]
+
+            if stream == 'products':
+                pending = checkpoint.pending(pharmacy_ids, stream)
+                if not pending:
+                    continue
+                result = fetch(endpoint, ','.join(pending))
+                if result.status in ('ok', 'empty') and import_data(stream, pending, result.data):
+                    checkpoint.mark_done(pending, stream, records=_count_records(result.data, endpoint))
+                    report(steps=len(pending), records=_count_records(result.data, endpoint))
+                else:
+                    # Without products the sales and orders would miss their snapshots
+                    logger.error(f"Products failed for {','.join(pending)}, skipping the batch")
+                    report(failed=count_pending_steps(checkpoint, pharmacy_ids, plan_periods, streams))
+                    stats['status'] = 'products_error'
+                    return stats
+                continue
+
+            window = periods.AdaptiveWindow()
+            for run_ids, run_periods in checkpoint.pending_runs(pharmacy_ids, stream, plan_periods):
+                idnats = ','.join(run_ids)
+                chunks, marked = [], set()
+                windows = periods.fetch_adaptive(
+                    lambda dt1, dt2: fetch(endpoint, idnats, dt1, dt2),
+                    run_periods[0][0], run_periods[-1][1], window, calendar, log=logger.info
+                )
+                for dt1, dt2, result in windows:
+                    if result.status == 'ok':
+                        if import_data(stream, run_ids, result.data):
+                            report(records=_count_records(result.data, endpoint))
+                        else:
+                            result = result._replace(status='failed', error='import')
+                    chunks.append((dt1, dt2, result))
+
+                    for period in periods.covered_periods(run_periods, chunks):
+                        if period not in marked:
+                            marked.add(period)
+                            checkpoint.mark_done(run_ids, stream, *period)
+                            report(steps=len(run_ids))
+
+                report(failed=len(run_ids) * (len(run_periods) - len(marked)))
+    finally:
+        if cache:
+            cache.log_stats(logger.info)
+        http.close()
+        connections.close_all()
+
+    return stats
+
+
+def run_backfill(pharmacy_ids, start, end, api_url, api_password, streams=tuple(STREAMS), batch_size=10,
+                 workers=4, rate_per_second=2.0, checkpoint_path='winpharma_backfill_checkpoint.jsonl',
+                 progress_interval=10, cache_dir=None, cache_ttl_hours=0, refresh=False, bulk_load=False,
+                 defer_indexes_until_end=False, log=logger.info):
+    """
+    Runs the WinPharma historical backfill inside this Django project.
+
+    It follows the same fetch plan as recup_multi_pharmacies.py (Idnats batches, monthly
+    checkpoint periods, adaptive windows, resumable checkpoint), but each window goes
+    straight to winpharma_historical instead of being POSTed to our own API. There is no
+    JSON re-serialisation, HTTP timeout or upload size limit. Batches run in `workers`
+    processes, which share the request rate to WinPharma.
+
+    Args:
+        pharmacy_ids: Pharmacies (id_nat) to backfill; they must share the credentials.
+        start, end: Date range (date, datetime or YYYY-MM-DD).
+        api_url, api_password: WinPharma credentials.
+        streams: Streams to import, in order.
+        batch_size (int): Pharmacies per API call.
+        workers (int): Worker processes.
+        rate_per_second (float): Total request rate allowed to WinPharma.
+        checkpoint_path (str): JSON Lines checkpoint file; delete it to start over.
+        progress_interval (int): Seconds between throughput reports.
+        cache_dir (str): Optional on-disk cache of vendor responses (see lambda/shared/response_cache.py),
+            so a failed or tweaked import can be replayed without downloading again.
+        cache_ttl_hours (float): Age after which cached responses are downloaded again (0 = never).
+        refresh (bool): Ignore cached responses and overwrite them.
+        bulk_load (bool): Load snapshots, sales and order lines through staging tables
+            (common.bulk_upsert) and ANALYZE the loaded tables at the end.
+        defer_indexes_until_end (bool): With bulk_load, drop the secondary indexes of the loaded
+            tables during the run and rebuild them once at the end. Queries on these tables are
+            slow meanwhile, so keep it for maintenance windows.
+        log: Logging callable for progress reports.
+
+    Returns:
+        dict: Counters of the run.
+    """
+    streams = [stream for stream in STREAMS if stream in streams]
+    plan_periods = periods.monthly_periods(start, end)
+    checkpoint = backfill.CheckpointStore(checkpoint_path)
+    batches = [
+        batch for batch in build_batches(list(pharmacy_ids), batch_size)
+        if count_pending_steps(checkpoint, batch, plan_periods, streams)
+    ]
+    pending_steps = sum(count_pending_steps(checkpoint, batch, plan_periods, streams) for batch in batches)
+    workers = max(1, min(workers, len(batches) or 1))
+    log(f"{len(plan_periods)} periods, {len(batches)} batches, {pending_steps} pending steps, {workers} workers")
+
+    cache_options = {
+        'directory': cache_dir, 'ttl_seconds': cache_ttl_hours * 3600, 'refresh': refresh
+    } if cache_dir else None
+
+    totals = {'batches': len(batches), 'steps': 0, 'failed': 0, 'records': 0, 'failed_batches': []}
+    bulk_models = [model for stream in streams for model in BULK_MODELS[stream]]
+    index_file = f"{checkpoint_path}.indexes.json"
+
+    try:
+        if not batches:
+            return totals
+        if bulk_load and defer_indexes_until_end:
+            defer_indexes(bulk_models, index_file)
+        _run_batches(batches, plan_periods, streams, api_url, api_password, checkpoint_path, workers,
+                     rate_per_second, pending_steps, progress_interval, cache_options, bulk_load, totals, log)
+    finally:
+        # Also rebuilds the indexes left dropped by an interrupted run
+        restore_deferred_indexes(index_file, log)
+
+    if bulk_load:
+        log(f"Analyzing {', '.join(model._meta.db_table for model in bulk_models)}")
+        common.analyze(*bulk_models)
+    return totals
+
+
+def _run_batches(batches, plan_periods, streams, api_url, api_password, checkpoint_path, workers,
+                 rate_per_second, pending_steps, progress_interval, cache_options, bulk_load, totals, log):
+    """Runs the batches in worker processes and adds their counters to totals."""
+    # Worker processes must not inherit the parent's database connections
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    with context.Manager() as manager, \
+            backfill.ThroughputMeter(pending_steps, interval=progress_interval, log=log) as meter:
+        progress = manager.Queue()
+
+        def drain():
+            while (counters := progress.get()) is not None:
+                meter.add(**counters)
+
+        drainer = threading.Thread(target=drain, name='backfill-progress', daemon=True)
+        drainer.start()
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = {
+                    executor.submit(run_batch, batch, plan_periods, streams, api_url, api_password, checkpoint_path,
+                                    rate_per_second / workers if rate_per_second else None, progress,
+                                    cache_options, bulk_load): batch
+                    for batch in batches
+                }
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    try:
+                        stats = future.result()
+                    except Exception as e:
+                        logger.error(f"Batch {','.join(batch)} crashed: {e}")
+                        totals['failed_batches'].append(batch)
+                        continue
+                    for key in ('steps', 'failed', 'records'):
+                        totals[key] += stats[key]
+                    if stats['status'] != 'completed':
+                        totals['failed_batches'].append(batch)
+        finally:
+            progress.put(None)
+            drainer.join()
@@ -1,5 +1,5 @@
 from datetime import date
-from decimal import Decimal, ROUND_HALF_UP
+from decimal import Decimal
 import logging
 from typing import Any, Dict, List, Set
 
@@ -8,56 +8,37 @@ from django.db.models import OuterRef, Subquery, F, Window
 from django.db.models.functions import RowNumber
 
 from data.models import GlobalProduct, InternalProduct, ProductOrder, Supplier, Order, Sales, InventorySnapshot
-from data.services import common
+from data.services import columnar, common, schemas
 
 logger = logging.getLogger(__name__)
 
 
-def process_product(pharmacy, data):
+def process_product(pharmacy, data, bulk_load=False):
     """
     Process WinPharma NEW API product data for historical imports.
     Identical to winpharma_new.py since products don't have date aggregation issues.
+    With bulk_load, inventory snapshots are merged through common.bulk_upsert (backfills).
     
     Expected data format from new API:
     [{"cip_pharma": "062044623", "produits": [{"ProdId": 123, "Nom": "...", "Code13Ref": "...", "Stock": 5, "PrixTTC": 10.50, "PrixMP": 9.20}]}]
     """
-    # Extract products from the new API wrapper structure
-    if not data or not isinstance(data, list) or len(data) == 0:
-        logger.warning("No data or invalid data structure received")
-        return {"products": [], "snapshots": []}
-    
-    pharmacy_data = data[0]  # First element contains the pharmacy data
-    products_raw = pharmacy_data.get('produits', [])
-    
+    result = {"products": [], "snapshots": []}
+    for block_pharmacy, pharmacy_data in common.iter_pharmacy_blocks(pharmacy, data):
+        block_result = _process_pharmacy_products(block_pharmacy, pharmacy_data.get('produits', []), bulk_load)
+        result["products"].extend(block_result["products"])
+        result["snapshots"].extend(block_result["snapshots"])
+    return result
+
+
+def _process_pharmacy_products(pharmacy, products_raw, bulk_load=False):
+    """Processes the 'produits' list of a single pharmacy wrapper (see process_product)."""
     logger.info(f"[HISTORICAL] Processing {len(products_raw)} products for pharmacy {pharmacy.id_nat}")
     
-    preprocessed_data = []
-    for obj in products_raw:
-        try:
-            # Map new API fields to our internal structure
-            prod_id = obj.get('ProdId')
-            if not prod_id or int(prod_id) < 0:
-                continue
-                
-            # Note: TVA will be retrieved from GlobalProduct
-            preprocessed_data.append({
-                'product_id': str(prod_id),
-                'name': obj.get('Nom', ''),
-                'code_13_ref': obj.get('Code13Ref') or None,
-                'stock': common.clamp(int(obj.get('Stock', 0)), -32768, 32767),
-                'price_with_tax': min(
-                    Decimal(str(obj.get('PrixTTC', 0))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
-                    Decimal('99999999.99')
-                ),
-                'weighted_average_price': min(
-                    Decimal(str(obj.get('PrixMP', 0))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
-                    Decimal('99999999.99')
-                ),
-            })
-
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Error preprocessing data for product {obj.get('ProdId', 'unknown')}: {e}")
-            continue
+    # Note: TVA will be retrieved from GlobalProduct
+    preprocessed_data = columnar.normalize_products(
+        products_raw, id_field='ProdId', name_field='Nom', code_field='Code13Ref', stock_field='Stock',
+        price_field='PrixTTC', wap_field='PrixMP'
+    )
 
     if not preprocessed_data:
         logger.info("No valid products to process")
@@ -124,7 +105,7 @@ def process_product(pharmacy, data):
             partition_by=F('product_id'),
             order_by=F('date').desc()
         )
-    ).filter(row_number=1).values('product_id', 'stock', 'price_with_tax', 'weighted_average_price')
+    ).filter(row_number=1).values('product_id', 'stock', 'price_with_tax_cents', 'weighted_average_price_cents')
 
     # Create a mapping of the latest snapshots by internal_id
     latest_snapshots_map = {snapshot['product_id']: snapshot for snapshot in latest_snapshots}
@@ -143,117 +124,53 @@ def process_product(pharmacy, data):
         needs_update = (
                 not last_snapshot or
                 last_snapshot['stock'] != obj['stock'] or
-                last_snapshot['price_with_tax'] != obj['price_with_tax'] or
-                last_snapshot['weighted_average_price'] != obj['weighted_average_price']
+                last_snapshot['price_with_tax_cents'] != obj['price_with_tax_cents'] or
+                last_snapshot['weighted_average_price_cents'] != obj['weighted_average_price_cents']
         )
 
         if needs_update:
             inventory_snapshots_data.append({
                 'product_id': product.id,
                 'stock': obj['stock'],
-                'price_with_tax': obj['price_with_tax'],
-                'weighted_average_price': obj['weighted_average_price'],
+                'price_with_tax_cents': obj['price_with_tax_cents'],
+                'weighted_average_price_cents': obj['weighted_average_price_cents'],
                 'date': date.today()
             })
 
     # Bulk create InventorySnapshot instances
     if inventory_snapshots_data:
-        common.bulk_process(
+        (common.bulk_upsert if bulk_load else common.bulk_process)(
             model=InventorySnapshot,
             data=inventory_snapshots_data,
             unique_fields=['product_id', 'date'],
-            update_fields=['stock', 'price_with_tax', 'weighted_average_price']
+            update_fields=['stock', 'price_with_tax_cents', 'weighted_average_price_cents']
         )
 
     logger.info(f"[HISTORICAL] Successfully processed {len(products)} products, {len(inventory_snapshots_data)} snapshots")
     return {"products": products, "snapshots": inventory_snapshots_data}
 
 
-def process_order(pharmacy, data):
+def process_order(pharmacy, data, bulk_load=False):
     """
     Process WinPharma NEW API order data for historical imports.
     Identical to winpharma_new.py since orders don't have the same aggregation issues as sales.
+    With bulk_load, order lines are merged through common.bulk_upsert (backfills).
     """
-    # Extract orders from the new API wrapper structure
-    if not data or not isinstance(data, list) or len(data) == 0:
-        logger.warning("No data or invalid data structure received")
-        return {"suppliers": [], "products": [], "orders": [], "product_orders": []}
-    
-    pharmacy_data = data[0]  # First element contains the pharmacy data
-    orders_raw = pharmacy_data.get('achats', [])
-    
+    result = {"suppliers": [], "products": [], "orders": [], "product_orders": []}
+    for block_pharmacy, pharmacy_data in common.iter_pharmacy_blocks(pharmacy, data):
+        block_result = _process_pharmacy_orders(block_pharmacy, pharmacy_data.get('achats', []), bulk_load)
+        result["suppliers"].extend(block_result["suppliers"])
+        result["products"].extend(block_result["products"])
+        result["orders"].extend(block_result["orders"])
+        result["product_orders"].extend(block_result["product_orders"])
+    return result
+
+
+def _process_pharmacy_orders(pharmacy, orders_raw, bulk_load=False):
+    """Processes the 'achats' list of a single pharmacy wrapper (see process_order)."""
     logger.info(f"[HISTORICAL] Processing {len(orders_raw)} orders for pharmacy {pharmacy.id_nat}")
     
-    preprocessed_data = []
-    for obj in orders_raw:
-        try:
-            # Map new API fields to our internal structure
-            order_id = obj.get('id')
-            if not order_id:
-                continue
-                
-            supplier_id = obj.get('codeFourn')
-            if not supplier_id:
-                raise ValueError("Missing 'codeFourn'")
-                
-            supplier_name = obj.get('nomFourn', supplier_id)
-            
-            # Map channel to step (semantic change + convert to integer)
-            channel = obj.get('channel', '')
-            # Convertir le channel string en step integer pour compatibilité DB
-            channel_to_step = {
-                'pml': 1,
-                'email': 2, 
-                'autre': 3,
-                '': 0
-            }
-            step = channel_to_step.get(channel.lower(), 0)
-            
-            sent_date = common.parse_date(obj.get('dateEnvoi'))
-            delivery_date = common.parse_date(obj.get('dateLivraison'), False)
-
-            products = []
-            for line in obj.get('lignes', []):
-                try:
-                    prod_id = line.get('prodId')
-                    if not prod_id or int(prod_id) < 0:
-                        continue
-
-                    product_id = str(prod_id)
-                    qte_c = common.clamp(int(line.get('qteC', 0)), -32768, 32767)  # Commanded quantity
-                    qte_r = common.clamp(int(line.get('qteR', 0)), -32768, 32767)  # Received quantity
-                    qte_ug = common.clamp(int(line.get('qteUG', 0)), -32768, 32767)  # Free units
-                    qte_ec = common.clamp(int(line.get('qteEC', 0)), -32768, 32767)  # Exchange quantity
-                    
-                    # Calculate missing fields based on available data
-                    qte_a = qte_c  # Expected quantity = commanded quantity
-                    qte_ar = max(0, qte_c - qte_r)  # Quantity to receive = commanded - received
-
-                    products.append({
-                        'product_id': product_id,
-                        'qte': qte_c,  # Commanded quantity
-                        'qte_r': qte_r,  # Received quantity
-                        'qte_a': qte_a,  # Expected quantity (calculated)
-                        'qte_ug': qte_ug,  # Free units
-                        'qte_ec': qte_ec,  # Exchange quantity
-                        'qte_ar': qte_ar,  # Quantity to receive (calculated)
-                    })
-                except (ValueError, TypeError, KeyError) as e:
-                    logger.warning(f"Error preprocessing product in order {order_id}: {e}")
-                    continue
-
-            preprocessed_data.append({
-                'order_id': order_id,
-                'supplier_id': supplier_id,
-                'supplier_name': supplier_name,
-                'step': step,  # Channel mapped to step
-                'sent_date': sent_date,
-                'delivery_date': delivery_date,
-                'products': products
-            })
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Error preprocessing order {obj.get('id', 'unknown')}: {e}")
-            continue
+    preprocessed_data = schemas.decode_new_api_orders(orders_raw)
 
     if not preprocessed_data:
         logger.info("No valid orders to process")
@@ -264,12 +181,12 @@ def process_order(pharmacy, data):
     seen_suppliers = set()
 
     for obj in preprocessed_data:
-        supplier_key = (pharmacy.id, obj['supplier_id'])
+        supplier_key = (pharmacy.id, obj.supplier_id)
         if supplier_key not in seen_suppliers:
             supplier_data.append({
                 'pharmacy_id': pharmacy.id,
-                'code_supplier': obj['supplier_id'],
-                'name': obj['supplier_name']
+                'code_supplier': obj.supplier_id,
+                'name': obj.supplier_name
             })
             seen_suppliers.add(supplier_key)
 
@@ -289,7 +206,7 @@ def process_order(pharmacy, data):
     suppliers_map = {supplier.code_supplier: supplier for supplier in suppliers}
 
     # Extract all product IDs from the order lines
-    product_ids = {line['product_id'] for obj in preprocessed_data for line in obj.get('products', [])}
+    product_ids = {line.product_id for obj in preprocessed_data for line in obj.lines}
 
     # Retrieve existing InternalProduct instances for the pharmacy
     existing_products = InternalProduct.objects.filter(
@@ -336,15 +253,15 @@ def process_order(pharmacy, data):
     # Prepare order data for bulk processing
     order_data = [
         {
-            'internal_id': obj['order_id'],
+            'internal_id': obj.order_id,
             'pharmacy_id': pharmacy.id,
-            'supplier_id': suppliers_map[obj['supplier_id']].id,
-            'step': obj['step'],  # Now contains channel value
-            'sent_date': obj['sent_date'],
-            'delivery_date': obj['delivery_date'],
-            'created_at': obj['sent_date'] or obj['delivery_date'] or date.today(),
+            'supplier_id': suppliers_map[obj.supplier_id].id,
+            'step': obj.step,  # Now contains channel value
+            'sent_date': obj.sent_date,
+            'delivery_date': obj.delivery_date,
+            'created_at': obj.sent_date or obj.delivery_date or date.today(),
         }
-        for obj in preprocessed_data if obj['supplier_id'] in suppliers_map
+        for obj in preprocessed_data if obj.supplier_id in suppliers_map
     ]
 
     # Create or update orders
@@ -365,31 +282,31 @@ def process_order(pharmacy, data):
     # Prepare ProductOrder data for bulk processing
     product_order_data = []
     for obj in preprocessed_data:
-        internal_id = obj['order_id']
+        internal_id = obj.order_id
         order = order_map.get(internal_id)
         
         if not order:
             continue
             
-        for line in obj['products']:
-            product = internal_products_map.get(line['product_id'])
+        for line in obj.lines:
+            product = internal_products_map.get(line.product_id)
             if not product:
                 continue
 
             product_order_data.append({
                 'product': product,
                 'order': order,
-                'qte': line['qte'],
-                'qte_r': line['qte_r'],
-                'qte_a': line['qte_a'],
-                'qte_ug': line['qte_ug'],
-                'qte_ec': line['qte_ec'],
-                'qte_ar': line['qte_ar']
+                'qte': line.qte,
+                'qte_r': line.qte_r,
+                'qte_a': line.qte_a,
+                'qte_ug': line.qte_ug,
+                'qte_ec': line.qte_ec,
+                'qte_ar': line.qte_ar
             })
 
     # Create or update ProductOrder instances
     try:
-        common.bulk_process(
+        (common.bulk_upsert if bulk_load else common.bulk_process)(
             model=ProductOrder,
             data=product_order_data,
             unique_fields=['order', 'product'],
@@ -408,70 +325,51 @@ def process_order(pharmacy, data):
     }
 
 
-def process_sales(pharmacy, data):
+def process_sales(pharmacy, data, bulk_load=False):
     """
     Process sales records for a pharmacy from NEW API - VERSION AVEC RÉCUPÉRATION TVA.
     
     🆕 NOUVEAUTÉ: Récupération de la TVA depuis les données de ventes
+    With bulk_load, sales are merged through common.bulk_upsert (backfills).
     
     Expected data format from new API:
     [{"cip_pharma": "062044623", "ventes": [{"id": 123, "heure": "2025-05-20T08:32:29", 
       "lignes": [{"prodId": 123, "qte": 1, "tva": 2.10, "prix": 4.03}]}]}]
     """
-    # Extract sales from the new API wrapper structure
-    if not data or not isinstance(data, list) or len(data) == 0:
-        logger.warning("No data or invalid data structure received")
-        return
-    
-    pharmacy_data = data[0]  # First element contains the pharmacy data
-    sales_raw = pharmacy_data.get('ventes', [])
-    
+    for block_pharmacy, pharmacy_data in common.iter_pharmacy_blocks(pharmacy, data):
+        _process_pharmacy_sales(block_pharmacy, pharmacy_data.get('ventes', []), bulk_load)
+
+
+def _process_pharmacy_sales(pharmacy, sales_raw, bulk_load=False):
+    """Processes the 'ventes' list of a single pharmacy wrapper (see process_sales)."""
     logger.info(f"[SALES] Processing {len(sales_raw)} sales records for pharmacy {pharmacy.id_nat}")
     
     # 🆕 ÉTAPE 1: Extraire les TVA depuis les lignes de ventes
     product_tva_map = {}  # {product_id: tva_value}
     
-    # 🔧 ÉTAPE 2: Préprocessing avec récupération TVA
-    preprocessed_data = []
+    # 🔧 ÉTAPE 2: Lignes (produit, date, quantité) avec récupération TVA
+    lines = []
     for sale in sales_raw:
-        try:
-            sale_time = sale.get('heure')
-            sale_date = common.parse_date(sale_time, False)
-            
-            if not sale_date:
-                logger.warning(f"Invalid sale date: {sale_time}")
+        sale_time = sale.get('heure')
+        for line in sale.get('lignes', []):
+            prod_id = line.get('prodId')
+            lines.append((prod_id, sale_time, line.get('qte', 0)))
+
+            # 🆕 RÉCUPÉRER LA TVA de cette ligne de vente (TVA en pourcentage, ex: 2.10 pour 2.1%)
+            tva_value = line.get('tva', 0)
+            if not prod_id or not isinstance(tva_value, (int, float)):
                 continue
-                
-            for line in sale.get('lignes', []):
-                prod_id = line.get('prodId')
-                if not prod_id or int(prod_id) < 0:
-                    continue
-                
-                product_id_str = str(prod_id)
-                
-                # 🆕 RÉCUPÉRER LA TVA de cette ligne de vente
-                tva_value = line.get('tva', 0)  # TVA en pourcentage (ex: 2.10 pour 2.1%)
-                
-                # Stocker la TVA pour ce produit (prendre la plus récente)
-                if product_id_str not in product_tva_map or tva_value > 0:
-                    product_tva_map[product_id_str] = tva_value
-                    
-                preprocessed_data.append({
-                    'product_id': product_id_str,
-                    'date': sale_date,
-                    'qte': int(line.get('qte', 0)),
-                    'tva': tva_value  # 🆕 Ajouter la TVA
-                })
-                
-        except (ValueError, TypeError, KeyError) as e:
-            logger.warning(f"Error preprocessing sale record {sale.get('id', 'unknown')}: {e}")
-            continue
+            # Stocker la TVA pour ce produit (prendre la plus récente)
+            product_id_str = str(prod_id)
+            if product_id_str not in product_tva_map or tva_value > 0:
+                product_tva_map[product_id_str] = tva_value
 
-    if not preprocessed_data:
+    aggregated = columnar.aggregate_sales(lines)
+    if aggregated.empty:
         logger.info("No valid sales to process")
         return
 
-    logger.info(f"[SALES] Preprocessed {len(preprocessed_data)} sale lines")
+    logger.info(f"[SALES] Preprocessed {len(lines)} sale lines")
     logger.info(f"[SALES] Found TVA data for {len(product_tva_map)} products")
 
     # 🆕 ÉTAPE 3: Mettre à jour les TVA des produits internes
@@ -511,8 +409,8 @@ def process_sales(pharmacy, data):
         else:
             logger.info("[SALES] No products needed TVA update")
 
-    # 🔧 ÉTAPE 4: Traitement des ventes (reste identique)
-    product_ids = {obj['product_id'] for obj in preprocessed_data}
+    # 🔧 ÉTAPE 4: Traitement des ventes, agrégées par (product_id, date)
+    product_ids = set(aggregated['product_id'])
 
     latest_snapshots = (
         InventorySnapshot.objects
@@ -525,38 +423,10 @@ def process_sales(pharmacy, data):
     )
     internal_products_map = {str(product.internal_id): product.latest_snapshot_id for product in internal_products}
 
-    # Agrégation des quantités par (product_id, date)
-    aggregated_sales = {}
-    
-    for obj in preprocessed_data:
-        product_id = obj['product_id']
-        sale_date = obj['date']
-        qte = obj['qte']
-        
-        key = (product_id, sale_date)
-        
-        if key not in aggregated_sales:
-            aggregated_sales[key] = qte
-        else:
-            aggregated_sales[key] += qte
-
-    logger.info(f"[SALES] Aggregated into {len(aggregated_sales)} unique (product, date) combinations")
+    logger.info(f"[SALES] Aggregated into {len(aggregated)} unique (product, date) combinations")
 
     # Construction des enregistrements Sales
-    sales_data = []
-    missing_snapshots = 0
-    
-    for (product_id, sale_date), total_qte in aggregated_sales.items():
-        snapshot_id = internal_products_map.get(product_id)
-        if not snapshot_id:
-            missing_snapshots += 1
-            continue
-            
-        sales_data.append({
-            'product_id': snapshot_id,
-            'quantity': common.clamp(total_qte, -32768, 32767),
-            'date': sale_date,
-        })
+    sales_data, missing_snapshots = columnar.sales_rows(aggregated, internal_products_map)
 
     if missing_snapshots > 0:
         logger.warning(f"[SALES] {missing_snapshots} sales skipped due to missing product snapshots")
@@ -564,7 +434,7 @@ def process_sales(pharmacy, data):
     # Insertion en base
     if sales_data:
         try:
-            result = common.bulk_process(
+            result = (common.bulk_upsert if bulk_load else common.bulk_process)(
                 model=Sales,
                 data=sales_data,
                 unique_fields=['product_id', 'date'],
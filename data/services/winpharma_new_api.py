@@ -1,5 +1,4 @@
 from datetime import date
-from decimal import Decimal, ROUND_HALF_UP
 import logging
 
 from django.db import transaction
@@ -7,7 +6,7 @@ from django.db.models import OuterRef, Subquery, F, Window
 from django.db.models.functions import RowNumber
 
 from data.models import GlobalProduct, InternalProduct, ProductOrder, Supplier, Order, Sales, InventorySnapshot
-from data.services import common
+from data.services import aggregated_sales, columnar, common, schemas
 
 logger = logging.getLogger(__name__)
 
@@ -20,50 +19,29 @@ def process_product(pharmacy, data):
     [{"cip_pharma": "062044623", "produits": [{"ProdId": 123, "Nom": "...", "Code13Ref": "...", "Stock": 5, "PrixTTC": 10.50, "PrixMP": 9.20}]}]
 
     Args:
-        pharmacy: Pharmacy instance associated with the data.
-        data: Response from new API - list with pharmacy data wrapper.
+        pharmacy: Pharmacy from the Pharmacy-id header, or None for multi-pharmacy payloads.
+        data: Response from new API - one wrapper per pharmacy, each routed by its cip_pharma.
 
     Returns:
         A dictionary containing lists of created products and snapshots.
     """
-    # Extract products from the new API wrapper structure
-    if not data or not isinstance(data, list) or len(data) == 0:
-        logger.warning("No data or invalid data structure received")
-        return {"products": [], "snapshots": []}
-    
-    pharmacy_data = data[0]  # First element contains the pharmacy data
-    products_raw = pharmacy_data.get('produits', [])
-    
+    result = {"products": [], "snapshots": []}
+    for block_pharmacy, pharmacy_data in common.iter_pharmacy_blocks(pharmacy, data):
+        block_result = _process_pharmacy_products(block_pharmacy, pharmacy_data.get('produits', []))
+        result["products"].extend(block_result["products"])
+        result["snapshots"].extend(block_result["snapshots"])
+    return result
+
+
+def _process_pharmacy_products(pharmacy, products_raw):
+    """Processes the 'produits' list of a single pharmacy wrapper (see process_product)."""
     logger.info(f"Processing {len(products_raw)} products for pharmacy {pharmacy.id_nat}")
     
-    preprocessed_data = []
-    for obj in products_raw:
-        try:
-            # Map new API fields to our internal structure
-            prod_id = obj.get('ProdId')
-            if not prod_id or int(prod_id) < 0:
-                continue
-                
-            # Note: No TVA field in new API, will be set to None
-            preprocessed_data.append({
-                'product_id': str(prod_id),
-                'name': obj.get('Nom', ''),
-                'code_13_ref': obj.get('Code13Ref') or None,
-                'TVA': None,  # Not available in new API
-                'stock': common.clamp(int(obj.get('Stock', 0)), -32768, 32767),
-                'price_with_tax': min(
-                    Decimal(str(obj.get('PrixTTC', 0))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
-                    Decimal('99999999.99')
-                ),
-                'weighted_average_price': min(
-                    Decimal(str(obj.get('PrixMP', 0))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
-                    Decimal('99999999.99')
-                ),
-            })
-
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Error preprocessing data for product {obj.get('ProdId', 'unknown')}: {e}")
-            continue
+    # Note: No TVA field in new API, TVA stays None
+    preprocessed_data = columnar.normalize_products(
+        products_raw, id_field='ProdId', name_field='Nom', code_field='Code13Ref', stock_field='Stock',
+        price_field='PrixTTC', wap_field='PrixMP'
+    )
 
     if not preprocessed_data:
         logger.info("No valid products to process")
@@ -124,7 +102,7 @@ def process_product(pharmacy, data):
             partition_by=F('product_id'),
             order_by=F('date').desc()
         )
-    ).filter(row_number=1).values('product_id', 'stock', 'price_with_tax', 'weighted_average_price')
+    ).filter(row_number=1).values('product_id', 'stock', 'price_with_tax_cents', 'weighted_average_price_cents')
 
     # Create a mapping of the latest snapshots by internal_id
     latest_snapshots_map = {snapshot['product_id']: snapshot for snapshot in latest_snapshots}
@@ -143,16 +121,16 @@ def process_product(pharmacy, data):
         needs_update = (
                 not last_snapshot or
                 last_snapshot['stock'] != obj['stock'] or
-                last_snapshot['price_with_tax'] != obj['price_with_tax'] or
-                last_snapshot['weighted_average_price'] != obj['weighted_average_price']
+                last_snapshot['price_with_tax_cents'] != obj['price_with_tax_cents'] or
+                last_snapshot['weighted_average_price_cents'] != obj['weighted_average_price_cents']
         )
 
         if needs_update:
             inventory_snapshots_data.append({
                 'product_id': product.id,
                 'stock': obj['stock'],
-                'price_with_tax': obj['price_with_tax'],
-                'weighted_average_price': obj['weighted_average_price'],
+                'price_with_tax_cents': obj['price_with_tax_cents'],
+                'weighted_average_price_cents': obj['weighted_average_price_cents'],
                 'date': date.today()
             })
 
@@ -162,7 +140,7 @@ def process_product(pharmacy, data):
             model=InventorySnapshot,
             data=inventory_snapshots_data,
             unique_fields=['product_id', 'date'],
-            update_fields=['stock', 'price_with_tax', 'weighted_average_price']
+            update_fields=['stock', 'price_with_tax_cents', 'weighted_average_price_cents']
         )
 
     logger.info(f"Successfully processed {len(products)} products, {len(inventory_snapshots_data)} snapshots")
@@ -178,112 +156,43 @@ def process_order(pharmacy, data):
       "dateEnvoi": "2021-10-25T00:00:00", "channel": "pml", "lignes": [{"prodId": 123, "qteC": 2, "qteR": 2, "qteUG": 0, "qteEC": 0}]}]}]
 
     Args:
-        pharmacy: Pharmacy instance associated with the data.
-        data: Response from new API - list with pharmacy data wrapper.
+        pharmacy: Pharmacy from the Pharmacy-id header, or None for multi-pharmacy payloads.
+        data: Response from new API - one wrapper per pharmacy, each routed by its cip_pharma.
 
     Returns:
         dict: A dictionary containing lists of created suppliers, products, orders, and product-order associations.
     """
-    # Extract orders from the new API wrapper structure
-    if not data or not isinstance(data, list) or len(data) == 0:
-        logger.warning("No data or invalid data structure received")
-        return {"suppliers": [], "products": [], "orders": [], "product_orders": []}
-    
-    pharmacy_data = data[0]  # First element contains the pharmacy data
-    orders_raw = pharmacy_data.get('achats', [])
-    
+    result = {"suppliers": [], "products": [], "orders": [], "product_orders": []}
+    for block_pharmacy, pharmacy_data in common.iter_pharmacy_blocks(pharmacy, data):
+        block_result = _process_pharmacy_orders(block_pharmacy, pharmacy_data.get('achats', []))
+        result["suppliers"].extend(block_result["suppliers"])
+        result["products"].extend(block_result["products"])
+        result["orders"].extend(block_result["orders"])
+        result["product_orders"].extend(block_result["product_orders"])
+    return result
+
+
+def _process_pharmacy_orders(pharmacy, orders_raw):
+    """Processes the 'achats' list of a single pharmacy wrapper (see process_order)."""
     logger.info(f"Processing {len(orders_raw)} orders for pharmacy {pharmacy.id_nat}")
     
-    preprocessed_data = []
-    for obj in orders_raw:
-        try:
-            # Map new API fields to our internal structure
-            order_id = obj.get('id')
-            if not order_id:
-                continue
-                
-            supplier_id = obj.get('codeFourn')
-            if not supplier_id:
-                raise ValueError("Missing 'codeFourn'")
-                
-            supplier_name = obj.get('nomFourn', supplier_id)
-            
-            # Map channel to step (semantic change + convert to integer)
-            channel = obj.get('channel', '')
-            # Convertir le channel string en step integer pour compatibilité DB
-            channel_to_step = {
-                'pml': 1,
-                'email': 2, 
-                'autre': 3,
-                '': 0
-            }
-            step = channel_to_step.get(channel.lower(), 0)
-            
-            sent_date = common.parse_date(obj.get('dateEnvoi'))
-            delivery_date = common.parse_date(obj.get('dateLivraison'), False)
-
-            products = []
-            for line in obj.get('lignes', []):
-                try:
-                    prod_id = line.get('prodId')
-                    if not prod_id or int(prod_id) < 0:
-                        continue
-
-                    product_id = str(prod_id)
-                    qte_c = common.clamp(int(line.get('qteC', 0)), -32768, 32767)  # Commanded quantity
-                    qte_r = common.clamp(int(line.get('qteR', 0)), -32768, 32767)  # Received quantity
-                    qte_ug = common.clamp(int(line.get('qteUG', 0)), -32768, 32767)  # Free units
-                    qte_ec = common.clamp(int(line.get('qteEC', 0)), -32768, 32767)  # Exchange quantity
-                    
-                    # Calculate missing fields based on available data
-                    qte_a = qte_c  # Expected quantity = commanded quantity
-                    qte_ar = max(0, qte_c - qte_r)  # Quantity to receive = commanded - received
-
-                    products.append({
-                        'product_id': product_id,
-                        'qte': qte_c,  # Commanded quantity
-                        'qte_r': qte_r,  # Received quantity
-                        'qte_a': qte_a,  # Expected quantity (calculated)
-                        'qte_ug': qte_ug,  # Free units
-                        'qte_ec': qte_ec,  # Exchange quantity
-                        'qte_ar': qte_ar,  # Quantity to receive (calculated)
-                        # New fields available in new API (could be used later)
-                        'prix': line.get('prix', 0),  # Initial price
-                        'remise_final': line.get('remiseFinal', 0),  # Final discount
-                    })
-                except (ValueError, TypeError, KeyError) as e:
-                    logger.warning(f"Error preprocessing product in order {order_id}: {e}")
-                    continue
-
-            preprocessed_data.append({
-                'order_id': order_id,
-                'supplier_id': supplier_id,
-                'supplier_name': supplier_name,
-                'step': step,  # Channel mapped to step
-                'sent_date': sent_date,
-                'delivery_date': delivery_date,
-                'products': products
-            })
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Error preprocessing order {obj.get('id', 'unknown')}: {e}")
-            continue
+    preprocessed_data = schemas.decode_new_api_orders(orders_raw)
 
     if not preprocessed_data:
         logger.info("No valid orders to process")
         return {"suppliers": [], "products": [], "orders": [], "product_orders": []}
 
-    # Rest of the logic remains the same as original
     # Collect unique supplier codes and prepare supplier data
     supplier_data = []
     seen_suppliers = set()
 
     for obj in preprocessed_data:
-        supplier_key = (pharmacy.id, obj['supplier_id'])
+        supplier_key = (pharmacy.id, obj.supplier_id)
         if supplier_key not in seen_suppliers:
             supplier_data.append({
                 'pharmacy_id': pharmacy.id,
-                'code_supplier': obj['supplier_id'],
-                'name': obj['supplier_name']
+                'code_supplier': obj.supplier_id,
+                'name': obj.supplier_name
             })
             seen_suppliers.add(supplier_key)
 
@@ -303,7 +212,7 @@ def process_order(pharmacy, data):
     suppliers_map = {supplier.code_supplier: supplier for supplier in suppliers}
 
     # Extract all product IDs from the order lines
-    product_ids = {line['product_id'] for obj in preprocessed_data for line in obj.get('products', [])}
+    product_ids = {line.product_id for obj in preprocessed_data for line in obj.lines}
 
     # Retrieve existing InternalProduct instances for the pharmacy
     existing_products = InternalProduct.objects.filter(
@@ -350,14 +259,14 @@ def process_order(pharmacy, data):
     # Prepare order data for bulk processing
     order_data = [
         {
-            'internal_id': obj['order_id'],
+            'internal_id': obj.order_id,
             'pharmacy_id': pharmacy.id,
-            'supplier_id': suppliers_map[obj['supplier_id']].id,
-            'step': obj['step'],  # Now contains channel value
-            'sent_date': obj['sent_date'],
-            'delivery_date': obj['delivery_date'],
+            'supplier_id': suppliers_map[obj.supplier_id].id,
+            'step': obj.step,  # Now contains channel value
+            'sent_date': obj.sent_date,
+            'delivery_date': obj.delivery_date,
         }
-        for obj in preprocessed_data if obj['supplier_id'] in suppliers_map
+        for obj in preprocessed_data if obj.supplier_id in suppliers_map
     ]
 
     # Create or update orders
@@ -378,26 +287,26 @@ def process_order(pharmacy, data):
     # Prepare ProductOrder data for bulk processing
     product_order_data = []
     for obj in preprocessed_data:
-        internal_id = obj['order_id']
+        internal_id = obj.order_id
         order = order_map.get(internal_id)
         
         if not order:
             continue
             
-        for line in obj['products']:
-            product = internal_products_map.get(line['product_id'])
+        for line in obj.lines:
+            product = internal_products_map.get(line.product_id)
             if not product:
                 continue
 
             product_order_data.append({
                 'product': product,
                 'order': order,
-                'qte': line['qte'],
-                'qte_r': line['qte_r'],
-                'qte_a': line['qte_a'],
-                'qte_ug': line['qte_ug'],
-                'qte_ec': line['qte_ec'],
-                'qte_ar': line['qte_ar']
+                'qte': line.qte,
+                'qte_r': line.qte_r,
+                'qte_a': line.qte_a,
+                'qte_ug': line.qte_ug,
+                'qte_ec': line.qte_ec,
+                'qte_ar': line.qte_ar
             })
 
     # Create or update ProductOrder instances
@@ -430,47 +339,33 @@ def process_sales(pharmacy, data):
       "lignes": [{"prodId": 123, "qte": 1}]}]}]
 
     Args:
-        pharmacy: Pharmacy instance associated with the data.
-        data: Response from new API - list with pharmacy data wrapper.
+        pharmacy: Pharmacy from the Pharmacy-id header, or None for multi-pharmacy payloads.
+        data: Response from new API - one wrapper per pharmacy, each routed by its cip_pharma.
 
     Returns:
         None
     """
-    # Extract sales from the new API wrapper structure
-    if not data or not isinstance(data, list) or len(data) == 0:
-        logger.warning("No data or invalid data structure received")
-        return
-    
-    pharmacy_data = data[0]  # First element contains the pharmacy data
-    sales_raw = pharmacy_data.get('ventes', [])
-    
+    for block_pharmacy, pharmacy_data in common.iter_pharmacy_blocks(pharmacy, data):
+        _process_pharmacy_sales(block_pharmacy, pharmacy_data.get('ventes', []))
+
+
+def _process_pharmacy_sales(pharmacy, sales_raw):
+    """Processes the 'ventes' list of a single pharmacy wrapper (see process_sales)."""
     logger.info(f"Processing {len(sales_raw)} sales records for pharmacy {pharmacy.id_nat}")
     
-    preprocessed_data = []
-    for sale in sales_raw:
-        try:
-            sale_time = sale.get('heure')
-            for line in sale.get('lignes', []):
-                prod_id = line.get('prodId')
-                if not prod_id or int(prod_id) < 0:
-                    continue
-                    
-                preprocessed_data.append({
-                    'product_id': str(prod_id),
-                    'date': sale_time,  # Date from sale header
-                    'qte': int(line.get('qte', 0))
-                })
-        except (ValueError, TypeError, KeyError) as e:
-            logger.warning(f"Error preprocessing sale record {sale.get('id', 'unknown')}: {e}")
-            continue
+    # One (product, date, quantity) tuple per ticket line, dated by the sale header
+    lines = [
+        (line.get('prodId'), sale.get('heure'), line.get('qte', 0))
+        for sale in sales_raw for line in sale.get('lignes', [])
+    ]
+    aggregated = columnar.aggregate_sales(lines)
 
-    if not preprocessed_data:
+    if aggregated.empty:
         logger.info("No valid sales to process")
         return
 
-    # Rest of the logic remains the same as original
     # Prepare a set of product IDs to process
-    product_ids = {obj['product_id'] for obj in preprocessed_data}
+    product_ids = set(aggregated['product_id'])
 
     latest_snapshots = (
         InventorySnapshot.objects
@@ -482,28 +377,7 @@ def process_sales(pharmacy, data):
     )
     internal_products_map = {str(product.internal_id): product.latest_snapshot_id for product in internal_products}
 
-    aggregated_sales = {}
-    for obj in preprocessed_data:
-        product_id = obj['product_id']
-        day = common.parse_date(obj['date'], False)
-        key = (product_id, day)
-        
-        if key not in aggregated_sales:
-            aggregated_sales[key] = obj['qte']
-        else:
-            aggregated_sales[key] += obj['qte']
-
-    sales_data = []
-    for (product_id, day), total_qte in aggregated_sales.items():
-        snapshot_id = internal_products_map.get(product_id)
-        if not snapshot_id:
-            continue
-            
-        sales_data.append({
-            'product_id': snapshot_id,
-            'quantity': common.clamp(total_qte, -32768, 32767),
-            'date': day,
-        })
+    sales_data, _ = columnar.sales_rows(aggregated, internal_products_map)
 
     # Process sales in bulk
     if sales_data:
@@ -519,4 +393,26 @@ def process_sales(pharmacy, data):
             logger.error(f"Error processing sales: {e}")
             raise
     else:
-        logger.info("No sales data to process")
\ No newline at end of file
+        logger.info("No sales data to process")
+
+
+def process_aggregated_sales(pharmacy, data):
+    """
+    Process sales pre-aggregated per (product, day) by the Lambda.
+
+    Expected data format:
+    [{"cip_pharma": "062044623", "ventes_agregees": [{"product_id": "123", "date": "2025-05-20", "qte": 3}]}]
+
+    Args:
+        pharmacy: Pharmacy from the Pharmacy-id header, or None for multi-pharmacy payloads.
+        data: One wrapper per pharmacy, each routed by its cip_pharma.
+
+    Returns:
+        dict: Counters summed over every pharmacy wrapper.
+    """
+    totals = {"received": 0, "upserted": 0, "missing_snapshots": 0, "invalid": 0}
+    for block_pharmacy, pharmacy_data in common.iter_pharmacy_blocks(pharmacy, data):
+        result = aggregated_sales.process_aggregated_sales(block_pharmacy, pharmacy_data.get('ventes_agregees', []))
+        for key in totals:
+            totals[key] += result[key]
+    return totals
@@ -0,0 +1,12 @@
+import importlib.util
+from pathlib import Path
+
+LAMBDA_DIR = Path(__file__).resolve().parents[2] / 'lambda'
+
+
+def load_lambda_module(relative_path, name):
+    """Imports a Lambda source file by path: the lambda/ folder is not a Python package."""
+    spec = importlib.util.spec_from_file_location(name, LAMBDA_DIR / relative_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
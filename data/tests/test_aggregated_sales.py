@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from data.services import aggregated_sales
+
+PHARMACY = SimpleNamespace(id_nat='062044623')
+
+
+class ProcessAggregatedSalesTests(SimpleTestCase):
+    def test_invalid_product_ids_counted(self):
+        records = [
+            {'product_id': 'ABC', 'date': '2025-05-20', 'qte': 1},
+            {'product_id': -5, 'date': '2025-05-20', 'qte': 1},
+            {'product_id': None, 'date': '2025-05-20', 'qte': 1},
+            {'product_id': '12', 'date': 'not a date', 'qte': 1},
+        ]
+        with self.assertLogs(aggregated_sales.logger, 'WARNING'):
+            result = aggregated_sales.process_aggregated_sales(PHARMACY, records)
+        self.assertEqual(result, {'received': 4, 'upserted': 0, 'missing_snapshots': 0, 'invalid': 4})
+
+    @mock.patch.object(aggregated_sales.common, 'bulk_process')
+    @mock.patch.object(aggregated_sales.InternalProduct.objects, 'filter')
+    def test_valid_ids_still_processed(self, product_filter, bulk_process):
+        product_filter.return_value.annotate.return_value = [SimpleNamespace(internal_id=12, latest_snapshot_id=7)]
+        records = [
+            {'product_id': 'ABC', 'date': '2025-05-20', 'qte': 1},
+            {'product_id': '012', 'date': '2025-05-20', 'qte': 2, 'ttc': 5},
+            {'product_id': 12, 'date': '2025-05-20', 'qte': 1, 'ttc': 2.5},
+        ]
+        with self.assertLogs(aggregated_sales.logger, 'WARNING'):
+            result = aggregated_sales.process_aggregated_sales(PHARMACY, records)
+
+        self.assertEqual(product_filter.call_args.kwargs['internal_id__in'], {'12'})
+        self.assertEqual(result, {'received': 3, 'upserted': 1, 'missing_snapshots': 0, 'invalid': 1})
+        self.assertEqual(bulk_process.call_args.kwargs['data'], [
+            {'product_id': 7, 'quantity': 3, 'date': mock.ANY, 'unit_price_ttc_cents': 250}
+        ])
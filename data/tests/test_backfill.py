@@ -0,0 +1,53 @@
+import json
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from data.tests import load_lambda_module
+
+backfill = load_lambda_module('shared/backfill.py', 'backfill')
+
+
+class CheckpointStoreTests(SimpleTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def test_resume_skips_recorded_steps(self):
+        store = backfill.CheckpointStore(self.path)
+        store.mark_done(['A', 'B'], 'ventes', '2024-01-01', '2024-01-31', records=10)
+
+        resumed = backfill.CheckpointStore(self.path)
+        self.assertTrue(resumed.is_done('A', 'ventes', '2024-01-01', '2024-01-31'))
+        self.assertEqual(resumed.pending(['A', 'B', 'C'], 'ventes', '2024-01-01', '2024-01-31'), ['C'])
+        self.assertEqual(resumed.pending(['A'], 'achats', '2024-01-01', '2024-01-31'), ['A'])
+
+    def test_resume_after_truncated_line(self):
+        store = backfill.CheckpointStore(self.path)
+        store.mark_done(['A'], 'ventes', '2024-01-01', '2024-01-31')
+        # Interrupted while writing the next line
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('{"pharmacy": "B", "stream": "ven')
+
+        resumed = backfill.CheckpointStore(self.path)
+        self.assertTrue(resumed.is_done('A', 'ventes', '2024-01-01', '2024-01-31'))
+        self.assertFalse(resumed.is_done('B', 'ventes', '2024-01-01', '2024-01-31'))
+
+        # New steps start on a line of their own and are read back
+        resumed.mark_done(['B'], 'ventes', '2024-01-01', '2024-01-31')
+        with open(self.path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(json.loads(lines[-1])['pharmacy'], 'B')
+        self.assertTrue(backfill.CheckpointStore(self.path).is_done('B', 'ventes', '2024-01-01', '2024-01-31'))
+
+    def test_pending_runs_group_consecutive_periods(self):
+        store = backfill.CheckpointStore(self.path)
+        store.mark_done(['A'], 'ventes', '2024-02-01', '2024-02-29')
+        periods = [('2024-01-01', '2024-01-31'), ('2024-02-01', '2024-02-29'), ('2024-03-01', '2024-03-31')]
+        self.assertEqual(store.pending_runs(['A', 'B'], 'ventes', periods), [
+            (['A', 'B'], [periods[0]]),
+            (['B'], [periods[1]]),
+            (['A', 'B'], [periods[2]]),
+        ])
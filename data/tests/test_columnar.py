@@ -0,0 +1,71 @@
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from data.fields import INTEGER_MAX
+from data.services import columnar
+
+FIELDS = dict(id_field='id', name_field='name', code_field='code', stock_field='stock', price_field='price',
+              wap_field='wap')
+
+
+def _product(product_id, **values):
+    return {'id': product_id, 'name': 'x', 'code': None, 'stock': 1, 'price': 1, 'wap': 1, **values}
+
+
+class ToCentsTests(SimpleTestCase):
+    def test_rounds_half_up_like_decimal(self):
+        amounts = [0, 0.005, 0.015, 1.005, 2.675, 10.125, 19.999, 123456.785, -0.005, -2.675]
+        expected = [
+            int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding='ROUND_HALF_UP')) for amount in amounts
+        ]
+        self.assertEqual(columnar.to_cents(np.array(amounts)).tolist(), expected)
+
+    def test_clamps_to_integer_columns(self):
+        self.assertEqual(columnar.to_cents(np.array([1e12, -1e12])).tolist(), [INTEGER_MAX, -INTEGER_MAX])
+
+
+class NormalizeProductIdsTests(SimpleTestCase):
+    def _ids(self, products, **kwargs):
+        return [row['product_id'] for row in columnar.normalize_products(products, **FIELDS, **kwargs)]
+
+    def test_keeps_original_id_strings(self):
+        big = 2 ** 53 + 1
+        self.assertEqual(self._ids([_product('00123'), _product(big), _product(7), _product('12.0')]),
+                         ['00123', str(big), '7', '12.0'])
+
+    def test_ids_match_order_line_keys(self):
+        """Product keys are str() of the vendor value, like the order and sale line keys."""
+        for raw in (123, '00123', '123', 2 ** 53 + 1):
+            self.assertEqual(self._ids([_product(raw)]), [str(raw)])
+
+    def test_integer_ids_next_to_missing_ones_stay_integers(self):
+        self.assertEqual(self._ids([_product(None), _product(5), _product('')]), ['5'])
+
+    def test_skips_missing_negative_zero_and_invalid_ids(self):
+        products = [_product(None), _product(-1), _product(0), _product('abc'), _product('12.5'), _product(3)]
+        self.assertEqual(self._ids(products), ['3'])
+        self.assertEqual(self._ids([_product(0)], skip_zero_id=False), ['0'])
+
+    def test_prices_in_cents_and_decimals(self):
+        row, = columnar.normalize_products([_product(1, price='2.675', wap=None)], **FIELDS)
+        self.assertEqual((row['price_with_tax_cents'], row['price_with_tax']), (268, Decimal('2.68')))
+        self.assertEqual((row['weighted_average_price_cents'], row['weighted_average_price']), (0, Decimal('0.00')))
+
+
+class AggregateSalesTests(SimpleTestCase):
+    def test_groups_on_original_id_strings(self):
+        lines = [('00123', '2024-01-02', 1), ('00123', '2024-01-02T10:00:00', 2), ('123', '2024-01-02', 5),
+                 (2 ** 53 + 1, '2024-01-02', 1), (None, '2024-01-02', 1), (-4, '2024-01-02', 1)]
+        result = columnar.aggregate_sales(lines)
+        self.assertEqual(
+            list(result.itertuples(index=False, name=None)),
+            [('00123', date(2024, 1, 2), 3), ('123', date(2024, 1, 2), 5), (str(2 ** 53 + 1), date(2024, 1, 2), 1)]
+        )
+
+    def test_unit_price_in_cents(self):
+        lines = [(1, '2024-01-02', 2, 5.01), (1, '2024-01-02', 1, 2.0), (2, '2024-01-02', 1, None)]
+        result = columnar.aggregate_sales(lines, with_amounts=True)
+        self.assertEqual(result['unit_price_ttc_cents'].tolist(), [234, None])
@@ -0,0 +1,119 @@
+import json
+import sys
+import time
+from datetime import datetime
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from data.tests import LAMBDA_DIR, load_lambda_module
+
+# app.py imports move.py and the shared continuation.py as top-level modules
+sys.path[:0] = [str(LAMBDA_DIR / 'dexter'), str(LAMBDA_DIR / 'shared')]
+try:
+    app = load_lambda_module('dexter/app.py', 'dexter_app')
+finally:
+    del sys.path[:2]
+continuation = app.continuation
+
+END = datetime(2024, 1, 3)
+
+
+def _file(cip_code, gers_code):
+    return cip_code, gers_code, END, 'stock', f"Dexter/Stock_{cip_code}_{gers_code}_x_2024-01-03_2024-01-03.json.gz"
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        return {'Body': mock.Mock(read=mock.Mock(return_value=self.objects[Key]))}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+class Context:
+    invoked_function_arn = 'arn:aws:lambda:eu-west-3:000000000000:function:dexter'
+
+    def get_remaining_time_in_millis(self):
+        return 900000
+
+
+@mock.patch.object(app, 'archive_sources', return_value=(0, 0))
+@mock.patch.object(app, 'process_pharmacy', return_value=({'processed': 1, 'failed': 0, 'pending': []}, []))
+class ProcessFilesCursorTests(SimpleTestCase):
+    def test_cursor_follows_pharmacy_order(self, process_pharmacy, archive_sources):
+        # "123_1" > "1234_0" as strings, but ('123', '1') < ('1234', '0')
+        files = [_file('123', '1'), _file('1234', '0'), _file('99', '0')]
+        totals = app.process_files(None, files, max_workers=1, cursor=['123', '1'])
+
+        processed = [call.args[1][0][3] for call in process_pharmacy.call_args_list]
+        self.assertEqual(processed, [files[1][4], files[2][4]])
+        self.assertIsNone(totals['continuation'])
+
+    def test_continuation_cursor_is_a_pair(self, process_pharmacy, archive_sources):
+        files = [_file('123', '1'), _file('1234', '0')]
+        totals = app.process_files(None, files, max_workers=1, max_files=1)
+        self.assertEqual(totals['continuation']['cursor'], ['123', '1'])
+
+    def test_legacy_string_cursor(self, process_pharmacy, archive_sources):
+        self.assertEqual(app.parse_cursor('123_1'), ('123', '1'))
+        self.assertEqual(app.parse_cursor(['123', '1']), ('123', '1'))
+        self.assertIsNone(app.parse_cursor(None))
+
+
+class ContinuationTests(SimpleTestCase):
+    def test_request_timeout_bounded_by_deadline(self):
+        self.assertEqual(continuation.request_timeout(None, default=300), 300)
+        self.assertEqual(continuation.request_timeout(time.monotonic() + 3600, default=300), 300)
+        self.assertLessEqual(continuation.request_timeout(time.monotonic() + 10, default=300, margin_seconds=20), 20)
+        self.assertEqual(continuation.request_timeout(time.monotonic() - 60, default=300, margin_seconds=20), 1)
+
+    def test_reinvoke_error_is_not_raised(self):
+        with mock.patch('boto3.client', side_effect=RuntimeError('throttled')):
+            self.assertFalse(continuation.reinvoke(Context(), {'iteration': 1}))
+
+
+class HandlerKeysContinuationTests(SimpleTestCase):
+    def setUp(self):
+        self.s3 = FakeS3()
+        patcher = mock.patch.object(app.boto3, 'client', return_value=self.s3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run(self, event, remaining_keys, continued):
+        totals = {'processed': 1, 'continuation': {'cursor': None, 'keys': remaining_keys}}
+        with mock.patch.object(app, 'process_files', return_value=totals), \
+                mock.patch.object(continuation, 'reinvoke', return_value=continued) as reinvoke:
+            body = json.loads(app.handler(event, Context())['body'])
+        return body, reinvoke
+
+    def test_failed_reinvoke_stores_remaining_keys(self):
+        remaining = [_file('123', '1')[4]]
+        body, _ = self._run({'keys': [_file('99', '0')[4]] + remaining}, remaining, continued=False)
+
+        self.assertFalse(body['results']['continued'])
+        keys_object = body['continuation']['keys_object']
+        self.assertTrue(keys_object.startswith(app.KEYS_PREFIX))
+        self.assertEqual(json.loads(self.s3.objects[keys_object]), {'keys': remaining})
+
+    def test_large_key_lists_go_through_s3(self):
+        remaining = [f"Dexter/Stock_{i}_0_x_2024-01-03_2024-01-03.json.gz" for i in range(10000)]
+        _, reinvoke = self._run({'keys': remaining[:1]}, remaining, continued=True)
+
+        next_event = reinvoke.call_args.args[1]
+        self.assertNotIn('keys', next_event)
+        self.assertEqual(json.loads(self.s3.objects[next_event['keys_object']]), {'keys': remaining})
+
+    def test_consumed_keys_object_is_deleted(self):
+        self.s3.objects['Dexter_state/keys/a.json'] = json.dumps({'keys': [_file('99', '0')[4]]}).encode('utf-8')
+        with mock.patch.object(app, 'process_files', return_value={'continuation': None}) as process_files:
+            app.handler({'keys_object': 'Dexter_state/keys/a.json'}, Context())
+
+        self.assertEqual([f[4] for f in process_files.call_args.args[1]], [_file('99', '0')[4]])
+        self.assertNotIn('Dexter_state/keys/a.json', self.s3.objects)
@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from rest_framework.test import APIRequestFactory
+
+from data import views
+from data.services import dexter_s3
+
+STOCK_KEY = 'Dexter/Stock_062044623_123_20240103T0000_2024-01-03_2024-01-03.json.gz'
+VENTE_KEY = 'Dexter/Vente_062044623_123_20240103T0000_2024-01-03_2024-01-03.json.gz'
+
+
+class FakeS3:
+    def __init__(self):
+        self.deleted = []
+
+    def delete_object(self, Bucket, Key):
+        self.deleted.append(Key)
+
+
+@mock.patch.object(dexter_s3, 'load_object', return_value={})
+@mock.patch.object(dexter_s3.dexter, 'process_file')
+@mock.patch.object(dexter_s3.dexter_manifest, 'mark_processed')
+class IngestKeysStockStateTests(SimpleTestCase):
+    def test_stock_ingestion_invalidates_lambda_state(self, *mocks):
+        s3 = FakeS3()
+        result = dexter_s3.ingest_keys([STOCK_KEY, VENTE_KEY], move=False, s3_client=s3)
+
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(s3.deleted, ['Dexter_state/stock_062044623_123.json.gz'])
+
+    def test_invalidation_failure_keeps_success(self, *mocks):
+        s3 = FakeS3()
+        s3.delete_object = mock.Mock(side_effect=RuntimeError('denied'))
+        result = dexter_s3.ingest_keys([STOCK_KEY], move=False, s3_client=s3)
+
+        self.assertEqual(result['success'], 1)
+        self.assertEqual(result['results'][0]['state_error'], 'denied')
+
+
+@mock.patch.object(dexter_s3, 'ingest_keys', return_value={'success': 1, 'errors': 0, 'results': []})
+class DexterIngestViewTests(SimpleTestCase):
+    def _post(self, **body):
+        request = APIRequestFactory().post('/dexter/ingest', {'keys': [STOCK_KEY], **body}, format='json')
+        return views.dexter_ingest(request)
+
+    def test_max_workers_clamped(self, ingest_keys):
+        self._post(max_workers=0)
+        self.assertEqual(ingest_keys.call_args.kwargs['max_workers'], 1)
+        self._post(max_workers=500)
+        self.assertEqual(ingest_keys.call_args.kwargs['max_workers'], views.DEXTER_INGEST_MAX_WORKERS)
+
+    def test_invalid_max_workers(self, ingest_keys):
+        for value in ('many', None, True):
+            with self.subTest(value=value):
+                self.assertEqual(self._post(max_workers=value).status_code, 400)
+        ingest_keys.assert_not_called()
+
+    def test_move_parsed_explicitly(self, ingest_keys):
+        for value, expected in ((False, False), ('false', False), ('True', True), (True, True)):
+            with self.subTest(value=value):
+                self.assertEqual(self._post(move=value).status_code, 200)
+                self.assertIs(ingest_keys.call_args.kwargs['move'], expected)
+        for value in ('0', 'no', 0):
+            with self.subTest(value=value):
+                self.assertEqual(self._post(move=value).status_code, 400)
@@ -0,0 +1,50 @@
+import time
+import uuid
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from data import fields
+
+
+def _timestamp_ms(value):
+    return value.int >> 80
+
+
+def _counter(value):
+    return value.int >> 64 & 0xFFF
+
+
+class Uuid7Tests(SimpleTestCase):
+    def test_version_and_variant(self):
+        value = fields.uuid7()
+        self.assertEqual(value.version, 7)
+        self.assertEqual(value.variant, uuid.RFC_4122)
+
+    def test_timestamp_prefix(self):
+        before = time.time_ns() // 1_000_000
+        value = fields.uuid7()
+        after = time.time_ns() // 1_000_000
+        self.assertTrue(before <= _timestamp_ms(value) <= after + 1)
+
+    def test_strictly_increasing(self):
+        values = [fields.uuid7() for _ in range(20000)]
+        self.assertTrue(all(a < b for a, b in zip(values, values[1:])))
+        self.assertTrue(all(str(a) < str(b) for a, b in zip(values, values[1:])))
+
+    def test_counter_overflow_borrows_next_millisecond(self):
+        frozen_ns = (time.time_ns() // 1_000_000 + 1000) * 1_000_000
+        # Generator state restored afterwards: it is left a second ahead of the clock
+        with mock.patch.object(fields, '_uuid7_last_ms', 0), mock.patch.object(fields, '_uuid7_counter', 0), \
+                mock.patch.object(fields.time, 'time_ns', return_value=frozen_ns):
+            values = [fields.uuid7() for _ in range(0x1000 + 10)]
+        self.assertTrue(all(a < b for a, b in zip(values, values[1:])))
+        self.assertEqual(_timestamp_ms(values[0]), frozen_ns // 1_000_000)
+        self.assertEqual(_timestamp_ms(values[-1]), frozen_ns // 1_000_000 + 1)
+        self.assertEqual(_counter(values[-1]), _counter(values[-2]) + 1)
+
+    def test_clock_moving_backwards(self):
+        first = fields.uuid7()
+        with mock.patch.object(fields.time, 'time_ns', return_value=0):
+            second = fields.uuid7()
+        self.assertLess(first, second)
@@ -0,0 +1,83 @@
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from data.tests import load_lambda_module
+
+http_client = load_lambda_module('shared/http_client.py', 'http_client')
+
+
+def _response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return response
+
+
+def _refused():
+    """ConnectionError raised by requests when the TCP connection cannot be opened."""
+    return requests.exceptions.ConnectionError(
+        MaxRetryError(None, 'http://server/', reason=NewConnectionError(None, 'Connection refused'))
+    )
+
+
+class HttpClientRetryTests(SimpleTestCase):
+    def setUp(self):
+        self.client = http_client.HttpClient(max_retries=2, backoff_base=0)
+        sleep = mock.patch.object(http_client.time, 'sleep')
+        sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def _send(self, method, side_effect, **kwargs):
+        with mock.patch.object(self.client.session, 'request', side_effect=side_effect) as request:
+            try:
+                return self.client.request(method, 'http://server/path', **kwargs), request.call_count
+            except requests.exceptions.RequestException as e:
+                return e, request.call_count
+
+    def test_get_retries_server_errors(self):
+        response, calls = self._send('GET', [_response(500), _response(502), _response(200)])
+        self.assertEqual((response.status_code, calls), (200, 3))
+
+    def test_get_retries_read_timeouts(self):
+        response, calls = self._send('GET', [requests.exceptions.ReadTimeout(), _response(200)])
+        self.assertEqual((response.status_code, calls), (200, 2))
+
+    def test_post_does_not_retry_server_errors(self):
+        for status_code in (500, 502, 504):
+            response, calls = self._send('POST', [_response(status_code), _response(200)])
+            self.assertEqual((response.status_code, calls), (status_code, 1))
+
+    def test_post_retries_unprocessed_statuses(self):
+        for status_code in (429, 503):
+            response, calls = self._send('POST', [_response(status_code), _response(200)])
+            self.assertEqual((response.status_code, calls), (200, 2))
+
+    def test_post_does_not_retry_read_timeouts(self):
+        error, calls = self._send('POST', [requests.exceptions.ReadTimeout(), _response(200)])
+        self.assertIsInstance(error, requests.exceptions.ReadTimeout)
+        self.assertEqual(calls, 1)
+
+    def test_post_does_not_retry_dropped_connections(self):
+        dropped = requests.exceptions.ConnectionError(ProtocolError('Connection aborted.'))
+        error, calls = self._send('POST', [dropped, _response(200)])
+        self.assertIsInstance(error, requests.exceptions.ConnectionError)
+        self.assertEqual(calls, 1)
+
+    def test_post_retries_connection_failures(self):
+        response, calls = self._send('POST', [_refused(), requests.exceptions.ConnectTimeout(), _response(200)])
+        self.assertEqual((response.status_code, calls), (200, 3))
+
+    def test_idempotent_post_uses_get_policy(self):
+        response, calls = self._send('POST', [_response(500), _response(200)], idempotent=True)
+        self.assertEqual((response.status_code, calls), (200, 2))
+
+    def test_last_response_returned_after_retries(self):
+        response, calls = self._send('GET', [_response(503)] * 3)
+        self.assertEqual((response.status_code, calls), (503, 3))
+
+    def test_retry_after_header(self):
+        self.assertEqual(self.client._retry_delay(0, _response(429, {'Retry-After': '7'})), 7)
+        self.assertEqual(self.client._retry_delay(0, _response(429, {'Retry-After': '3600'})), self.client.backoff_max)
@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+from botocore.exceptions import ClientError
+from django.test import SimpleTestCase
+
+from data.tests import load_lambda_module
+
+move = load_lambda_module('dexter/move.py', 'dexter_move')
+
+
+class FakeS3:
+    """In-memory bucket with the calls used by move_objects."""
+
+    def __init__(self, keys):
+        self.objects = dict.fromkeys(keys, b'x')
+
+    def copy_object(self, Bucket, CopySource, Key):
+        self.objects[Key] = self.objects[CopySource['Key']]
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete['Objects']:
+            self.objects.pop(obj['Key'], None)
+        return {}
+
+
+class MoveObjectsTests(SimpleTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def test_checkpointed_source_deleted_without_copy(self):
+        s3 = FakeS3(['a/1', 'b/1'])
+        move.save_checkpoint(self.path, [('a/1', 'b/1')])
+        s3.copy_object = None  # Any copy would fail
+
+        result = move.move_objects(s3, 'bucket', [('a/1', 'b/1')], max_workers=2, checkpoint_path=self.path)
+        self.assertEqual(result, {'moved': ['a/1'], 'errors': {}})
+        self.assertEqual(set(s3.objects), {'b/1'})
+
+    def test_checkpoint_of_another_destination_is_ignored(self):
+        s3 = FakeS3(['a/1'])
+        move.save_checkpoint(self.path, [('a/1', 'c/1')])
+
+        move.move_objects(s3, 'bucket', [('a/1', 'b/1')], max_workers=2, checkpoint_path=self.path)
+        self.assertEqual(set(s3.objects), {'b/1'})
+
+    def test_missing_destination_is_copied_again(self):
+        s3 = FakeS3(['a/1'])
+        move.save_checkpoint(self.path, [('a/1', 'b/1')])
+
+        move.move_objects(s3, 'bucket', [('a/1', 'b/1')], max_workers=2, checkpoint_path=self.path)
+        self.assertEqual(set(s3.objects), {'b/1'})
+
+    def test_truncated_line_is_ignored(self):
+        move.save_checkpoint(self.path, [('a/1', 'b/1')])
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('a/2')
+        self.assertEqual(move.load_checkpoint(self.path), {'a/1': 'b/1'})
+
+    def test_checkpoint_file_depends_on_both_folders(self):
+        self.assertNotEqual(move.checkpoint_file('a/', 'b/'), move.checkpoint_file('a/', 'c/'))
+        self.assertEqual(move.checkpoint_file('a/', 'b/'), move.checkpoint_file('a/', 'b/'))
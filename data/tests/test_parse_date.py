@@ -0,0 +1,48 @@
+import dateutil.parser
+import pytz
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from data.services.common import parse_date
+
+DATE_STRINGS = [
+    '2024-01-02', '2024-01-02T10:11:12', '2024-01-02T10:11:12Z', '2024-01-02T10:11:12.123456',
+    '2024-01-02T10:11:12.5+02:00', '2024-01-02T10:11:12+0200', '2024-01-02 10:11:12', '2024-01-02T23:30:00-05:00',
+    '2024-01-02t10:11:12', '2024-01-02T10:11:12,5', '2024-01-02T10:11:12.1234567', '2024-01-02T10',
+    '2024-01-02T10:11', '2024-01-02 ', ' 2024-01-02', '2024-1-2', '20240102', '20240102T101112', '2024-001',
+    '02/01/2024', '2/1/2024 10:00', 'Jan 2 2024', '2024-W01-2', '2024-01-02T24:00:00', '2024-13-01',
+    '2024-02-30', 'invalid', '1e5', '', None, 12345,
+]
+
+
+def _dateutil_parse_date(date_str, is_datetime=True):
+    """parse_date before its fromisoformat fast path: dateutil only."""
+    if not date_str:
+        return None
+    try:
+        parsed_date = dateutil.parser.parse(date_str)
+        if is_datetime:
+            if timezone.is_naive(parsed_date):
+                return timezone.make_aware(parsed_date, pytz.UTC)
+            return parsed_date.astimezone(pytz.UTC)
+        return parsed_date.date()
+    except (ValueError, TypeError):
+        return None
+
+
+class ParseDateTests(SimpleTestCase):
+    def test_same_results_as_dateutil(self):
+        for is_datetime in (True, False):
+            for date_str in DATE_STRINGS:
+                with self.subTest(date_str=date_str, is_datetime=is_datetime):
+                    self.assertEqual(
+                        parse_date(date_str, is_datetime), _dateutil_parse_date(date_str, is_datetime)
+                    )
+
+    def test_datetimes_are_utc(self):
+        parsed = parse_date('2024-01-02T23:30:00-05:00')
+        self.assertEqual(parsed.tzinfo, pytz.UTC)
+        self.assertEqual(parsed.isoformat(), '2024-01-03T04:30:00+00:00')
+
+    def test_dates_ignore_timezone(self):
+        self.assertEqual(parse_date('2024-01-02T23:30:00-05:00', is_datetime=False).isoformat(), '2024-01-02')
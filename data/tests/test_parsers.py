@@ -0,0 +1,32 @@
+import gzip
+import io
+
+from django.test import SimpleTestCase, override_settings
+from rest_framework.exceptions import ParseError
+
+from data.parsers import GzipJSONParser, PayloadTooLarge
+
+
+class _Request:
+    META = {'HTTP_CONTENT_ENCODING': 'gzip'}
+
+
+def _parse(body):
+    return GzipJSONParser().parse(io.BytesIO(body), None, {'request': _Request()})
+
+
+class GzipJSONParserTests(SimpleTestCase):
+    def test_gzip_body(self):
+        self.assertEqual(_parse(gzip.compress(b'{"produits": [1, 2]}')), {'produits': [1, 2]})
+
+    def test_invalid_gzip_is_parse_error(self):
+        for body in (b'{"not": "gzip"}', gzip.compress(b'{"a": 1}')[:-10]):
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                _parse(body)
+
+    @override_settings(DATA_UPLOAD_MAX_DECOMPRESSED_SIZE=1024)
+    def test_decompressed_size_limit(self):
+        self.assertEqual(_parse(gzip.compress(b'[' + b'0,' * 400 + b'0]')), [0] * 401)
+        # 2 MB decompressed, 2 KB compressed
+        with self.assertRaises(PayloadTooLarge):
+            _parse(gzip.compress(b'[' + b'0,' * 1000000 + b'0]'))
@@ -0,0 +1,87 @@
+from django.test import SimpleTestCase
+
+from data.tests import load_lambda_module
+
+periods = load_lambda_module('shared/periods.py', 'periods')
+
+FetchResult = periods.FetchResult
+
+
+def _ok(size=1000, elapsed=0.1):
+    return FetchResult('ok', [], size, elapsed, None)
+
+
+class FakeApi:
+    """fetch(dt1, dt2) refusing (400) or failing on ranges longer than max_days."""
+
+    def __init__(self, max_days=None, status='rejected', latest=None):
+        self.max_days = max_days
+        self.status = status
+        self.latest = latest
+        self.calls = []
+
+    def __call__(self, dt1, dt2):
+        self.calls.append((dt1, dt2))
+        if self.latest and dt2 > self.latest:
+            return FetchResult('late', self.latest, 0, 0, 'dt2 est postérieur')
+        days = (periods.as_date(dt2) - periods.as_date(dt1)).days + 1
+        if self.max_days is not None and days > self.max_days:
+            return FetchResult(self.status, None, 0, 0, 'too large')
+        return _ok()
+
+
+def _windows(api, dt1, dt2, window):
+    return [(c1, c2, result.status) for c1, c2, result in
+            periods.fetch_adaptive(api, dt1, dt2, window, log=lambda message: None)]
+
+
+class AdaptiveWindowTests(SimpleTestCase):
+    def test_feedback_shrinks_large_and_slow_responses(self):
+        window = periods.AdaptiveWindow(days=32, max_bytes=1000, slow_seconds=10)
+        window.feedback(32, _ok(size=2000))
+        self.assertEqual(window.days, 16)
+        window.feedback(16, _ok(size=10, elapsed=20))
+        self.assertEqual(window.days, 8)
+
+    def test_feedback_grows_small_fast_responses_up_to_max(self):
+        window = periods.AdaptiveWindow(days=32, max_days=92, max_bytes=1000, slow_seconds=10)
+        window.feedback(32, _ok(size=10, elapsed=0.1))
+        self.assertEqual(window.days, 64)
+        window.feedback(64, _ok(size=10, elapsed=0.1))
+        self.assertEqual(window.days, 92)
+
+    def test_rejected_range_is_split_without_gaps(self):
+        api = FakeApi(max_days=10)
+        window = periods.AdaptiveWindow(days=31, min_days=1, max_days=31)
+        windows = _windows(api, '2024-01-01', '2024-01-31', window)
+
+        self.assertTrue(all(status == 'ok' for _, _, status in windows))
+        self.assertEqual(windows[0][0], '2024-01-01')
+        self.assertEqual(windows[-1][1], '2024-01-31')
+        for (_, end, _), (start, _, _) in zip(windows, windows[1:]):
+            self.assertEqual((periods.as_date(start) - periods.as_date(end)).days, 1)
+        self.assertTrue(all((periods.as_date(c2) - periods.as_date(c1)).days < 10 for c1, c2, _ in windows))
+        # A refusal caps the window for the following ranges
+        self.assertLess(window.max_days, 31)
+
+    def test_failure_at_min_days_is_yielded(self):
+        api = FakeApi(max_days=0, status='failed')
+        window = periods.AdaptiveWindow(days=4, min_days=1, max_days=4)
+        windows = _windows(api, '2024-01-01', '2024-01-04', window)
+        self.assertEqual([status for _, _, status in windows], ['failed'] * 4)
+        self.assertEqual(windows[-1][1], '2024-01-04')
+
+    def test_ranges_clamped_to_latest_vendor_date(self):
+        api = FakeApi(latest='2024-01-20')
+        calendar = periods.VendorCalendar()
+        windows = _windows(api, '2024-01-01', '2024-01-31', periods.AdaptiveWindow(days=31))
+        self.assertEqual(windows[0][:2], ('2024-01-01', '2024-01-20'))
+        self.assertEqual(windows[-1][2], 'late')
+
+        # The learnt date bounds the next ranges without asking the API again
+        api.calls.clear()
+        calendar.learn('2024-01-20')
+        windows = [(c1, c2, r.status) for c1, c2, r in periods.fetch_adaptive(
+            api, '2024-01-15', '2024-01-31', periods.AdaptiveWindow(days=31), calendar, log=lambda message: None)]
+        self.assertEqual(api.calls, [('2024-01-15', '2024-01-20')])
+        self.assertEqual([status for _, _, status in windows], ['ok', 'late'])
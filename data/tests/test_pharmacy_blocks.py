@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from data.services import common
+
+
+class IterPharmacyBlocksTests(SimpleTestCase):
+    def test_header_pharmacy_receives_its_blocks(self):
+        pharmacy = SimpleNamespace(id_nat='062044623')
+        data = [{'cip_pharma': '062044623'}, {'cip_pharma': 62044623}, {'cip_pharma': ' 62044623 '}, {}]
+        with mock.patch.object(common.Pharmacy.objects, 'get_or_create') as get_or_create:
+            blocks = list(common.iter_pharmacy_blocks(pharmacy, data))
+
+        self.assertEqual(blocks, [(pharmacy, block) for block in data])
+        get_or_create.assert_not_called()
+
+    def test_header_pharmacy_skips_other_pharmacies(self):
+        pharmacy = SimpleNamespace(id_nat='062044623')
+        data = [{'cip_pharma': '062000111'}, {'cip_pharma': '062044623'}]
+        with mock.patch.object(common.Pharmacy.objects, 'get_or_create') as get_or_create, \
+                self.assertLogs(common.logger, 'WARNING'):
+            blocks = list(common.iter_pharmacy_blocks(pharmacy, data))
+
+        self.assertEqual(blocks, [(pharmacy, data[1])])
+        get_or_create.assert_not_called()
+
+    def test_without_header_blocks_routed_by_cip_pharma(self):
+        data = [{'cip_pharma': '062044623'}, {'cip_pharma': '062000111'}, {'cip_pharma': '062044623'}, {}]
+        with mock.patch.object(common.Pharmacy.objects, 'get_or_create',
+                               side_effect=lambda id_nat: (SimpleNamespace(id_nat=id_nat), True)) as get_or_create, \
+                self.assertLogs(common.logger, 'WARNING'):
+            blocks = list(common.iter_pharmacy_blocks(None, data))
+
+        self.assertEqual([pharmacy.id_nat for pharmacy, _ in blocks], ['062044623', '062000111', '062044623'])
+        self.assertEqual(get_or_create.call_count, 2)
@@ -0,0 +1,42 @@
+from django.test import SimpleTestCase
+
+from data.fields import from_cents
+from data.services import columnar
+from data.services.product_manifest import product_fingerprint
+from data.tests import load_lambda_module
+
+new_api_lambda = load_lambda_module('winpharma_new_api/app.py', 'winpharma_new_api_app')
+
+PRODUCTS = [
+    {'ProdId': 1, 'Nom': 'DOLIPRANE 1000MG CPR 8', 'Code13Ref': '3400930000001', 'Stock': 12,
+     'PrixTTC': 2.18, 'PrixMP': 1.3945},
+    {'ProdId': 2, 'Nom': 'Crème réparatrice', 'Code13Ref': None, 'Stock': 0, 'PrixTTC': 2.675, 'PrixMP': 0},
+    {'ProdId': 3, 'Nom': None, 'Code13Ref': '3400930000002', 'Stock': 40000, 'PrixTTC': 1e9, 'PrixMP': -1e9},
+    {'ProdId': 4, 'Nom': 'Stock négatif', 'Code13Ref': '3400930000003', 'Stock': -3.7, 'PrixTTC': 0.005,
+     'PrixMP': 19.999},
+]
+
+
+class ProductFingerprintParityTests(SimpleTestCase):
+    def test_lambda_matches_stored_values(self):
+        """The Lambda fingerprint of an API product equals the server's one of the stored snapshot."""
+        stored = columnar.normalize_products(
+            PRODUCTS, id_field='ProdId', name_field='Nom', code_field='Code13Ref', stock_field='Stock',
+            price_field='PrixTTC', wap_field='PrixMP'
+        )
+        self.assertEqual(len(stored), len(PRODUCTS))
+        for product, row in zip(PRODUCTS, stored):
+            with self.subTest(product=product['ProdId']):
+                server = product_fingerprint(
+                    row['stock'], from_cents(row['price_with_tax_cents']),
+                    from_cents(row['weighted_average_price_cents']), row['name'], row['code_13_ref']
+                )
+                self.assertEqual(new_api_lambda.product_fingerprint(product), server)
+
+    def test_changed_field_changes_fingerprint(self):
+        product = PRODUCTS[0]
+        fingerprint = new_api_lambda.product_fingerprint(product)
+        for field, value in (('Stock', 11), ('PrixTTC', 2.19), ('PrixMP', 1.40), ('Nom', 'DOLIPRANE'),
+                             ('Code13Ref', '3400930000009')):
+            with self.subTest(field=field):
+                self.assertNotEqual(new_api_lambda.product_fingerprint({**product, field: value}), fingerprint)
@@ -16,8 +16,13 @@ urlpatterns = [
 
     # Dexter
     path('dexter/create/stock', views.dexter_create_stock, name='dexter_create_stock'),
+    path('dexter/create/stock_delta', views.dexter_create_stock_delta, name='dexter_create_stock_delta'),
     path('dexter/create/achat', views.dexter_create_achat, name='dexter_create_achat'),
     path('dexter/create/vente', views.dexter_create_vente, name='dexter_create_vente'),
+    path('dexter/create/vente_aggregated', views.dexter_create_vente_aggregated, name='dexter_create_vente_aggregated'),
+    path('dexter/ingest', views.dexter_ingest, name='dexter_ingest'),
+    path('dexter/manifest', views.dexter_manifest_files, name='dexter_manifest_files'),
+    path('dexter/manifest/coverage', views.dexter_manifest_coverage, name='dexter_manifest_coverage'),
 
     # WinPharma 2
     path('winpharma_2/create/products', views.winpharma_2_create_product, name='winpharma_2_create_product'),
@@ -32,6 +37,7 @@ urlpatterns = [
     path('winpharma_new_api/create/products', views.winpharma_new_api_create_product, name='winpharma_new_api_create_product'),
     path('winpharma_new_api/create/orders', views.winpharma_new_api_create_order, name='winpharma_new_api_create_order'),
     path('winpharma_new_api/create/sales', views.winpharma_new_api_create_sales, name='winpharma_new_api_create_sales'),
+    path('winpharma_new_api/create/sales_aggregated', views.winpharma_new_api_create_sales_aggregated, name='winpharma_new_api_create_sales_aggregated'),
 
     # ============================================================================
     # NOUVEAUX ENDPOINTS POUR TESTS NOUVELLE API
@@ -50,6 +56,9 @@ urlpatterns = [
     # Création de pharmacies
     path('api/pharmacy/create', views.create_pharmacy, name='create_pharmacy'),
 
+    # Empreintes produits (synchronisation différentielle des Lambdas)
+    path('products/manifest', views.products_manifest, name='products_manifest'),
+
     # ============================================================================
     # ENDPOINTS APOTHICAL
     # ============================================================================
@@ -3,12 +3,14 @@ import requests
 import logging
 from datetime import datetime, timedelta
 
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, parser_classes
 from rest_framework.response import Response
+from django.views.decorators.gzip import gzip_page
 
-from data.models import Pharmacy
+from data.models import Pharmacy, DexterFile
+from data.parsers import GzipJSONParser
 from data.services import dexter, winpharma, winpharma_2, winpharma_new_api
-from data.services import apothical
+from data.services import aggregated_sales, apothical, dexter_s3, dexter_manifest, product_manifest
 
 import json
 import uuid
@@ -23,6 +25,11 @@ API_PASSWORD = "cGFzczE"
 IDNAT_TEST = "062044623"
 BASE_URL = "https://grpstat.winpharma.com/ApiWp"
 
+# Maximum number of objects ingested by one dexter_ingest request (processed synchronously)
+DEXTER_INGEST_MAX_KEYS = 20
+# Pharmacies ingested concurrently by one dexter_ingest request (threads, S3 and DB connections)
+DEXTER_INGEST_MAX_WORKERS = 8
+
 
 # ============================================================================
 # FONCTION HELPER (placée en premier)
@@ -120,6 +127,7 @@ def winpharma_create_sales(request):
 # ============================================================================
 
 @api_view(['POST'])
+@parser_classes([GzipJSONParser])
 def dexter_create_stock(request):
     """
     Endpoint for creating or updating products linked to a pharmacy.
@@ -150,6 +158,38 @@ def dexter_create_stock(request):
 
 
 @api_view(['POST'])
+@parser_classes([GzipJSONParser])
+def dexter_create_stock_delta(request):
+    """
+    Endpoint for the products of a Stock file that changed since the previous file.
+
+    Body: {"organization": {...}, "produits": [...], "delta": {"total", "changed", "base_key"}}
+    """
+    try:
+        payload = request.data
+        orga = payload.get('organization', {})
+
+        if not orga:
+            return Response({'error': 'Missing organization data'}, status=400)
+
+        pharmacy, _ = Pharmacy.objects.update_or_create(
+            id_nat=orga.get('id_national'),
+            defaults={'name': orga.get('nom_pharmacie', 'Pharmacie inconnue')}
+        )
+
+        dexter.process_stock_delta(
+            pharmacy, payload.get('produits', []), orga.get('date_fichier'), payload.get('delta')
+        )
+
+        return Response({'message': 'Processing completed'}, status=200)
+
+    except Exception as e:
+        logger.error(f"Error in dexter_create_stock_delta: {e}", exc_info=True)
+        return Response({'error': str(e)}, status=500)
+
+
+@api_view(['POST'])
+@parser_classes([GzipJSONParser])
 def dexter_create_achat(request):
     """
     Endpoint for creating or updating orders linked to a pharmacy.
@@ -178,6 +218,7 @@ def dexter_create_achat(request):
 
 
 @api_view(['POST'])
+@parser_classes([GzipJSONParser])
 def dexter_create_vente(request):
     """
     Endpoint for creating or updating sales linked to a pharmacy.
@@ -205,6 +246,127 @@ def dexter_create_vente(request):
         return Response({'error': str(e)}, status=500)
 
 
+@api_view(['POST'])
+@parser_classes([GzipJSONParser])
+def dexter_create_vente_aggregated(request):
+    """
+    Endpoint for sales pre-aggregated per (product, day) by the Dexter Lambda.
+
+    Body: {"organization": {...}, "ventes_agregees": [{"product_id", "date", "qte", "ttc"}, ...]}
+    """
+    try:
+        payload = request.data
+        orga = payload.get('organization', {})
+
+        if not orga:
+            return Response({'error': 'Missing organization data'}, status=400)
+
+        pharmacy, _ = Pharmacy.objects.update_or_create(
+            id_nat=orga.get('id_national'),
+            defaults={'name': orga.get('nom_pharmacie', 'Pharmacie inconnue')}
+        )
+
+        result = aggregated_sales.process_aggregated_sales(pharmacy, payload.get('ventes_agregees', []))
+        return Response({'message': 'Processing completed', 'stats': result}, status=200)
+
+    except Exception as e:
+        logger.error(f"Error in dexter_create_vente_aggregated: {e}", exc_info=True)
+        return Response({'error': str(e)}, status=500)
+
+
+@api_view(['POST'])
+def dexter_ingest(request):
+    """
+    Endpoint to ingest Dexter files straight from the S3 bucket.
+
+    Body: {"keys": ["Dexter/Stock_....json.gz", ...], "max_workers": 4, "move": true}
+
+    At most DEXTER_INGEST_MAX_KEYS keys per request; use the dexter_ingest management
+    command for larger backlogs. max_workers is clamped to 1..DEXTER_INGEST_MAX_WORKERS;
+    move accepts a boolean or "true"/"false".
+    """
+    keys = request.data.get('keys') or []
+    if not isinstance(keys, list) or not keys:
+        return Response({'error': 'Missing keys'}, status=400)
+    if len(keys) > DEXTER_INGEST_MAX_KEYS:
+        # Ingestion runs inside the request: larger backlogs go through the management command
+        return Response({
+            'error': f"Too many keys ({len(keys)} > {DEXTER_INGEST_MAX_KEYS}): split the request "
+                     f"or run 'manage.py dexter_ingest --keys-file ...'"
+        }, status=413)
+
+    max_workers = request.data.get('max_workers', 4)
+    try:
+        # bool is an int subclass: true/false are not worker counts
+        if isinstance(max_workers, bool):
+            raise ValueError
+        max_workers = int(max_workers)
+    except (TypeError, ValueError):
+        return Response({'error': f"Invalid max_workers '{max_workers}'"}, status=400)
+    max_workers = max(1, min(max_workers, DEXTER_INGEST_MAX_WORKERS))
+
+    move = request.data.get('move', True)
+    if isinstance(move, str) and move.lower() in ('true', 'false'):
+        move = move.lower() == 'true'
+    if not isinstance(move, bool):
+        return Response({'error': f"Invalid move '{move}': expected true or false"}, status=400)
+
+    try:
+        result = dexter_s3.ingest_keys(keys, max_workers=max_workers, move=move)
+        return Response(result, status=200 if result['errors'] == 0 else 207)
+
+    except Exception as e:
+        logger.error(f"Error in dexter_ingest: {e}", exc_info=True)
+        return Response({'error': str(e)}, status=500)
+
+
+@api_view(['GET', 'POST'])
+def dexter_manifest_files(request):
+    """
+    GET: list the manifest rows (filters: file_type, cip_code, gers_code, status, start, end, prefix).
+    POST: register keys in the manifest.
+          Body: {"keys": ["Dexter/Vente_....json.gz", ...], "status": "pending"}
+          or, for processed files: {"keys": [{"key": "Dexter/...", "moved_to": "History_dexter/..."}], "status": "processed"}
+    """
+    if request.method == 'POST':
+        keys = request.data.get('keys') or []
+        status = request.data.get('status', DexterFile.STATUS_PENDING)
+        if status not in dict(DexterFile.STATUS_CHOICES):
+            return Response({'error': f"Unknown status '{status}'"}, status=400)
+        try:
+            if status == DexterFile.STATUS_PROCESSED:
+                for entry in keys:
+                    if isinstance(entry, dict):
+                        dexter_manifest.mark_processed(entry['key'], entry.get('moved_to'))
+                    else:
+                        dexter_manifest.mark_processed(entry)
+                return Response({'registered': len(keys)}, status=200)
+            return Response({'registered': dexter_manifest.register_objects(keys, status=status)}, status=200)
+        except Exception as e:
+            logger.error(f"Error in dexter_manifest_files: {e}", exc_info=True)
+            return Response({'error': str(e)}, status=500)
+
+    params = request.query_params
+    files = dexter_manifest.select_files(
+        file_type=params.get('file_type'),
+        cip_code=params.get('cip_code'),
+        gers_code=params.get('gers_code'),
+        status=params.get('status'),
+        start=params.get('start'),
+        end=params.get('end'),
+        prefix=params.get('prefix'),
+    )
+    return Response({'count': len(files), 'files': files}, status=200)
+
+
+@api_view(['GET'])
+def dexter_manifest_coverage(request):
+    """
+    Number of Dexter files per pharmacy, type and month (filter: file_type).
+    """
+    return Response(dexter_manifest.monthly_coverage(request.query_params.get('file_type')), status=200)
+
+
 # ============================================================================
 # ENDPOINTS WINPHARMA 2
 # ============================================================================
@@ -276,7 +438,9 @@ def winpharma_new_api_create_product(request):
     """
     Endpoint de production pour créer/mettre à jour les produits avec la nouvelle API
     """
-    pharmacy, _ = Pharmacy.objects.get_or_create(id_nat=request.headers.get('Pharmacy-id'))
+    # Sans header Pharmacy-id (requête multi-Idnats), chaque bloc est rattaché via son cip_pharma
+    pharmacy_id = request.headers.get('Pharmacy-id')
+    pharmacy = Pharmacy.objects.get_or_create(id_nat=pharmacy_id)[0] if pharmacy_id else None
 
     try:
         result = winpharma_new_api.process_product(pharmacy, request.data)
@@ -300,7 +464,9 @@ def winpharma_new_api_create_order(request):
     """
     Endpoint de production pour créer/mettre à jour les commandes avec la nouvelle API
     """
-    pharmacy, _ = Pharmacy.objects.get_or_create(id_nat=request.headers.get('Pharmacy-id'))
+    # Sans header Pharmacy-id (requête multi-Idnats), chaque bloc est rattaché via son cip_pharma
+    pharmacy_id = request.headers.get('Pharmacy-id')
+    pharmacy = Pharmacy.objects.get_or_create(id_nat=pharmacy_id)[0] if pharmacy_id else None
     
     try:
         result = winpharma_new_api.process_order(pharmacy, request.data)
@@ -326,7 +492,9 @@ def winpharma_new_api_create_sales(request):
     """
     Endpoint de production pour créer/mettre à jour les ventes avec la nouvelle API
     """
-    pharmacy, _ = Pharmacy.objects.get_or_create(id_nat=request.headers.get('Pharmacy-id'))
+    # Sans header Pharmacy-id (requête multi-Idnats), chaque bloc est rattaché via son cip_pharma
+    pharmacy_id = request.headers.get('Pharmacy-id')
+    pharmacy = Pharmacy.objects.get_or_create(id_nat=pharmacy_id)[0] if pharmacy_id else None
     
     try:
         winpharma_new_api.process_sales(pharmacy, request.data)
@@ -341,6 +509,30 @@ def winpharma_new_api_create_sales(request):
         }, status=500)
 
 
+@api_view(['POST'])
+@parser_classes([GzipJSONParser])
+def winpharma_new_api_create_sales_aggregated(request):
+    """
+    Endpoint de production pour les ventes pré-agrégées par (produit, jour) par la Lambda
+    """
+    # Sans header Pharmacy-id (requête multi-Idnats), chaque bloc est rattaché via son cip_pharma
+    pharmacy_id = request.headers.get('Pharmacy-id')
+    pharmacy = Pharmacy.objects.get_or_create(id_nat=pharmacy_id)[0] if pharmacy_id else None
+
+    try:
+        result = winpharma_new_api.process_aggregated_sales(pharmacy, request.data)
+        return Response({
+            "message": "Sales processed successfully",
+            "stats": result
+        }, status=200)
+    except Exception as e:
+        print(traceback.format_exc())
+        return Response({
+            "message": "Processing error",
+            "error": str(e)
+        }, status=500)
+
+
 # ============================================================================
 # ENDPOINTS POUR TESTS NOUVELLE API
 # ============================================================================
@@ -777,6 +969,33 @@ def apothical_create_sales(request):
         }, status=500)
 
 
+# ============================================================================
+# MANIFESTE PRODUITS
+# ============================================================================
+
+@gzip_page
+@api_view(['GET'])
+def products_manifest(request):
+    """
+    Empreinte de l'état courant des produits, pour que les Lambdas n'envoient que les produits modifiés
+    GET /products/manifest?id_nat=062044623,062000111  (ou header Pharmacy-id)
+    Réponse: {"algorithm": "blake2b-64", "pharmacies": {"062044623": {"<internal_id>": "<empreinte>"}}}
+    """
+    id_nats = request.query_params.get('id_nat') or request.headers.get('Pharmacy-id') or ''
+    id_nats = [id_nat.strip() for id_nat in id_nats.split(',') if id_nat.strip()]
+    if not id_nats:
+        return Response({'error': 'Paramètre id_nat ou header Pharmacy-id requis'}, status=400)
+
+    try:
+        return Response({
+            'algorithm': product_manifest.FINGERPRINT_ALGORITHM,
+            'pharmacies': product_manifest.build_manifests(id_nats)
+        }, status=200)
+    except Exception as e:
+        logger.error(f"Error in products_manifest: {e}", exc_info=True)
+        return Response({'error': str(e)}, status=500)
+
+
 # ============================================================================
 # ENDPOINT CRÉATION PHARMACIE
 # ============================================================================
@@ -816,7 +1035,6 @@ def create_pharmacy(request):
         # Créer la nouvelle pharmacie
         with transaction.atomic():
             pharmacy = Pharmacy.objects.create(
-                id=uuid.uuid4(),
                 name=pharmacy_name,
                 id_nat=id_nat or f"IMPORT_{uuid.uuid4().hex[:8].upper()}",
                 address="Adresse import",
@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import gzip
 from io import BytesIO
@@ -7,8 +8,13 @@ import boto3
 from botocore.exceptions import ClientError
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shared'))
+import manifest
+
 BUCKET_NAME = 'phardev'
 FOLDER_PREFIX = 'Dexter_history/'
+# Si défini, les fichiers sont sélectionnés via le manifeste du serveur au lieu d'un listing S3
+SERVER_URL = os.environ.get('SERVER_URL')
 
 
 def list_files_in_folder(bucket_name, prefix):
@@ -30,8 +36,11 @@ def list_files_in_folder(bucket_name, prefix):
 def main():
     s3_client = boto3.client('s3')
 
-    # Récupération de tous les fichiers dans le bucket/prefix
-    all_files = list_files_in_folder(BUCKET_NAME, FOLDER_PREFIX)
+    # Récupération de tous les fichiers dans le bucket/prefix (manifeste indexé si disponible)
+    if SERVER_URL:
+        all_files = manifest.manifest_objects(SERVER_URL, prefix=FOLDER_PREFIX)
+    else:
+        all_files = list_files_in_folder(BUCKET_NAME, FOLDER_PREFIX)
     print(f"Total des fichiers trouvés : {len(all_files)}")
 
     for file_info in tqdm(all_files):
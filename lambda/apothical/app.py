@@ -1,14 +1,26 @@
 import os
+import sys
 import requests
 from datetime import datetime
-from dotenv import load_dotenv
 
-load_dotenv()
+try:
+    import http_client
+except ImportError:  # exécution locale depuis le dépôt : le module partagé est dans lambda/shared
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+    import http_client
+
+try:  # python-dotenv n'est installé qu'en local : dans Lambda, la configuration vient de l'environnement
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
 
 # Configuration
 SERVER_URL = os.environ.get('SERVER_URL')
 FINESS_CODE = "712006733"  # Pharmacie Puig Léveilé (la seule accessible pour le moment)
 
+http = http_client.HttpClient()
+
 
 def handler(event, context):
     """
@@ -44,7 +56,7 @@ def handler(event, context):
             print(f"🔄 Traitement {description}...")
             
             # Appel POST sans body (les données sont récupérées via l'API dans le service)
-            response = requests.post(url, json={}, headers=headers, timeout=300)
+            response = http.post(url, json={}, headers=headers, timeout=300)
             
             if response.status_code == 200:
                 data = response.json()
@@ -89,6 +101,7 @@ def handler(event, context):
     total_count = len(results)
     
     print(f"\n📈 Résumé: {success_count}/{total_count} endpoints traités avec succès")
+    http.log_stats()
     
     if success_count == total_count:
         print("✅ Synchronisation Apothical terminée avec succès")
@@ -109,7 +122,8 @@ def handler(event, context):
             'message': message,
             'finess': FINESS_CODE,
             'timestamp': datetime.now().isoformat(),
-            'results': results
+            'results': results,
+            'http_stats': http.stats()
         }
     }
 
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Mesure du démarrage à froid des Lambdas : temps d'import de app.py (phase INIT de Lambda)
+dans un interpréteur neuf, pour chaque fonction.
+
+Chaque mesure lance un nouveau processus Python, comme un nouveau conteneur Lambda.
+Deux modes :
+- "sans pyc" : tout le bytecode (fonction et dépendances) est recompilé à chaque essai,
+  borne haute d'une image où /var/task est en lecture seule et rien n'a été précompilé ;
+- "avec pyc" : le bytecode est précompilé (python -m compileall), comme dans les images
+  construites avec les Dockerfiles actuels.
+
+Usage :
+    python lambda/cold_start_benchmark.py [--runs 10] [--importtime] [fonction ...]
+
+Les dépendances de la fonction (requirements.txt) doivent être installées dans
+l'environnement courant ; pour une mesure au plus près de Lambda, copier ce script
+dans l'image et le lancer à côté de app.py :
+    docker run --rm -v $PWD/lambda/cold_start_benchmark.py:/var/task/cold_start_benchmark.py \
+        --entrypoint python3 <image> cold_start_benchmark.py --here
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+LAMBDA_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARED_DIR = os.path.join(LAMBDA_DIR, 'shared')
+FUNCTIONS = ['apothical', 'dexter', 'winpharma', 'winpharma_2', 'winpharma_new_api']
+
+# Exécuté dans le processus fils : durée de l'import de app, en secondes
+IMPORT_SNIPPET = (
+    "import time, json; start = time.perf_counter(); import app; "
+    "print(json.dumps({'import_s': time.perf_counter() - start}))"
+)
+
+
+def function_dir(function):
+    # Dans une image Lambda, le script est copié à côté de app.py
+    if function is None:
+        return LAMBDA_DIR
+    return os.path.join(LAMBDA_DIR, function)
+
+
+def run_once(cwd, pyc_prefix, importtime=False):
+    """Lance un interpréteur neuf, importe app et renvoie (durée d'import, durée totale, stderr)."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [SHARED_DIR, env.get('PYTHONPATH')]))
+    env['PYTHONPYCACHEPREFIX'] = pyc_prefix
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', IMPORT_SNIPPET]
+
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=cwd, env=env, capture_output=True, text=True)
+    total = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'erreur inconnue')
+    return json.loads(result.stdout.strip().splitlines()[-1])['import_s'], total, result.stderr
+
+
+def heaviest_imports(importtime_output, top=10):
+    """Imports directs de app les plus coûteux (temps cumulé, µs) d'après la sortie de -X importtime."""
+    children = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # -X importtime liste les sous-modules avant le module qui les importe
+        if depth == 0:
+            if name.strip() == 'app':
+                return sorted(children, reverse=True)[:top]
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative), name.strip()))
+    return []
+
+
+def benchmark(function, runs, importtime=False):
+    """
+    Returns:
+        dict: {mode: {'import_ms': médiane, 'process_ms': médiane}}
+    """
+    cwd = function_dir(function)
+    results = {}
+
+    for mode in ('sans pyc', 'avec pyc'):
+        import_times, process_times = [], []
+        warm_prefix = tempfile.mkdtemp(prefix='pyc_')
+        try:
+            if mode == 'avec pyc':
+                run_once(cwd, warm_prefix)  # compile une fois, réutilisé ensuite
+            for _ in range(runs):
+                if mode == 'sans pyc':
+                    prefix = tempfile.mkdtemp(prefix='pyc_')
+                    try:
+                        import_s, total_s, _ = run_once(cwd, prefix)
+                    finally:
+                        shutil.rmtree(prefix, ignore_errors=True)
+                else:
+                    import_s, total_s, _ = run_once(cwd, warm_prefix)
+                import_times.append(import_s * 1000)
+                process_times.append(total_s * 1000)
+
+            if importtime and mode == 'avec pyc':
+                _, _, stderr = run_once(cwd, warm_prefix, importtime=True)
+                results['heaviest'] = heaviest_imports(stderr)
+        finally:
+            shutil.rmtree(warm_prefix, ignore_errors=True)
+
+        results[mode] = {
+            'import_ms': round(statistics.median(import_times), 1),
+            'process_ms': round(statistics.median(process_times), 1),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du démarrage à froid des Lambdas")
+    parser.add_argument('functions', nargs='*', help=f"fonctions à mesurer (défaut : {', '.join(FUNCTIONS)})")
+    parser.add_argument('--runs', type=int, default=10, help="nombre de démarrages par mode (défaut : 10)")
+    parser.add_argument('--importtime', action='store_true', help="affiche les imports les plus coûteux")
+    parser.add_argument('--here', action='store_true', help="mesure l'app.py du dossier courant (dans une image)")
+    args = parser.parse_args()
+
+    functions = [None] if args.here else (args.functions or FUNCTIONS)
+    print(f"⏱️ {args.runs} démarrages par mode, Python {sys.version.split()[0]}")
+    print(f"{'fonction':<20} {'mode':<10} {'import (ms)':>12} {'processus (ms)':>15}")
+
+    for function in functions:
+        name = function or os.path.basename(os.getcwd())
+        try:
+            results = benchmark(function, args.runs, importtime=args.importtime)
+        except RuntimeError as e:
+            print(f"{name:<20} ❌ import impossible : {e}")
+            continue
+
+        for mode in ('sans pyc', 'avec pyc'):
+            print(f"{name:<20} {mode:<10} {results[mode]['import_ms']:>12} {results[mode]['process_ms']:>15}")
+        for cumulative_us, module in results.get('heaviest', []):
+            print(f"{'':<20}   {module:<40} {cumulative_us / 1000:>8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
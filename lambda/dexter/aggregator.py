@@ -1,6 +1,7 @@
 import gzip
 import json
 import os
+import sys
 import traceback
 from io import BytesIO
 
@@ -9,10 +10,32 @@ import botocore
 from dotenv import load_dotenv
 from tqdm import tqdm
 
+try:
+    import manifest
+except ImportError:  # exécution locale depuis le dépôt : le module partagé est dans lambda/shared
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+    import manifest
+
 load_dotenv()
 
 bucket_name = 'phardev'
 subfolder_prefix = 'Dexter_history/'
+# Si défini, les fichiers Stock sont sélectionnés via le manifeste du serveur au lieu d'un listing S3
+SERVER_URL = os.environ.get('SERVER_URL')
+
+
+def stock_objects(s3_client):
+    """Fichiers Stock du préfixe : depuis le manifeste si SERVER_URL est défini, sinon par listing S3."""
+    if SERVER_URL:
+        yield from manifest.manifest_objects(SERVER_URL, prefix=subfolder_prefix, file_type='stock')
+        return
+
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=subfolder_prefix):
+        for obj in page.get('Contents', []):
+            filename = obj['Key'][len(subfolder_prefix):]
+            if obj.get('Size', 0) > 0 and filename.startswith("Stock"):
+                yield obj
 
 
 def handler(event, context):
@@ -20,41 +43,30 @@ def handler(event, context):
     aggregated_data = {}
 
     try:
-        paginator = s3_client.get_paginator('list_objects_v2')
-
-        for page in paginator.paginate(Bucket=bucket_name, Prefix=subfolder_prefix):
-            if 'Contents' in page:
-                for obj in tqdm(page['Contents']):
-                    if obj['Key'] == subfolder_prefix or obj.get('Size', 0) == 0:
-                        continue
-
-                    try:
-                        key = obj['Key']
-                        filename = key.split('Dexter_history/')[1]
-
-                        if not filename.startswith("Stock"):
-                            continue
-
-                        # Fetch and decompress file
-                        response = s3_client.get_object(Bucket=bucket_name, Key=key)
-                        compressed_body = response['Body'].read()
-
-                        with gzip.GzipFile(fileobj=BytesIO(compressed_body)) as gz:
-                            json_content = json.load(gz)
-
-                        pharmacy_id = json_content['organization']['id_national']
-                        if pharmacy_id not in aggregated_data:
-                            aggregated_data[pharmacy_id] = []
-
-                        for product in json_content['produits']:
-                            if isinstance(product['code_produit'], list):
-                                for code in product['code_produit']:
-                                    if code.get('referent'):
-                                        aggregated_data[pharmacy_id].append((product['produit_id'], code.get('code')))
-                                        break
-
-                    except Exception as e:
-                        print(f"Failed to process file {obj['Key']}: {traceback.format_exc()}")
+        for obj in tqdm(list(stock_objects(s3_client))):
+            try:
+                key = obj['Key']
+
+                # Fetch and decompress file
+                response = s3_client.get_object(Bucket=bucket_name, Key=key)
+                compressed_body = response['Body'].read()
+
+                with gzip.GzipFile(fileobj=BytesIO(compressed_body)) as gz:
+                    json_content = json.load(gz)
+
+                pharmacy_id = json_content['organization']['id_national']
+                if pharmacy_id not in aggregated_data:
+                    aggregated_data[pharmacy_id] = []
+
+                for product in json_content['produits']:
+                    if isinstance(product['code_produit'], list):
+                        for code in product['code_produit']:
+                            if code.get('referent'):
+                                aggregated_data[pharmacy_id].append((product['produit_id'], code.get('code')))
+                                break
+
+            except Exception as e:
+                print(f"Failed to process file {obj['Key']}: {traceback.format_exc()}")
         for pharmacy_id, values in aggregated_data.items():
             with open(f'{pharmacy_id}_aggregated_data.json', 'w', encoding='utf-8') as f:
                 json.dump(values, f, ensure_ascii=False, indent=4)
@@ -66,4 +78,6 @@ def handler(event, context):
             'body': json.dumps('Error listing objects')
         }
 
-handler(1, 1)
+
+if __name__ == "__main__":
+    handler({}, None)
@@ -1,5 +1,6 @@
 import os
 import re
+import sys
 import json
 import gzip
 from io import BytesIO
@@ -10,9 +11,19 @@ import boto3
 from botocore.exceptions import ClientError
 from tqdm import tqdm
 
+try:
+    import manifest
+except ImportError:  # exécution locale depuis le dépôt : le module partagé est dans lambda/shared
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+    import manifest
+
 # Configuration du bucket et du préfixe
 BUCKET_NAME = 'phardev'
 FOLDER_PREFIX = 'Dexter_history/'  # Dossier à lire dans S3
+# Si défini, les fichiers sont sélectionnés via le manifeste du serveur au lieu d'un listing S3
+SERVER_URL = os.environ.get('SERVER_URL')
+# Statut des fichiers retenus dans le manifeste (vide = tous) ; les archives sont 'processed'
+MANIFEST_STATUS = os.environ.get('MANIFEST_STATUS', 'processed')
 
 
 def extract_date_from_key(key):
@@ -88,6 +99,19 @@ def group_files_by_month(files):
     return files_by_month
 
 
+def group_manifest_files_by_month(server_url):
+    """
+    Regroupe les fichiers "Vente" de FOLDER_PREFIX par mois (début de période) à partir du
+    manifeste du serveur : une requête indexée remplace le listing complet du préfixe.
+    """
+    files_by_month = defaultdict(list)
+    for obj in manifest.manifest_objects(server_url, prefix=FOLDER_PREFIX, file_type='vente', status=MANIFEST_STATUS):
+        if obj['period_start']:
+            files_by_month[obj['period_start'][:7]].append(obj)
+
+    return files_by_month
+
+
 def process_files_by_month(files_by_month):
     """
     Parcourt le dictionnaire groupé par mois, lit l'intérieur de chaque fichier (en le décompressant et en extrayant le JSON),
@@ -141,11 +165,15 @@ def process_files_by_month(files_by_month):
 
 
 def main():
-    print("Liste des fichiers dans le dossier Dexter_history :")
-    files = list_files_in_folder(BUCKET_NAME, FOLDER_PREFIX)
-    print(f"Total des fichiers trouvés : {len(files)}")
+    if SERVER_URL:
+        print("Sélection des fichiers Vente depuis le manifeste :")
+        files_by_month = group_manifest_files_by_month(SERVER_URL)
+    else:
+        print("Liste des fichiers dans le dossier Dexter_history :")
+        files = list_files_in_folder(BUCKET_NAME, FOLDER_PREFIX)
+        print(f"Total des fichiers trouvés : {len(files)}")
+        files_by_month = group_files_by_month(files)
 
-    files_by_month = group_files_by_month(files)
     monthly_sales = process_files_by_month(files_by_month)
 
     # Affichage final
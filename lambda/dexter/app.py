@@ -1,18 +1,59 @@
 import gzip
+import hashlib
 import json
 import os
+import sys
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from io import BytesIO
 
 import boto3
 import botocore
+from botocore.config import Config
 import requests
-from dotenv import load_dotenv
-from tqdm import tqdm
 
-load_dotenv()
+import move
+
+try:
+    import continuation
+except ImportError:  # exécution locale depuis le dépôt : le module partagé est dans lambda/shared
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+    import continuation
+
+try:  # python-dotenv n'est installé qu'en local : dans Lambda, la configuration vient de l'environnement
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
 
 SERVER_URL = os.environ.get('SERVER_URL')
+# Nombre de pharmacies traitées en parallèle (l'ordre reste séquentiel au sein d'une pharmacie)
+MAX_CONCURRENT_PHARMACIES = int(os.environ.get('MAX_CONCURRENT_PHARMACIES', 4))
+# Nombre de fichiers visé par invocation ; le reste est traité par les invocations suivantes
+MAX_FILES_PER_INVOCATION = int(os.environ.get('MAX_FILES_PER_INVOCATION', 500))
+# Transmet le gzip d'origine au serveur sans décompression ni re-sérialisation JSON
+PASSTHROUGH = os.environ.get('DEXTER_PASSTHROUGH', 'true').lower() in ('1', 'true', 'yes')
+# Agrège les ventes par (produit, jour) avant l'envoi (endpoint dexter/create/vente_aggregated)
+AGGREGATE_SALES = os.environ.get('DEXTER_AGGREGATE_SALES', 'false').lower() in ('1', 'true', 'yes')
+# N'envoie que les produits du fichier Stock modifiés depuis le fichier précédent (endpoint dexter/create/stock_delta)
+STOCK_DELTA = os.environ.get('DEXTER_STOCK_DELTA', 'false').lower() in ('1', 'true', 'yes')
+
+BUCKET_NAME = 'phardev'
+# ⭐ CORRECTION : Dexter dépose maintenant dans Dexter/ au lieu de Dexter_history/
+SOURCE_PREFIX = 'Dexter/'
+HISTORY_PREFIX = 'History_dexter/'
+# Empreintes du dernier fichier Stock envoyé, une par pharmacie
+STATE_PREFIX = 'Dexter_state/'
+# Curseur (dernière pharmacie terminée) de la chaîne d'invocations en cours
+PROGRESS_KEY = f"{STATE_PREFIX}process_files.json"
+# Listes de clés restantes trop grandes pour l'événement de continuation (mode "keys")
+KEYS_PREFIX = f"{STATE_PREFIX}keys/"
+
+# Champs d'un produit Stock lus par dexter.process_stock
+STOCK_FIELDS = ('produit_id', 'code_produit', 'taux_Tva', 'libelle_produit', 'qte_stock',
+                'px_achat_PMP_HT', 'px_vte_TTC')
 
 endpoint_priority = {
     'stock': 0,
@@ -21,74 +62,567 @@ endpoint_priority = {
 }
 
 
-def handler(event, context):
-    s3_client = boto3.client('s3')
-    bucket_name = 'phardev'
-    
-    # ⭐ CORRECTION : Dexter dépose maintenant dans Dexter/ au lieu de Dexter_history/
-    subfolder_prefix = 'Dexter/'
+def parse_key(key):
+    """
+    Extrait les informations d'un nom de fichier Dexter.
 
-    try:
-        paginator = s3_client.get_paginator('list_objects_v2')
-        all_files = []
+    Format attendu : "<Type>_<cip>_<gers>_<horodatage>_<date_debut>_<date_fin>.json.gz"
 
-        for page in paginator.paginate(Bucket=bucket_name, Prefix=subfolder_prefix):
-            if 'Contents' in page:
-                for obj in page['Contents']:
-                    if obj['Key'] == subfolder_prefix or obj.get('Size', 0) == 0:
-                        continue
+    Returns:
+        tuple (cip_code, gers_code, end_date, file_type) ou None si le nom est invalide.
+    """
+    filename = key.rsplit('/', 1)[-1].split('.json.gz')[0]
+    parts = filename.split('_')
 
-                    try:
-                        key = obj['Key']
-                        filename = key.split(subfolder_prefix)[1].split('.json.gz')[0]
-                        parts = filename.split('_')
+    if len(parts) < 6:
+        return None
 
-                        if len(parts) < 6:
-                            continue
+    file_type = parts[0].lower()  # Stock, Achat, Vente
+    if file_type not in endpoint_priority:
+        return None
 
-                        file_type = parts[0].lower()  # Stock, Achat, Vente
-                        cip_code = parts[1]  # Code CIP Pharmagest
-                        gers_code = parts[2]  # Code GERS
-                        end_date_str = parts[5]  # Date de fin de la période
+    cip_code = parts[1]  # Code CIP Pharmagest
+    gers_code = parts[2]  # Code GERS
+    end_date = datetime.strptime(parts[5], '%Y-%m-%d')  # Date de fin de la période
 
-                        # Convertir les dates
-                        end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
+    return cip_code, gers_code, end_date, file_type
 
-                        all_files.append((cip_code, gers_code, end_date, file_type, obj))
 
-                    except Exception as e:
-                        print(f"Failed to parse file date for {obj['Key']}: {e}")
+def list_pending_files(s3_client, prefix=SOURCE_PREFIX):
+    """
+    Liste les fichiers en attente sous le préfixe donné.
 
-        # Trier les fichiers par pharmacie (CIP + GERS), puis par date d'extraction, puis par type (Stock, Achat, Vente)
-        all_files.sort(key=lambda x: (x[0], x[1], x[2], endpoint_priority[x[3]]))
+    Returns:
+        list de tuples (cip_code, gers_code, end_date, file_type, key).
+    """
+    all_files = []
+    paginator = s3_client.get_paginator('list_objects_v2')
 
-        # Traitement des fichiers triés
-        for cip_code, gers_code, start_date, file_type, obj in tqdm(all_files):
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'] == prefix or obj.get('Size', 0) == 0:
+                continue
             try:
-                response = s3_client.get_object(Bucket=bucket_name, Key=obj['Key'])
-                compressed_body = response['Body'].read()
+                parsed = parse_key(obj['Key'])
+                if parsed:
+                    all_files.append((*parsed, obj['Key']))
+            except Exception as e:
+                print(f"Failed to parse file date for {obj['Key']}: {e}")
+
+    return all_files
+
+
+def files_from_keys(keys):
+    """Construit la liste des fichiers à traiter à partir d'une liste explicite de clés S3."""
+    all_files = []
+    for key in keys:
+        key = key.strip()
+        if not key:
+            continue
+        try:
+            parsed = parse_key(key)
+            if parsed:
+                all_files.append((*parsed, key))
+            else:
+                print(f"Unexpected file name {key}")
+        except Exception as e:
+            print(f"Failed to parse file date for {key}: {e}")
+    return all_files
+
+
+def group_by_pharmacy(all_files):
+    """
+    Regroupe les fichiers par pharmacie (CIP + GERS) puis les trie par date de fin
+    et par type (Stock, Achat, Vente) au sein de chaque pharmacie.
+    """
+    groups = defaultdict(list)
+    for cip_code, gers_code, end_date, file_type, key in all_files:
+        groups[(cip_code, gers_code)].append((end_date, endpoint_priority[file_type], file_type, key))
+
+    for files in groups.values():
+        files.sort(key=lambda x: (x[0], x[1]))
+
+    return groups
+
+
+def copy_to_history(s3_client, key):
+    """
+    Copie un fichier traité de Dexter/ vers History_dexter/.
+    Les sources sont supprimées par lots dès que leur pharmacie est terminée (archive_sources).
+    """
+    new_key = key.replace(SOURCE_PREFIX, HISTORY_PREFIX, 1)
+    move.copy_object(s3_client, BUCKET_NAME, key, new_key)
+    return {'key': key, 'moved_to': new_key}
+
+
+def report_moves(moves):
+    """Signale au serveur les fichiers archivés pour tenir le manifeste à jour sans listing S3."""
+    if not moves:
+        return
+    try:
+        response = requests.post(
+            f"{SERVER_URL}/dexter/manifest",
+            json={'keys': moves, 'status': 'processed'},
+            timeout=60
+        )
+        print(f"Manifest update: {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        print(f"Manifest update failed: {e}")
+
+
+def report_pending(all_files):
+    """Enregistre dans le manifeste les fichiers en attente listés (les clés déjà connues sont ignorées)."""
+    if not all_files:
+        return
+    try:
+        response = requests.post(
+            f"{SERVER_URL}/dexter/manifest",
+            json={'keys': [key for *_, key in all_files], 'status': 'pending'},
+            timeout=60
+        )
+        print(f"Manifest registration: {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        print(f"Manifest registration failed: {e}")
+
+
+class S3BodyStream:
+    """
+    Enveloppe le StreamingBody d'un objet S3 pour que requests l'envoie tel quel,
+    avec un Content-Length connu (pas de chunked encoding ni de lecture en mémoire).
+    """
+
+    def __init__(self, body, length):
+        self.body = body
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return self.body.iter_chunks()
+
+    def read(self, amt=-1):
+        return self.body.read(amt if amt and amt > 0 else None)
+
+
+def sale_day(value):
+    """Jour (AAAA-MM-JJ) d'un horodatage ISO ; les autres formats sont laissés au serveur."""
+    if not value:
+        return value
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).date().isoformat()
+    except ValueError:
+        return value
+
+
+def aggregate_ventes(ventes):
+    """
+    Réduit les lignes de facture à une ligne par (produit, jour), comme dexter.process_vente
+    côté serveur : quantités cumulées et montant TTC des lignes dont le prix est connu.
+
+    Returns:
+        list de dicts {'product_id', 'date', 'qte', 'ttc'} (ttc à None si aucun prix).
+    """
+    aggregated = {}
+    for vente in ventes:
+        day = sale_day(vente.get('date_acte'))
+        for invoice in vente.get('factures', []):
+            for line in invoice.get('lignes_de_facture', []):
+                product_id = line.get('produit_id')
+                if not product_id:
+                    continue
+                try:
+                    quantite = int(line.get('quantite', 0))
+                except (ValueError, TypeError):
+                    continue
+
+                agg = aggregated.setdefault((str(product_id), day), {'qte': 0, 'ttc': None})
+                agg['qte'] += quantite
+
+                total_net_ttc = line.get('total_net_ttc')
+                if quantite > 0 and total_net_ttc is not None and total_net_ttc > 0:
+                    agg['ttc'] = (agg['ttc'] or 0) + total_net_ttc
+
+    return [
+        {
+            'product_id': product_id,
+            'date': day,
+            'qte': agg['qte'],
+            'ttc': round(agg['ttc'], 4) if agg['ttc'] is not None else None
+        }
+        for (product_id, day), agg in aggregated.items()
+    ]
+
+
+def post_gzip_json(session, url, payload, timeout=None):
+    """POST d'un corps JSON compressé en gzip (décompressé par GzipJSONParser côté serveur)."""
+    return session.post(
+        url,
+        data=gzip.compress(json.dumps(payload).encode('utf-8')),
+        headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'},
+        timeout=timeout
+    )
+
+
+def stock_fingerprint(produit):
+    """Empreinte des champs d'un produit Stock utilisés par le serveur."""
+    raw = json.dumps([produit.get(field) for field in STOCK_FIELDS], sort_keys=True, default=str)
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def stock_state_key(cip_code, gers_code):
+    return f"{STATE_PREFIX}stock_{cip_code}_{gers_code}.json.gz"
+
+
+def load_stock_state(s3_client, state_key):
+    """Charge l'état Stock d'une pharmacie, ou None s'il n'existe pas encore."""
+    try:
+        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=state_key)
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    with gzip.GzipFile(fileobj=response['Body']) as gz:
+        return json.load(gz)
+
+
+def save_stock_state(s3_client, state_key, state):
+    s3_client.put_object(
+        Bucket=BUCKET_NAME,
+        Key=state_key,
+        Body=gzip.compress(json.dumps(state).encode('utf-8')),
+        ContentType='application/json',
+        ContentEncoding='gzip'
+    )
+
+
+def post_stock_delta(session, s3_client, key, json_content, timeout=None):
+    """
+    Envoie seulement les produits nouveaux ou modifiés depuis le dernier fichier Stock
+    envoyé pour la pharmacie, puis enregistre les empreintes du fichier comme nouvel état.
+
+    Un fichier plus ancien que l'état (retraitement) est envoyé en entier sans toucher
+    à l'état : les produits ignorés doivent toujours correspondre au dernier snapshot.
+    Le serveur supprime l'état d'une pharmacie quand il ingère lui-même un de ses fichiers
+    Stock (dexter_s3.ingest_keys) : le fichier suivant est alors envoyé en entier.
+    """
+    cip_code, gers_code, end_date, _ = parse_key(key)
+    state_key = stock_state_key(cip_code, gers_code)
+    file_date = end_date.strftime('%Y-%m-%d')
+
+    state = load_stock_state(s3_client, state_key)
+    is_latest = not state or state.get('end_date', '') <= file_date
+    previous = state.get('fingerprints', {}) if state and is_latest else {}
+
+    produits = json_content.get('produits', [])
+    fingerprints, changed = {}, []
+    for produit in produits:
+        product_id = str(produit.get('produit_id'))
+        fingerprint = stock_fingerprint(produit)
+        fingerprints[product_id] = fingerprint
+        if previous.get(product_id) != fingerprint:
+            changed.append(produit)
+
+    print(f"{key}: {len(changed)}/{len(produits)} produits modifiés")
+    response = post_gzip_json(session, f"{SERVER_URL}/dexter/create/stock_delta", {
+        'organization': json_content.get('organization', {}),
+        'produits': changed,
+        'delta': {
+            'total': len(produits),
+            'changed': len(changed),
+            'base_key': state.get('source_key') if previous else None
+        }
+    }, timeout=timeout)
+
+    if response.status_code == 200 and is_latest:
+        save_stock_state(s3_client, state_key, {'source_key': key, 'end_date': file_date, 'fingerprints': fingerprints})
+    return response
 
-                with gzip.GzipFile(fileobj=BytesIO(compressed_body)) as gz:
-                    json_content = json.load(gz)
 
-                print(f"Processing {obj['Key']}")
+def post_file(session, s3_client, key, file_type, timeout=None):
+    """
+    Envoie un fichier Dexter au serveur.
 
-                response = requests.post(f"{SERVER_URL}/dexter/create/{file_type}", json=json_content)
-                print(f"{response.status_code}")
+    En mode pass-through, les octets gzip d'origine sont transmis en flux depuis S3
+    avec "Content-Encoding: gzip" et c'est le serveur qui les décompresse.
+    Avec DEXTER_AGGREGATE_SALES, les fichiers de ventes sont agrégés par (produit, jour)
+    et envoyés sous forme compacte ; avec DEXTER_STOCK_DELTA, seuls les produits Stock
+    modifiés sont envoyés. timeout s'applique au POST (voir continuation.request_timeout).
+    """
+    response = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
+    url = f"{SERVER_URL}/dexter/create/{file_type}"
+
+    if file_type == 'stock' and STOCK_DELTA:
+        with gzip.GzipFile(fileobj=response['Body']) as gz:
+            json_content = json.load(gz)
+        return post_stock_delta(session, s3_client, key, json_content, timeout=timeout)
+
+    if file_type == 'vente' and AGGREGATE_SALES:
+        with gzip.GzipFile(fileobj=response['Body']) as gz:
+            json_content = json.load(gz)
+        records = aggregate_ventes(json_content.get('ventes', []))
+        print(f"{key}: {len(records)} ventes agrégées")
+        return post_gzip_json(session, f"{url}_aggregated", {
+            'organization': json_content.get('organization', {}),
+            'ventes_agregees': records
+        }, timeout=timeout)
+
+    if PASSTHROUGH:
+        return session.post(
+            url,
+            data=S3BodyStream(response['Body'], response['ContentLength']),
+            headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'},
+            timeout=timeout
+        )
+
+    compressed_body = response['Body'].read()
+    with gzip.GzipFile(fileobj=BytesIO(compressed_body)) as gz:
+        json_content = json.load(gz)
+
+    return session.post(url, json=json_content, timeout=timeout)
+
+
+def process_pharmacy(s3_client, files, move_executor, deadline=None):
+    """
+    Traite séquentiellement les fichiers d'une pharmacie pour conserver l'ordre
+    Stock -> Achat -> Vente. La copie S3 d'un fichier vers l'historique est
+    déléguée à move_executor afin de se chevaucher avec le POST du fichier suivant.
+
+    Aucun nouveau fichier n'est démarré une fois la deadline passée : les fichiers
+    restants sont renvoyés dans stats['pending']. Le timeout de chaque POST est borné
+    par le temps restant avant la deadline.
+
+    Returns:
+        tuple (stats, move_futures)
+    """
+    stats = {'processed': 0, 'failed': 0, 'pending': []}
+    move_futures = []
+
+    with requests.Session() as session:
+        for index, (_, _, file_type, key) in enumerate(files):
+            if continuation.time_is_up(deadline):
+                stats['pending'] = [pending_key for _, _, _, pending_key in files[index:]]
+                print(f"Time budget reached, {len(stats['pending'])} files left for the next invocation")
+                break
+            try:
+                print(f"Processing {key}")
+
+                response = post_file(session, s3_client, key, file_type,
+                                     timeout=continuation.request_timeout(deadline))
+                print(f"{key}: {response.status_code}")
 
                 if response.status_code == 200:
-                    new_key = obj['Key'].replace(subfolder_prefix, 'History_dexter/')
-                    s3_client.copy_object(
-                        Bucket=bucket_name,
-                        CopySource={'Bucket': bucket_name, 'Key': obj['Key']},
-                        Key=new_key
-                    )
-                    s3_client.delete_object(Bucket=bucket_name, Key=obj['Key'])
-                    print(f"File {obj['Key']} moved.")
+                    stats['processed'] += 1
+                    # Les fichiers déjà archivés (retraitement) restent en place
+                    if key.startswith(SOURCE_PREFIX):
+                        move_futures.append(move_executor.submit(copy_to_history, s3_client, key))
                 else:
-                    print(f"POST failed for {obj['Key']}: {response.status_code}")
+                    stats['failed'] += 1
+                    print(f"POST failed for {key}: {response.status_code}")
             except Exception as e:
-                print(f"Failed to process file {obj['Key']}: {e}")
+                stats['failed'] += 1
+                print(f"Failed to process file {key}: {e}")
+
+    return stats, move_futures
+
+
+def parse_cursor(cursor):
+    """
+    Pharmacie (cip_code, gers_code) d'un curseur [cip, gers], ou None.
+
+    Les anciens curseurs "cip_gers" sont encore acceptés (le CIP ne contient pas de '_').
+    """
+    if not cursor:
+        return None
+    if isinstance(cursor, str):
+        cursor = cursor.split('_', 1)
+    cip_code, gers_code = cursor
+    return cip_code, gers_code
+
+
+def archive_sources(s3_client, moves):
+    """
+    Supprime les sources copiées dans l'historique (lots de 1000 clés) et signale au
+    manifeste les fichiers déplacés.
+
+    Returns:
+        tuple (nombre de sources supprimées, nombre d'échecs)
+    """
+    if not moves:
+        return 0, 0
+    try:
+        deleted, errors = move.delete_keys(s3_client, BUCKET_NAME, [m['key'] for m in moves])
+    except botocore.exceptions.ClientError as error:
+        print(f"Error deleting archived sources: {error}")
+        return 0, len(moves)
+    for key, error in errors.items():
+        print(f"Failed to delete {key}: {error}")
+
+    deleted = set(deleted)
+    report_moves([m for m in moves if m['key'] in deleted])
+    return len(deleted), len(errors)
+
+
+def completed_cursor(selected, finished, cursor):
+    """Curseur [cip, gers] de la dernière pharmacie d'une suite de pharmacies sélectionnées toutes terminées."""
+    for pharmacy in selected:
+        if pharmacy not in finished:
+            break
+        cursor = list(pharmacy)
+    return cursor
+
+
+def process_files(s3_client, all_files, max_workers=MAX_CONCURRENT_PHARMACIES, deadline=None, cursor=None,
+                  max_files=MAX_FILES_PER_INVOCATION, progress=None):
+    """
+    Traite les fichiers en parallèle par pharmacie, avec au plus max_workers
+    pharmacies simultanées.
+
+    Seules les pharmacies situées après le curseur [cip, gers] (même ordre que le tri des
+    pharmacies) sont prises, par
+    pharmacies entières, jusqu'à environ max_files fichiers. Aucune pharmacie n'est
+    démarrée une fois la deadline passée. Les sources d'une pharmacie sont supprimées dès
+    qu'elle est terminée, puis le curseur est enregistré dans progress (ProgressStore).
+
+    Le reste est décrit par totals['continuation'] : {'cursor': ...} et {'keys': [...]}
+    pour reprendre, ou None si tout est traité.
+    """
+    groups = group_by_pharmacy(all_files)
+    after = parse_cursor(cursor)
+    cursor = list(after) if after else None
+    pharmacies = sorted(pharmacy for pharmacy in groups if not after or pharmacy > after)
+
+    selected, selected_files = [], 0
+    for pharmacy in pharmacies:
+        if selected and max_files and selected_files + len(groups[pharmacy]) > max_files:
+            break
+        selected.append(pharmacy)
+        selected_files += len(groups[pharmacy])
+    remaining = pharmacies[len(selected):]
+
+    print(f"{len(all_files)} files for {len(groups)} pharmacies, {selected_files} files for "
+          f"{len(selected)} pharmacies in this invocation ({max_workers} workers)")
+
+    totals = {'pharmacies': len(selected), 'processed': 0, 'failed': 0, 'moved': 0, 'move_failed': 0}
+    finished = set()
+    pending = {}
+    saved_cursor = cursor
+
+    with ThreadPoolExecutor(max_workers=max_workers) as move_executor, \
+            ThreadPoolExecutor(max_workers=max_workers) as pharmacy_executor:
+
+        def run(pharmacy):
+            return process_pharmacy(s3_client, groups[pharmacy], move_executor, deadline)
+
+        for pharmacy, future in continuation.submit_until_deadline(pharmacy_executor, run, selected, deadline,
+                                                                   max_workers):
+            cip_code, gers_code = pharmacy
+            stats, move_futures = future.result()
+            totals['processed'] += stats['processed']
+            totals['failed'] += stats['failed']
+
+            moves = []
+            for move_future in move_futures:
+                try:
+                    moves.append(move_future.result())
+                except Exception as e:
+                    totals['move_failed'] += 1
+                    print(f"Failed to copy file for {cip_code}_{gers_code}: {e}")
+            moved, move_failed = archive_sources(s3_client, moves)
+            totals['moved'] += moved
+            totals['move_failed'] += move_failed
+
+            if stats['pending']:
+                pending[pharmacy] = stats.pop('pending')
+            else:
+                finished.add(pharmacy)
+            print(f"Pharmacy {cip_code}_{gers_code} done: {stats}")
+
+            next_cursor = completed_cursor(selected, finished, cursor)
+            if progress and next_cursor != saved_cursor:
+                progress.save({'cursor': next_cursor})
+                saved_cursor = next_cursor
+
+    # Pharmacies interrompues ou jamais démarrées (deadline) : reprises à partir du curseur
+    not_started = [pharmacy for pharmacy in selected if pharmacy not in finished and pharmacy not in pending]
+    totals['pending'] = sum(len(keys) for keys in pending.values()) + \
+        sum(len(groups[pharmacy]) for pharmacy in not_started)
+    totals['continuation'] = None
+    if pending or not_started or remaining:
+        totals['continuation'] = {
+            'cursor': completed_cursor(selected, finished, cursor),
+            'keys': [key for keys in pending.values() for key in keys] +
+                    [key for pharmacy in not_started + remaining for _, _, _, key in groups[pharmacy]]
+        }
+    return totals
+
+
+def keys_store(store_key, s3_client):
+    return continuation.ProgressStore(store_key, bucket=BUCKET_NAME, s3_client=s3_client)
+
+
+def keys_event(keys, s3_client, store=False):
+    """
+    Partie "clés" d'un événement de continuation : {'keys': [...]} si elle tient dans
+    l'événement, sinon (ou si store) {'keys_object': clé S3} vers la liste enregistrée
+    dans Dexter_state/keys/.
+    """
+    event = {'keys': keys}
+    if store or continuation.event_too_large(event):
+        store_key = f"{KEYS_PREFIX}{uuid.uuid4().hex}.json"
+        if keys_store(store_key, s3_client).save(event):
+            return {'keys_object': store_key}
+    return event
+
+
+def handler(event, context):
+    """
+    Traite les fichiers Dexter déposés dans S3, par lots bornés en temps et en nombre.
+
+    Si l'événement contient une clé "keys" (ou "keys_object", liste enregistrée dans
+    Dexter_state/keys/), seuls ces fichiers sont (re)traités ; sinon le préfixe Dexter/ est parcouru à partir de la pharmacie "cursor", ou à défaut
+    du curseur enregistré dans Dexter_state/ par une chaîne d'invocations interrompue.
+    Tant qu'il reste du travail, la Lambda se ré-invoque avec l'événement de
+    continuation (renvoyé aussi dans la réponse pour une exécution locale). Si la
+    ré-invocation échoue en mode liste, les clés restantes sont enregistrées dans
+    Dexter_state/keys/ et l'événement à relancer est affiché.
+    """
+    event = event if isinstance(event, dict) else {}
+    keys = event.get('keys')
+    max_workers = int(event.get('max_workers', MAX_CONCURRENT_PHARMACIES))
+    deadline = continuation.get_deadline(context)
+
+    # Un client boto3 est thread-safe : on dimensionne son pool pour les workers POST + déplacement
+    s3_client = boto3.client('s3', config=Config(max_pool_connections=max(10, 2 * max_workers)))
+
+    # Liste de clés enregistrée par une invocation précédente, supprimée une fois le lot traité
+    consumed_keys = keys_store(event['keys_object'], s3_client) if event.get('keys_object') else None
+    if consumed_keys:
+        keys = (consumed_keys.load() or {}).get('keys')
+        if keys is None:
+            print(f"Missing keys object {event['keys_object']}")
+            return {
+                'statusCode': 500,
+                'body': json.dumps('Missing keys object')
+            }
+
+    # Le curseur n'est enregistré que pour le parcours du préfixe, pas pour une liste explicite
+    progress = None if keys else continuation.ProgressStore(PROGRESS_KEY, bucket=BUCKET_NAME, s3_client=s3_client)
+    cursor = None
+    if progress:
+        cursor = event.get('cursor') or (progress.load() or {}).get('cursor')
+        if cursor and not event.get('cursor'):
+            print(f"Resuming after saved cursor {cursor}")
+
+    try:
+        if keys:
+            all_files = files_from_keys(keys)
+        else:
+            all_files = list_pending_files(s3_client)
+            report_pending(all_files)
+
+        totals = process_files(s3_client, all_files, max_workers=max_workers, deadline=deadline,
+                               cursor=cursor, progress=progress)
 
     except botocore.exceptions.ClientError as error:
         print(f"Error listing objects: {error}")
@@ -97,11 +631,42 @@ def handler(event, context):
             'body': json.dumps('Error listing objects')
         }
 
+    next_event = totals.pop('continuation')
+    if progress and not next_event:
+        progress.clear()
+    if next_event:
+        # En mode liste, le curseur suffit : les fichiers restants seront relistés
+        next_event = {
+            **(keys_event(next_event['keys'], s3_client) if keys else {'cursor': next_event['cursor']}),
+            'max_workers': max_workers,
+            'iteration': int(event.get('iteration', 0)) + 1
+        }
+        totals['continued'] = continuation.reinvoke(context, next_event)
+        if keys and context is not None and not totals['continued']:
+            # Sans ProgressStore en mode liste : les clés restantes ne doivent pas se perdre
+            if 'keys' in next_event:
+                next_event.update(keys_event(next_event.pop('keys'), s3_client, store=True))
+            print(f"Continuation not started, relaunch with: {json.dumps(next_event)}")
+    if consumed_keys:
+        consumed_keys.clear()
+
     return {
         'statusCode': 200,
-        'body': json.dumps(f'Successfully processed files')
+        'body': json.dumps({'message': 'Successfully processed files', 'results': totals, 'continuation': next_event})
     }
 
 
 if __name__ == "__main__":
-    handler(1, 1)
\ No newline at end of file
+    # Usage : python app.py [fichier_de_cles.txt]  (ex: files_to_reprocess.txt)
+    # En local il n'y a pas de ré-invocation : on enchaîne les lots jusqu'à épuisement
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding='utf-8') as f:
+            event = {'keys': f.read().splitlines()}
+    else:
+        event = {}
+
+    while event is not None:
+        result = handler(event, None)
+        print(result)
+        body = json.loads(result['body'])
+        event = body.get('continuation') if isinstance(body, dict) else None
@@ -1,57 +1,248 @@
+import hashlib
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
-from tqdm import tqdm
+
+# Nombre maximum de clés acceptées par un appel delete_objects
+DELETE_BATCH_SIZE = 1000
+MAX_COPY_WORKERS = int(os.environ.get('MAX_COPY_WORKERS', 32))
+
+
+def get_s3_client(max_workers=MAX_COPY_WORKERS):
+    """Client S3 dont le pool de connexions suit le nombre de threads de copie."""
+    return boto3.client('s3', config=Config(max_pool_connections=max(10, max_workers)))
 
 
-def rename_s3_folder(bucket_name, old_folder, new_folder):
+def checkpoint_file(old_folder, new_folder):
+    """Fichier de reprise propre à un déplacement (old_folder -> new_folder)."""
+    digest = hashlib.sha1(f"{old_folder}\0{new_folder}".encode('utf-8')).hexdigest()[:12]
+    return f"move_checkpoint_{digest}.txt"
+
+
+def load_checkpoint(checkpoint_path):
     """
-    Déplace tous les objets de old_folder vers new_folder dans le même bucket S3.
+    Charge les copies déjà faites depuis le fichier de reprise (une ligne 'ancienne_clé\tnouvelle_clé').
 
-    :param bucket_name: Nom du bucket S3.
-    :param old_folder: Préfixe actuel du dossier (doit se terminer par '/').
-    :param new_folder: Nouveau préfixe du dossier (doit se terminer par '/').
+    Returns:
+        dict {ancienne_clé: nouvelle_clé}
+    """
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return {}
+    copied = {}
+    with open(checkpoint_path, encoding='utf-8') as f:
+        for line in f:
+            old_key, sep, new_key = line.rstrip('\n').partition('\t')
+            # Ligne tronquée par une interruption ou ancien format sans destination : ignorée
+            if sep and old_key and new_key:
+                copied[old_key] = new_key
+    return copied
+
+
+def save_checkpoint(checkpoint_path, moves):
+    """Ajoute au fichier de reprise les (ancienne_clé, nouvelle_clé) copiées, avant la suppression des sources."""
+    if not checkpoint_path or not moves:
+        return
+    with open(checkpoint_path, 'a', encoding='utf-8') as f:
+        f.writelines(f"{old_key}\t{new_key}\n" for old_key, new_key in moves)
+
+
+def clear_checkpoint(checkpoint_path):
+    """Supprime le fichier de reprise une fois toutes les sources supprimées."""
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+
+def copy_object(s3_client, bucket_name, old_key, new_key):
+    s3_client.copy_object(
+        Bucket=bucket_name,
+        CopySource={'Bucket': bucket_name, 'Key': old_key},
+        Key=new_key
+    )
+    return old_key, new_key
+
+
+def copy_objects(s3_client, bucket_name, moves, executor):
+    """
+    Copie en parallèle une liste de (ancienne_clé, nouvelle_clé).
+
+    Returns:
+        tuple (liste des (ancienne_clé, nouvelle_clé) copiées, {clé: erreur})
+    """
+    copied, errors = [], {}
+    futures = {
+        executor.submit(copy_object, s3_client, bucket_name, old_key, new_key): old_key
+        for old_key, new_key in moves
+    }
+    for future in as_completed(futures):
+        try:
+            copied.append(future.result())
+        except ClientError as e:
+            errors[futures[future]] = str(e)
+    return copied, errors
+
+
+def object_exists(s3_client, bucket_name, key):
+    """True si l'objet existe (head_object), False s'il est introuvable."""
+    try:
+        s3_client.head_object(Bucket=bucket_name, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+    return True
+
+
+def confirmed_copies(s3_client, bucket_name, moves, executor):
+    """
+    Parmi les (ancienne_clé, nouvelle_clé) du fichier de reprise, celles dont la destination
+    existe encore : seules leurs sources peuvent être supprimées sans nouvelle copie.
+
+    Returns:
+        tuple (liste des déplacements confirmés, liste des déplacements à recopier, {clé: erreur})
+    """
+    confirmed, missing, errors = [], [], {}
+    futures = {
+        executor.submit(object_exists, s3_client, bucket_name, new_key): (old_key, new_key)
+        for old_key, new_key in moves
+    }
+    for future in as_completed(futures):
+        move = futures[future]
+        try:
+            (confirmed if future.result() else missing).append(move)
+        except ClientError as e:
+            errors[move[0]] = str(e)
+    return confirmed, missing, errors
+
+
+def delete_keys(s3_client, bucket_name, keys):
+    """
+    Supprime les clés par lots de 1000 avec delete_objects.
+
+    Returns:
+        tuple (clés supprimées, {clé: erreur})
+    """
+    deleted, errors = [], {}
+    for i in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[i:i + DELETE_BATCH_SIZE]
+        response = s3_client.delete_objects(
+            Bucket=bucket_name,
+            Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+        )
+        batch_errors = {err['Key']: err.get('Message', err.get('Code')) for err in response.get('Errors', [])}
+        errors.update(batch_errors)
+        deleted.extend(key for key in batch if key not in batch_errors)
+    return deleted, errors
+
+
+def move_objects(s3_client, bucket_name, moves, max_workers=MAX_COPY_WORKERS, checkpoint_path=None, executor=None):
+    """
+    Déplace des objets : copies en parallèle puis suppression des sources par lots.
+
+    Une source n'est supprimée que si sa copie a réussi. Les couples (ancienne_clé,
+    nouvelle_clé) copiés sont ajoutés au fichier de reprise avant la suppression de leur
+    lot : si la suppression échoue ou est interrompue, une relance ne recopie pas ces
+    sources. Une entrée du fichier n'évite la copie que si elle a la même destination et
+    que head_object confirme que cette destination existe ; sinon la source est recopiée.
+
+    Args:
+        moves: liste de tuples (ancienne_clé, nouvelle_clé).
+        checkpoint_path: fichier de reprise optionnel, propre à ce déplacement (voir checkpoint_file).
+        executor: ThreadPoolExecutor optionnel à réutiliser.
+
+    Returns:
+        dict: {'moved': [...], 'errors': {clé: erreur}}
     """
-    s3 = boto3.resource('s3')
-    bucket = s3.Bucket(bucket_name)
+    checkpoint = load_checkpoint(checkpoint_path)
+    moves = [(old_key, new_key) for old_key, new_key in moves if old_key != new_key]
 
+    moved, errors = [], {}
+    own_executor = executor is None
+    executor = executor or ThreadPoolExecutor(max_workers=max_workers)
     try:
-        # Liste tous les objets dans l'ancien dossier
-        objects_to_move = list(bucket.objects.filter(Prefix=old_folder))
-        total_objects = len(objects_to_move)
+        for i in range(0, len(moves), DELETE_BATCH_SIZE):
+            batch = moves[i:i + DELETE_BATCH_SIZE]
+            checkpointed = [move for move in batch if checkpoint.get(move[0]) == move[1]]
+            confirmed, missing, check_errors = confirmed_copies(s3_client, bucket_name, checkpointed, executor)
 
-        if total_objects == 0:
-            print(f"Aucun objet trouvé dans le dossier {old_folder}.")
-            return
+            to_copy = [move for move in batch if checkpoint.get(move[0]) != move[1]] + missing
+            copied, copy_errors = copy_objects(s3_client, bucket_name, to_copy, executor)
+            save_checkpoint(checkpoint_path, copied)
 
-        print(f"{total_objects} objets trouvés dans le dossier {old_folder}.")
+            deleted, delete_errors = delete_keys(
+                s3_client, bucket_name, [old_key for old_key, _ in confirmed + copied]
+            )
+            moved.extend(deleted)
+            errors.update(check_errors)
+            errors.update(copy_errors)
+            errors.update(delete_errors)
+            print(f"{len(moved)}/{len(moves)} objets déplacés ({len(errors)} erreurs)")
+    finally:
+        if own_executor:
+            executor.shutdown()
 
-        for obj in tqdm(objects_to_move, desc="Déplacement des objets"):
-            old_key = obj.key
-            # Définir le nouveau key en remplaçant l'ancien préfixe par le nouveau
-            new_key = old_key.replace(old_folder, new_folder, 1)
+    return {'moved': moved, 'errors': errors}
 
-            # Ignorer si c'est le dossier lui-même (ex: Dexter_history/)
-            if old_key == old_folder:
-                continue
 
-            # Copier l'objet vers le nouveau préfixe
-            bucket.copy({
-                'Bucket': bucket_name,
-                'Key': old_key
-            }, new_key)
+def rename_s3_folder(bucket_name, old_folder, new_folder, max_workers=MAX_COPY_WORKERS, checkpoint_path=None):
+    """
+    Déplace tous les objets de old_folder vers new_folder dans le même bucket S3.
 
-            # Supprimer l'objet original
-            obj.delete()
+    Les objets sont traités page par page (1000 clés) : copies parallèles puis un
+    seul delete_objects par page. En cas d'interruption, relancer la commande reprend
+    là où elle s'était arrêtée (les sources déplacées n'apparaissent plus au listing,
+    et le fichier de reprise évite de recopier les clés dont la suppression a échoué).
+    Le fichier de reprise est propre au couple (old_folder, new_folder) et supprimé
+    après un passage complet sans erreur.
 
-        print(f"Tous les objets ont été déplacés de {old_folder} vers {new_folder} avec succès.")
+    :param bucket_name: Nom du bucket S3.
+    :param old_folder: Préfixe actuel du dossier (doit se terminer par '/').
+    :param new_folder: Nouveau préfixe du dossier (doit se terminer par '/').
+    :param checkpoint_path: Fichier de reprise optionnel, checkpoint_file(old_folder, new_folder) par défaut.
+    """
+    if checkpoint_path is None:
+        checkpoint_path = checkpoint_file(old_folder, new_folder)
+    s3_client = get_s3_client(max_workers)
+    paginator = s3_client.get_paginator('list_objects_v2')
+    total_moved, all_errors = 0, {}
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=old_folder):
+                moves = [
+                    (obj['Key'], obj['Key'].replace(old_folder, new_folder, 1))
+                    for obj in page.get('Contents', [])
+                    # Ignorer le dossier lui-même (ex: Dexter_history/)
+                    if obj['Key'] != old_folder
+                ]
+                result = move_objects(s3_client, bucket_name, moves, checkpoint_path=checkpoint_path,
+                                      executor=executor)
+                total_moved += len(result['moved'])
+                all_errors.update(result['errors'])
 
     except ClientError as e:
         print(f"Erreur lors du renommage du dossier : {e}")
+        all_errors[old_folder] = str(e)
+    else:
+        if not all_errors:
+            clear_checkpoint(checkpoint_path)
+
+    if total_moved == 0 and not all_errors:
+        print(f"Aucun objet trouvé dans le dossier {old_folder}.")
+        return
+
+    print(f"{total_moved} objets déplacés de {old_folder} vers {new_folder}, {len(all_errors)} erreurs.")
+    for key, error in all_errors.items():
+        print(f"  {key}: {error}")
 
 
 if __name__ == "__main__":
     bucket_name = 'phardev'
     old_folder = 'Dexter/Dexter_history/'  # Assurez-vous que le préfixe se termine par '/'
     new_folder = 'Dexter/'  # Assurez-vous que le préfixe se termine par '/'
+    checkpoint_path = sys.argv[1] if len(sys.argv) > 1 else None
 
-    rename_s3_folder(bucket_name, old_folder, new_folder)
+    rename_s3_folder(bucket_name, old_folder, new_folder, checkpoint_path=checkpoint_path)
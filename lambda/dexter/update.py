@@ -23,7 +23,9 @@ ecr_client = session.client('ecr', region_name='eu-west-3')
 image_tag = f"430054308525.dkr.ecr.eu-west-3.amazonaws.com/{repository_name}:latest"
 
 docker_client = docker_from_env()
-image, build_log = docker_client.images.build(path=os.path.dirname(os.path.abspath(__file__)), tag=image_tag, rm=True)
+# Contexte de build : le dossier lambda/, pour inclure le module partagé shared/continuation.py
+lambda_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+image, build_log = docker_client.images.build(path=lambda_dir, dockerfile='dexter/Dockerfile', tag=image_tag, rm=True)
 for line in build_log:
     print(line)
 # Obtenir le mot de passe d'authentification ECR
@@ -0,0 +1,154 @@
+"""
+Outils de reprise historique (backfill) : points de reprise et suivi du débit.
+
+- CheckpointStore : fichier JSON Lines où chaque étape terminée (pharmacie, flux, période)
+  est ajoutée dès sa fin ; une reprise saute exactement les étapes déjà enregistrées ;
+- ThroughputMeter : compteurs thread-safe, journalisés périodiquement (étapes/s,
+  enregistrements/s, Mo/s, temps restant estimé).
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+
+class CheckpointStore:
+    """
+    Étapes terminées, une par ligne : {"pharmacy": ..., "stream": ..., "dt1": ..., "dt2": ...}.
+
+    Le fichier n'est jamais réécrit : une interruption ne peut perdre que la ligne en cours.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if path and os.path.exists(path):
+            line = ''
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.done.add(self.key(entry['pharmacy'], entry['stream'], entry.get('dt1', ''), entry.get('dt2', '')))
+                    except (ValueError, KeyError):
+                        continue  # ligne tronquée par une interruption
+                truncated = bool(line) and not line.endswith('\n')
+            if truncated:
+                # Les prochaines lignes ne doivent pas se coller à la ligne tronquée
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write('\n')
+
+    @staticmethod
+    def key(pharmacy_id, stream, dt1='', dt2=''):
+        return str(pharmacy_id), stream, dt1 or '', dt2 or ''
+
+    def is_done(self, pharmacy_id, stream, dt1='', dt2=''):
+        return self.key(pharmacy_id, stream, dt1, dt2) in self.done
+
+    def pending(self, pharmacy_ids, stream, dt1='', dt2=''):
+        """Pharmacies de la liste dont l'étape (stream, dt1, dt2) reste à faire."""
+        return [pharmacy_id for pharmacy_id in pharmacy_ids if not self.is_done(pharmacy_id, stream, dt1, dt2)]
+
+    def pending_runs(self, pharmacy_ids, stream, periods):
+        """
+        Suites de périodes consécutives restant à faire pour le même ensemble de pharmacies,
+        à récupérer d'un seul tenant : [(pharmacies, [(dt1, dt2), ...]), ...].
+        """
+        runs = []
+        for period in periods:
+            pending = self.pending(pharmacy_ids, stream, *period)
+            if pending and runs and runs[-1][0] == pending:
+                runs[-1][1].append(period)
+            elif pending:
+                runs.append((pending, [period]))
+        return runs
+
+    def mark_done(self, pharmacy_ids, stream, dt1='', dt2='', **info):
+        """Enregistre l'étape comme terminée pour chaque pharmacie (info : compteurs libres)."""
+        at = datetime.now().isoformat(timespec='seconds')
+        lines = []
+        with self.lock:
+            for pharmacy_id in pharmacy_ids:
+                key = self.key(pharmacy_id, stream, dt1, dt2)
+                if key in self.done:
+                    continue
+                self.done.add(key)
+                lines.append(json.dumps({
+                    'pharmacy': key[0], 'stream': stream, 'dt1': key[2], 'dt2': key[3], 'at': at, **info
+                }, ensure_ascii=False))
+            if lines and self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(lines) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def __len__(self):
+        return len(self.done)
+
+
+class ThroughputMeter:
+    """
+    Débit d'une reprise en cours, journalisé toutes les `interval` secondes dans un thread.
+
+    S'utilise comme gestionnaire de contexte :
+        with ThroughputMeter(total_steps, log=logger.info) as meter:
+            meter.add(steps=1, records=n, size=len(response.content))
+    """
+
+    def __init__(self, total_steps, interval=10, log=print):
+        self.total_steps = total_steps
+        self.interval = interval
+        self.log = log
+        self.lock = threading.Lock()
+        self.steps = self.failed = self.records = self.bytes = 0
+        self.start = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, steps=0, records=0, size=0, failed=0):
+        with self.lock:
+            self.steps += steps
+            self.failed += failed
+            self.records += records
+            self.bytes += size
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = max(time.monotonic() - self.start, 1e-6)
+            done = self.steps + self.failed
+            rate = self.steps / elapsed
+            remaining = max(self.total_steps - done, 0)
+            return {
+                'steps': self.steps,
+                'failed': self.failed,
+                'total_steps': self.total_steps,
+                'elapsed_s': round(elapsed, 1),
+                'steps_per_s': round(rate, 2),
+                'records_per_s': round(self.records / elapsed, 1),
+                'mb_per_s': round(self.bytes / elapsed / 1e6, 2),
+                'eta_s': round(remaining / rate) if rate else None,
+            }
+
+    def report(self):
+        s = self.snapshot()
+        percent = 100 * (s['steps'] + s['failed']) / s['total_steps'] if s['total_steps'] else 100
+        eta = f"{s['eta_s'] // 60} min {s['eta_s'] % 60} s" if s['eta_s'] is not None else '?'
+        self.log(f"⏱️ {s['steps'] + s['failed']}/{s['total_steps']} étapes ({percent:.1f}%, {s['failed']} échecs) | "
+                 f"{s['steps_per_s']} étapes/s | {s['records_per_s']} enregistrements/s | "
+                 f"{s['mb_per_s']} Mo/s | reste ~{eta}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='throughput', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.report()
@@ -0,0 +1,170 @@
+"""
+Exécution découpée des Lambdas : chaque invocation traite un lot borné dans le temps,
+puis se ré-invoque (de façon asynchrone) avec un curseur de reprise dans l'événement.
+
+Le curseur voyage dans l'événement et, avec ProgressStore, est aussi enregistré dans S3
+après chaque unité de travail terminée : si une invocation est tuée ou si la ré-invocation
+se perd, l'invocation suivante de la fonction reprend au dernier curseur enregistré.
+Une fois la deadline passée, plus aucune unité n'est soumise (submit_until_deadline).
+
+Exécuté en local (sans contexte Lambda), reinvoke() ne fait rien et renvoie False :
+c'est à l'appelant de boucler sur l'événement de continuation renvoyé par le handler.
+"""
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+# Marge gardée avant le timeout de la Lambda pour finir le lot en cours et se ré-invoquer
+TIME_MARGIN_SECONDS = int(os.environ.get('TIME_MARGIN_SECONDS', 120))
+# Garde-fou contre une chaîne d'invocations sans fin
+MAX_ITERATIONS = int(os.environ.get('MAX_ITERATIONS', 50))
+# Bucket S3 de la progression des chaînes d'invocations (non défini : pas de persistance)
+STATE_BUCKET = os.environ.get('CONTINUATION_BUCKET')
+# Délai maximal d'une requête HTTP lancée avant la deadline (secondes)
+REQUEST_TIMEOUT_SECONDS = int(os.environ.get('REQUEST_TIMEOUT_SECONDS', 300))
+# Taille maximale de l'événement d'une invocation asynchrone (au-delà, invoke échoue)
+MAX_EVENT_BYTES = 256 * 1024
+
+_NO_ITEM = object()
+
+
+def get_deadline(context, margin_seconds=TIME_MARGIN_SECONDS):
+    """
+    Instant (time.monotonic) au-delà duquel il ne faut plus démarrer de travail,
+    ou None hors Lambda.
+    """
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+    return time.monotonic() + context.get_remaining_time_in_millis() / 1000 - margin_seconds
+
+
+def time_is_up(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def request_timeout(deadline, default=REQUEST_TIMEOUT_SECONDS, margin_seconds=TIME_MARGIN_SECONDS):
+    """
+    Timeout (secondes) d'une requête HTTP démarrée avant la deadline : default hors Lambda,
+    sinon le temps restant jusqu'à la deadline plus la moitié de la marge, l'autre moitié
+    restant pour archiver, enregistrer la progression et se ré-invoquer.
+    """
+    if deadline is None:
+        return default
+    return max(1, min(default, deadline - time.monotonic() + margin_seconds / 2))
+
+
+def event_too_large(event):
+    return len(json.dumps(event).encode('utf-8')) > MAX_EVENT_BYTES
+
+
+def reinvoke(context, event):
+    """
+    Relance la Lambda courante en asynchrone avec l'événement de continuation.
+
+    Une erreur d'invoke (droits, throttling, événement trop grand) est affichée sans être
+    levée : le lot courant est déjà traité, et relancer tout l'événement le referait.
+
+    Returns:
+        bool: True si une nouvelle invocation a été demandée.
+    """
+    if context is None or not hasattr(context, 'invoked_function_arn'):
+        return False
+
+    iteration = int(event.get('iteration', 0))
+    if iteration > MAX_ITERATIONS:
+        print(f"⛔ {MAX_ITERATIONS} itérations atteintes, arrêt de la chaîne d'invocations")
+        return False
+
+    import boto3  # fourni par le runtime Lambda, importé seulement quand il faut se relancer
+
+    try:
+        boto3.client('lambda').invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType='Event',
+            Payload=json.dumps(event).encode('utf-8')
+        )
+    except Exception as e:
+        print(f"❌ Ré-invocation impossible (itération {iteration}) : {e}")
+        return False
+    print(f"🔁 Continuation demandée (itération {iteration})")
+    return True
+
+
+def submit_until_deadline(executor, func, items, deadline, max_in_flight):
+    """
+    Exécute func(item) dans executor pour chaque item, avec au plus max_in_flight tâches
+    en cours ; plus aucun item n'est soumis une fois la deadline passée.
+
+    Yields:
+        (item, future) à mesure que les tâches se terminent. Les items jamais renvoyés
+        n'ont pas été démarrés et reviennent à l'invocation suivante.
+    """
+    pending_items = iter(items)
+    running = {}
+    while True:
+        while len(running) < max_in_flight and not time_is_up(deadline):
+            item = next(pending_items, _NO_ITEM)
+            if item is _NO_ITEM:
+                break
+            running[executor.submit(func, item)] = item
+        if not running:
+            return
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield running.pop(future), future
+
+
+class ProgressStore:
+    """
+    Progression d'une chaîne d'invocations, enregistrée en JSON dans S3 (objet key du bucket).
+
+    Sans bucket (exécution locale, CONTINUATION_BUCKET non défini), rien n'est enregistré.
+    Les erreurs S3 sont affichées sans interrompre le traitement : au pire, la reprise
+    repart d'un curseur plus ancien.
+    """
+
+    def __init__(self, key, bucket=STATE_BUCKET, s3_client=None):
+        self.key = key
+        self.bucket = bucket
+        self._s3_client = s3_client
+
+    @property
+    def s3_client(self):
+        if self._s3_client is None:
+            import boto3  # fourni par le runtime Lambda
+            self._s3_client = boto3.client('s3')
+        return self._s3_client
+
+    def load(self):
+        """Dernière progression enregistrée (dict), ou None."""
+        if not self.bucket:
+            return None
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key)
+            return json.loads(response['Body'].read())
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+                print(f"⚠️ Lecture de la progression {self.key} impossible : {e}")
+            return None
+
+    def save(self, state):
+        """Enregistre state ; renvoie True s'il a été écrit dans S3."""
+        if not self.bucket:
+            return False
+        try:
+            self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=json.dumps(state).encode('utf-8'),
+                                      ContentType='application/json')
+        except Exception as e:
+            print(f"⚠️ Enregistrement de la progression {self.key} impossible : {e}")
+            return False
+        return True
+
+    def clear(self):
+        """Supprime la progression une fois tout le travail de la chaîne terminé."""
+        if not self.bucket:
+            return
+        try:
+            self.s3_client.delete_object(Bucket=self.bucket, Key=self.key)
+        except Exception as e:
+            print(f"⚠️ Suppression de la progression {self.key} impossible : {e}")
@@ -0,0 +1,218 @@
+"""
+Client HTTP partagé par les Lambdas et les scripts de récupération historique.
+
+- une session requests avec pool de connexions keep-alive, réutilisée entre les appels
+  (et entre les invocations d'une Lambda "chaude" si le client est créé au niveau module) ;
+- des retries avec backoff exponentiel et jitter, en respectant l'en-tête Retry-After,
+  limités pour les méthodes non idempotentes (POST) aux requêtes que le serveur n'a pas traitées ;
+- une limite de requêtes simultanées et, optionnellement, de requêtes par seconde par hôte ;
+- des compteurs de latence, de retries et d'erreurs par hôte (stats() / log_stats()).
+
+Dans les images Lambda, ce fichier est copié à côté de app.py (build depuis lambda/).
+"""
+import email.utils
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+# (connexion, lecture) en secondes : plus jamais de requête sans timeout
+DEFAULT_TIMEOUT = (10, 300)
+# Statuts pour lesquels une nouvelle tentative a du sens
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Méthodes qui peuvent être rejouées sans effet de bord
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+# Pour les autres : statuts garantissant que la requête n'a pas été traitée (trop de requêtes, service indisponible)
+UNPROCESSED_STATUSES = frozenset({429, 503})
+
+
+def request_not_sent(error):
+    """Vrai si l'exception requests survient avant l'envoi de la requête (connexion impossible)."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.Timeout):
+        # Timeout de lecture : le serveur a pu recevoir et traiter la requête
+        return False
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+class HostLimiter:
+    """Limite de concurrence et de débit pour un hôte."""
+
+    def __init__(self, max_concurrency=None, rate_per_second=None):
+        self.semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self.interval = 1.0 / rate_per_second if rate_per_second else 0
+        self.lock = threading.Lock()
+        self.next_call = 0.0
+
+    def __enter__(self):
+        if self.semaphore:
+            self.semaphore.acquire()
+        if self.interval:
+            with self.lock:
+                now = time.monotonic()
+                delay = self.next_call - now
+                self.next_call = max(now, self.next_call) + self.interval
+            if delay > 0:
+                time.sleep(delay)
+        return self
+
+    def __exit__(self, *exc):
+        if self.semaphore:
+            self.semaphore.release()
+
+
+class HttpClient:
+    """
+    Session HTTP avec retries, limites par hôte et statistiques.
+
+    Args:
+        max_retries: nombre de nouvelles tentatives après le premier essai.
+        backoff_base: délai de base (s) du backoff exponentiel ; le délai réel est tiré
+            au hasard entre 0 et min(backoff_max, backoff_base * 2 ** tentative).
+        backoff_max: délai maximum entre deux tentatives (s), Retry-After compris.
+        timeout: timeout par défaut des requêtes (nombre ou tuple (connexion, lecture)).
+        pool_size: connexions keep-alive conservées par hôte.
+        max_per_host: requêtes simultanées maximum par hôte (None = illimité).
+        host_limits: {hôte: {'max_concurrency': n, 'rate_per_second': r}} pour surcharger
+            la limite par défaut d'un hôte précis.
+    """
+
+    def __init__(self, max_retries=3, backoff_base=1.0, backoff_max=60.0, timeout=DEFAULT_TIMEOUT,
+                 pool_size=10, max_per_host=None, host_limits=None):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        self.host_limits = host_limits or {}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._limiters = {}
+        self._stats = {}
+
+    def _limiter(self, host):
+        with self._lock:
+            if host not in self._limiters:
+                limits = self.host_limits.get(host, {})
+                self._limiters[host] = HostLimiter(
+                    max_concurrency=limits.get('max_concurrency', self.max_per_host),
+                    rate_per_second=limits.get('rate_per_second'),
+                )
+            return self._limiters[host]
+
+    def _record(self, host, elapsed=None, retry=False, error=False):
+        with self._lock:
+            stats = self._stats.setdefault(host, {
+                'requests': 0, 'retries': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0
+            })
+            if elapsed is not None:
+                stats['requests'] += 1
+                stats['total_time'] += elapsed
+                stats['max_time'] = max(stats['max_time'], elapsed)
+            if retry:
+                stats['retries'] += 1
+            if error:
+                stats['errors'] += 1
+
+    def _retry_delay(self, attempt, response=None):
+        """Délai avant la tentative suivante : Retry-After si fourni, sinon backoff avec jitter."""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return min(self.backoff_max, max(0.0, float(retry_after)))
+            except ValueError:
+                retry_date = email.utils.parsedate_to_datetime(retry_after)
+                if retry_date is not None:
+                    if retry_date.tzinfo is None:
+                        retry_date = retry_date.replace(tzinfo=timezone.utc)
+                    delay = (retry_date - datetime.now(timezone.utc)).total_seconds()
+                    return min(self.backoff_max, max(0.0, delay))
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, method, url, retry_statuses=None, idempotent=None, **kwargs):
+        """
+        Envoie une requête avec retries.
+
+        Pour une requête idempotente (GET, HEAD, OPTIONS par défaut), les erreurs réseau,
+        les timeouts et les statuts de retry_statuses (RETRY_STATUSES par défaut) sont
+        retentés. Pour les autres (POST d'ingestion...), une requête que le serveur a pu
+        traiter n'est jamais renvoyée : seules les erreurs de connexion et les statuts
+        429/503 sont retentés. idempotent=True force la politique des GET.
+        Après la dernière tentative, la dernière réponse est renvoyée telle quelle, ou la
+        dernière exception requests est relevée.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        if retry_statuses is None:
+            retry_statuses = RETRY_STATUSES if idempotent else UNPROCESSED_STATUSES
+        host = urlsplit(url).netloc
+        limiter = self._limiter(host)
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                with limiter:
+                    start = time.monotonic()
+                    response = self.session.request(method, url, **kwargs)
+                self._record(host, elapsed=time.monotonic() - start)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._record(host, error=True)
+                if attempt >= self.max_retries or not (idempotent or request_not_sent(e)):
+                    raise
+            else:
+                if response.status_code not in retry_statuses or attempt >= self.max_retries:
+                    return response
+
+            delay = self._retry_delay(attempt, response)
+            self._record(host, retry=True)
+            status = response.status_code if response is not None else 'erreur réseau'
+            print(f"🔁 {method} {host}: {status}, nouvelle tentative {attempt + 1}/{self.max_retries} "
+                  f"dans {delay:.1f}s")
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """Compteurs par hôte : requêtes, retries, erreurs réseau, latence moyenne et max (ms)."""
+        with self._lock:
+            return {
+                host: {
+                    'requests': s['requests'],
+                    'retries': s['retries'],
+                    'errors': s['errors'],
+                    'avg_ms': round(1000 * s['total_time'] / s['requests'], 1) if s['requests'] else 0,
+                    'max_ms': round(1000 * s['max_time'], 1),
+                }
+                for host, s in self._stats.items()
+            }
+
+    def log_stats(self, log=print):
+        for host, s in self.stats().items():
+            log(f"🌐 {host}: {s['requests']} requêtes, {s['retries']} retries, {s['errors']} erreurs, "
+                f"{s['avg_ms']} ms en moyenne (max {s['max_ms']} ms)")
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,31 @@
+"""
+Sélection des fichiers Dexter depuis le manifeste du serveur (GET /dexter/manifest).
+
+Une requête indexée sur la table DexterFile remplace le listing complet d'un préfixe S3.
+Les entrées renvoyées ont la forme d'un listing list_objects_v2 ({'Key', 'Size'}, plus
+les champs du manifeste) pour que les scripts gardent leur boucle de traitement.
+"""
+import requests
+
+
+def manifest_objects(server_url, prefix=None, file_type=None, status=None, timeout=60, **filters):
+    """
+    Fichiers du manifeste correspondant aux filtres.
+
+    Args:
+        prefix: dossier du bucket (ex: 'Dexter_history/'), les autres dossiers sont exclus.
+        file_type: 'stock', 'achat' ou 'vente'.
+        status: 'pending', 'processed' ou 'error'.
+        filters: autres filtres du serveur (cip_code, gers_code, start, end).
+
+    Returns:
+        list de dicts {'Key', 'Size', 'file_type', 'cip_code', 'gers_code', 'period_start', ...}
+    """
+    params = {'prefix': prefix, 'file_type': file_type, 'status': status, **filters}
+    response = requests.get(
+        f"{server_url}/dexter/manifest",
+        params={name: value for name, value in params.items() if value},
+        timeout=timeout
+    )
+    response.raise_for_status()
+    return [{'Key': row['key'], 'Size': row['size'], **row} for row in response.json()['files']]
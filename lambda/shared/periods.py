@@ -0,0 +1,217 @@
+"""
+Fenêtres de dates adaptatives pour les récupérations historiques WinPharma (ventes, achats).
+
+Au lieu de mois calendaires fixes, la taille de fenêtre suit les réponses de l'API :
+- réponse trop grosse ou trop lente : les fenêtres suivantes sont divisées par deux ;
+- requête refusée (400) ou en échec (timeout, 5xx après retries) : la même plage est
+  redemandée en deux moitiés, jusqu'à MIN_DAYS ;
+- réponses petites et rapides : les fenêtres doublent (jusqu'à MAX_DAYS), ce qui regroupe
+  plusieurs petites périodes en un seul appel ;
+- dt2 postérieur aux données du fournisseur : la dernière date disponible est retenue
+  (VendorCalendar) et toutes les plages suivantes y sont bornées d'office.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import requests
+
+# Taille maximale visée d'une réponse (octets) : au-delà, les fenêtres suivantes sont réduites
+WINDOW_MAX_BYTES = int(os.environ.get('WINDOW_MAX_BYTES', 8 * 1024 * 1024))
+# Durée maximale visée d'une requête (s)
+WINDOW_SLOW_SECONDS = float(os.environ.get('WINDOW_SLOW_SECONDS', 60))
+INITIAL_DAYS = int(os.environ.get('WINDOW_INITIAL_DAYS', 31))
+MIN_DAYS = int(os.environ.get('WINDOW_MIN_DAYS', 1))
+MAX_DAYS = int(os.environ.get('WINDOW_MAX_DAYS', 92))
+
+LATEST_DATE_PATTERN = re.compile(r"dernière date disponible = (\d{4}-\d{2}-\d{2})")
+
+# status : 'ok', 'empty' (204), 'late' (dt2 trop récent), 'rejected' (autre 400), 'failed'
+FetchResult = namedtuple('FetchResult', ['status', 'data', 'size', 'elapsed', 'error'])
+
+
+def latest_available_date(error_text):
+    """Dernière date disponible (YYYY-MM-DD) annoncée par une erreur 400 "dt2 est postérieur", sinon None."""
+    if not error_text or "dt2 est postérieur" not in error_text:
+        return None
+    match = LATEST_DATE_PATTERN.search(error_text)
+    return match.group(1) if match else None
+
+
+def as_date(value):
+    """date depuis une date, un datetime ou une chaîne YYYY-MM-DD."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+def monthly_periods(start, end):
+    """Mois calendaires (dt1, dt2) au format YYYY-MM-DD couvrant [start, end], bornés à ces dates."""
+    current, end = as_date(start), as_date(end)
+    result = []
+    while current <= end:
+        next_month = (current.replace(day=1) + timedelta(days=32)).replace(day=1)
+        result.append((current.isoformat(), min(end, next_month - timedelta(days=1)).isoformat()))
+        current = next_month
+    return result
+
+
+def _content_result(status_code, content, elapsed):
+    """FetchResult d'une réponse 200 ou 204 (réponses mises en cache)."""
+    if status_code == 204:
+        return FetchResult('empty', [], 0, elapsed, None)
+    try:
+        return FetchResult('ok', json.loads(content), len(content), elapsed, None)
+    except ValueError as e:
+        return FetchResult('failed', None, len(content), elapsed, f"JSON invalide: {e}")
+
+
+def winpharma_result(http, url, params, cache=None):
+    """
+    GET sur l'API WinPharma, classé en FetchResult.
+
+    Les erreurs réseau (déjà retentées par le client HTTP) donnent un statut 'failed'.
+    Avec un cache (response_cache.ResponseCache), les réponses 200/204 sont relues depuis le
+    disque, avec la durée de la requête d'origine, et seules les absentes sont téléchargées.
+    """
+    key = (url, params.get('Idnats', ''), params.get('dt1', ''), params.get('dt2', ''))
+    cached = cache.get(*key) if cache else None
+    if cached:
+        status_code, content, meta = cached
+        return _content_result(status_code, content, meta.get('elapsed', 0))
+
+    start = time.monotonic()
+    try:
+        response = http.get(url, params=params)
+    except requests.exceptions.RequestException as e:
+        return FetchResult('failed', None, 0, time.monotonic() - start, str(e))
+    elapsed = time.monotonic() - start
+
+    if response.status_code in (200, 204):
+        result = _content_result(response.status_code, response.content, elapsed)
+        if cache and result.status != 'failed':
+            cache.put(*key, response.status_code, response.content, elapsed)
+        return result
+    if response.status_code == 400:
+        latest = latest_available_date(response.text)
+        if latest:
+            return FetchResult('late', latest, 0, elapsed, response.text)
+        return FetchResult('rejected', None, 0, elapsed, response.text)
+    return FetchResult('failed', None, 0, elapsed, f"HTTP {response.status_code}: {response.text[:500]}")
+
+
+class VendorCalendar:
+    """Dernière date disponible chez le fournisseur, partagée entre threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latest = None
+
+    def learn(self, latest):
+        with self.lock:
+            latest = date.fromisoformat(latest) if isinstance(latest, str) else latest
+            if self.latest is None or latest < self.latest:
+                self.latest = latest
+
+    def clamp(self, end):
+        """Borne une date de fin à la dernière date disponible connue."""
+        with self.lock:
+            return min(end, self.latest) if self.latest else end
+
+
+class AdaptiveWindow:
+    """Taille de fenêtre courante (jours) d'un flux, ajustée d'après les réponses."""
+
+    def __init__(self, days=INITIAL_DAYS, min_days=MIN_DAYS, max_days=MAX_DAYS,
+                 max_bytes=WINDOW_MAX_BYTES, slow_seconds=WINDOW_SLOW_SECONDS):
+        self.min_days = max(1, min_days)
+        self.max_days = max(self.min_days, max_days)
+        self.days = min(max(days, self.min_days), self.max_days)
+        self.max_bytes = max_bytes
+        self.slow_seconds = slow_seconds
+
+    def shrink(self):
+        self.days = max(self.min_days, min(self.days // 2, self.max_days))
+
+    def feedback(self, span_days, result):
+        """Ajuste la fenêtre après une réponse exploitable couvrant span_days jours."""
+        if result.size > self.max_bytes or result.elapsed > self.slow_seconds:
+            self.days = max(self.min_days, min(self.days, span_days) // 2)
+        elif result.size < self.max_bytes / 4 and result.elapsed < self.slow_seconds / 4 and span_days >= self.days:
+            self.days = min(self.max_days, self.days * 2)
+
+
+def fetch_adaptive(fetch, dt1, dt2, window, calendar=None, log=print):
+    """
+    Parcourt la plage [dt1, dt2] par fenêtres adaptatives.
+
+    Args:
+        fetch: fonction (dt1, dt2) -> FetchResult, dates au format YYYY-MM-DD.
+        window: AdaptiveWindow du flux (conservée d'une plage à l'autre).
+        calendar: VendorCalendar partagé, pour borner les plages à la dernière date disponible.
+
+    Yields:
+        tuple (dt1, dt2, FetchResult) pour chaque fenêtre, dans l'ordre chronologique et sans trou ;
+        une fenêtre postérieure aux données disponibles est renvoyée avec le statut 'late'.
+    """
+    calendar = calendar or VendorCalendar()
+    cursor, end = date.fromisoformat(dt1), date.fromisoformat(dt2)
+    span = window.days
+
+    while cursor <= end:
+        available_end = calendar.clamp(end)
+        if cursor > available_end:
+            yield cursor.isoformat(), end.isoformat(), FetchResult('late', available_end.isoformat(), 0, 0, None)
+            return
+
+        sub_end = min(available_end, cursor + timedelta(days=span - 1))
+        span_days = (sub_end - cursor).days + 1
+        result = fetch(cursor.isoformat(), sub_end.isoformat())
+
+        if result.status == 'late':
+            if date.fromisoformat(result.data) < sub_end:
+                log(f"📅 Données disponibles jusqu'au {result.data}, plages bornées à cette date")
+                calendar.learn(result.data)
+                continue
+            # Date annoncée incohérente avec la fenêtre demandée : traitée comme un échec
+            result = result._replace(status='failed')
+
+        if result.status in ('rejected', 'failed') and span_days > window.min_days:
+            if result.status == 'rejected':
+                # Un refus dépend de la taille de la plage : inutile de redemander aussi grand
+                window.max_days = max(window.min_days, min(window.max_days, span_days - 1))
+            window.shrink()
+            span = max(window.min_days, span_days // 2)
+            log(f"✂️ {cursor}->{sub_end} ({result.status}), nouvel essai par fenêtres de {span} jours")
+            continue
+
+        yield cursor.isoformat(), sub_end.isoformat(), result
+        if result.status in ('ok', 'empty'):
+            window.feedback(span_days, result)
+        span = window.days
+        cursor = sub_end + timedelta(days=1)
+
+
+def covered_periods(periods, chunks):
+    """
+    Périodes entièrement couvertes par des fenêtres réussies.
+
+    Args:
+        periods: liste ordonnée de (dt1, dt2) contigus.
+        chunks: fenêtres déjà parcourues (dt1, dt2, FetchResult), dans l'ordre.
+
+    Returns:
+        list: périodes dont chaque jour a été récupéré avec succès.
+    """
+    failed = [(c1, c2) for c1, c2, result in chunks if result.status not in ('ok', 'empty')]
+    reached = chunks[-1][1] if chunks else ''
+    return [
+        (p1, p2) for p1, p2 in periods
+        if p2 <= reached and not any(c1 <= p2 and c2 >= p1 for c1, c2 in failed)
+    ]
@@ -0,0 +1,116 @@
+"""
+Cache disque des réponses de l'API WinPharma, pour rejouer une reprise historique sans
+retélécharger les mêmes mois.
+
+Une entrée par (endpoint, Idnats, dt1, dt2) : le corps brut compressé (.json.gz) et
+une petite fiche (.meta.json) avec le statut HTTP et la durée de la requête d'origine,
+pour que les fenêtres adaptatives (periods.py) se redécoupent à l'identique au rejeu.
+Le mot de passe ne fait jamais partie de la clé.
+
+Configuration par variables d'environnement (voir from_env) :
+    RESPONSE_CACHE_DIR        dossier du cache (non défini = cache désactivé)
+    RESPONSE_CACHE_TTL_HOURS  durée de validité d'une entrée (0 = sans expiration)
+    RESPONSE_CACHE_REFRESH    true pour ignorer les entrées existantes et les réécrire
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+
+class ResponseCache:
+    """
+    Args:
+        directory: dossier racine du cache.
+        ttl_seconds: âge maximum d'une entrée (None ou 0 = sans expiration).
+        refresh: si True, get() ne renvoie jamais rien et les entrées sont réécrites.
+    """
+
+    def __init__(self, directory, ttl_seconds=None, refresh=False):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds or None
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.writes = 0
+
+    def _paths(self, url, idnats, dt1, dt2):
+        endpoint = url.rstrip('/').rsplit('/', 1)[-1]
+        # L'ordre des Idnats ne change pas la réponse
+        ids = ','.join(sorted(str(idnats).split(',')))
+        digest = hashlib.sha256(f"{url}|{ids}|{dt1 or ''}|{dt2 or ''}".encode('utf-8')).hexdigest()[:32]
+        base = os.path.join(self.directory, endpoint, digest)
+        return base + '.json.gz', base + '.meta.json'
+
+    def _count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, url, idnats, dt1='', dt2=''):
+        """
+        Returns:
+            tuple (status_code, body bytes, meta dict) ou None si absent, expiré ou en rafraîchissement.
+        """
+        body_path, meta_path = self._paths(url, idnats, dt1, dt2)
+        if self.refresh or not os.path.exists(meta_path):
+            self._count('misses')
+            return None
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if self.ttl_seconds and time.time() - meta['stored_at'] > self.ttl_seconds:
+                self._count('misses')
+                return None
+            with gzip.open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError, KeyError):
+            self._count('misses')
+            return None
+        self._count('hits')
+        return meta['status_code'], body, meta
+
+    def put(self, url, idnats, dt1, dt2, status_code, body, elapsed):
+        """Enregistre une réponse ; l'écriture passe par des fichiers temporaires renommés (sûr entre processus)."""
+        body_path, meta_path = self._paths(url, idnats, dt1, dt2)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        meta = {
+            'url': url, 'idnats': idnats, 'dt1': dt1 or '', 'dt2': dt2 or '',
+            'status_code': status_code, 'size': len(body), 'elapsed': elapsed,
+            'stored_at': time.time(), 'stored_at_iso': datetime.now().isoformat(timespec='seconds'),
+        }
+        self._atomic_write(body_path, gzip.compress(body, compresslevel=6))
+        # La fiche est écrite en dernier : sa présence signifie que l'entrée est complète
+        self._atomic_write(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+        self._count('writes')
+
+    @staticmethod
+    def _atomic_write(path, content):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'writes': self.writes}
+
+    def log_stats(self, log=print):
+        s = self.stats()
+        log(f"🗄️ Cache {self.directory}: {s['hits']} réponses relues, {s['misses']} absentes, {s['writes']} écrites")
+
+
+def from_env():
+    """ResponseCache configuré par RESPONSE_CACHE_DIR / _TTL_HOURS / _REFRESH, ou None."""
+    directory = os.environ.get('RESPONSE_CACHE_DIR')
+    if not directory:
+        return None
+    ttl_hours = float(os.environ.get('RESPONSE_CACHE_TTL_HOURS', 0))
+    refresh = os.environ.get('RESPONSE_CACHE_REFRESH', 'false').lower() in ('1', 'true', 'yes')
+    return ResponseCache(directory, ttl_seconds=ttl_hours * 3600, refresh=refresh)
@@ -1,18 +1,30 @@
 import json
 import os
+import sys
 from datetime import datetime, timedelta
 
 import requests
-from dotenv import load_dotenv
 from requests.auth import HTTPBasicAuth
 
-load_dotenv()
+try:
+    import http_client
+except ImportError:  # exécution locale depuis le dépôt : le module partagé est dans lambda/shared
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+    import http_client
+
+try:  # python-dotenv n'est installé qu'en local : dans Lambda, la configuration vient de l'environnement
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
 
 api_key = "wservice"
 api_password = os.environ.get('PASSWORD')
 id_nat = os.environ.get('IDNAT')
 SERVER_URL = os.environ.get('SERVER_URL')
 
+http = http_client.HttpClient()
+
 
 def handler(event, context, full_dump=True):
     endpoints = {
@@ -29,10 +41,10 @@ def handler(event, context, full_dump=True):
 
         try:
             print(url)
-            response = requests.get(url, auth=HTTPBasicAuth(api_key, api_password))
+            response = http.get(url, auth=HTTPBasicAuth(api_key, api_password))
             print(len(response.json()))
-            x = requests.post(f"{SERVER_URL}/winpharma/create/{out_endpoint}", json=response.json(),
-                              headers={'Pharmacy-id': id_nat})
+            x = http.post(f"{SERVER_URL}/winpharma/create/{out_endpoint}", json=response.json(),
+                          headers={'Pharmacy-id': id_nat})
 
             if x.status_code != 200:
                 print(f"Error: {x.status_code}: {x.text}")
@@ -40,4 +52,8 @@ def handler(event, context, full_dump=True):
         except requests.exceptions.RequestException as e:
             print(f"Connexion Error: {e}")
 
-handler(1,1)
\ No newline at end of file
+    http.log_stats()
+
+
+if __name__ == "__main__":
+    handler({}, None)
@@ -1,13 +1,23 @@
 import json
 import os
-import re
+import sys
 from datetime import datetime, timedelta
 
 import requests
-from dotenv import load_dotenv
 
-# Charger les variables d'environnement
-load_dotenv()
+try:
+    import http_client
+    import periods
+except ImportError:  # exécution locale depuis le dépôt : les modules partagés sont dans lambda/shared
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+    import http_client
+    import periods
+
+try:  # python-dotenv n'est installé qu'en local : dans Lambda, la configuration vient de l'environnement
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
 
 # Variables d'environnement requises pour le Lambda
 SERVER_URL = os.environ.get('SERVER_URL')
@@ -15,6 +25,8 @@ API_URL = os.environ.get('API_URL')     # YXBvdGhpY2Fs (Base64 pour "apothical")
 API_PASSWORD = os.environ.get('API_PASSWORD')  # cGFzczE (Base64 pour "pass1")
 IDNATS = os.environ.get('IDNATS', '062044623')
 
+http = http_client.HttpClient()
+
 
 def handler(event, context, full_dump=True):
     """
@@ -71,7 +83,15 @@ def handler(event, context, full_dump=True):
         
         try:
             print(f"Requête: {url}")
-            response = requests.get(url)
+            response = http.get(url)
+            
+            # dt2 postérieur aux données disponibles : réessai borné à la dernière date disponible
+            max_date = periods.latest_available_date(response.text) if response.status_code == 400 else None
+            if max_date and not full_dump:
+                print(f"Date max disponible: {max_date}, réessai avec cette date")
+                url = url.replace(f"dt2={yesterday_str}", f"dt2={max_date}")
+                print(f"Nouvelle requête: {url}")
+                response = http.get(url)
             
             if response.status_code == 200:
                 # Requête réussie
@@ -91,7 +111,7 @@ def handler(event, context, full_dump=True):
                         print(f"- {date}: {count} ventes")
                 
                 # Envoyer les données au serveur
-                server_response = requests.post(
+                server_response = http.post(
                     f"{SERVER_URL}/winpharma_2/create/{out_endpoint}", 
                     json=data,
                     headers={'Pharmacy-id': IDNATS}
@@ -105,67 +125,6 @@ def handler(event, context, full_dump=True):
                     print(error_msg)
                     results[in_endpoint] = error_msg
             
-            # Gérer l'erreur spécifique de date future
-            elif response.status_code == 400 and "dt2 est postérieur aux données" in response.text:
-                try:
-                    # Extraire la date maximale disponible
-                    match = re.search(r"dernière date disponible = (\d{4}-\d{2}-\d{2})", response.text)
-                    if match:
-                        max_date = match.group(1)
-                        print(f"Date max disponible: {max_date}, réessai avec cette date")
-                        
-                        # Réessayer avec la date maximale
-                        url_corrected = url.replace(f"dt2={yesterday_str}", f"dt2={max_date}")
-                        print(f"Nouvelle requête: {url_corrected}")
-                        
-                        response = requests.get(url_corrected)
-                        if response.status_code == 200:
-                            data = response.json()
-                            print(f"Données récupérées: {len(json.dumps(data))} caractères")
-                            
-                            # Analyser la répartition des données (pour les ventes uniquement)
-                            if in_endpoint == 'ventes' and data and len(data) > 0 and 'ventes' in data[0]:
-                                ventes = data[0]['ventes']
-                                dates = {}
-                                for vente in ventes:
-                                    date = vente['heure'].split('T')[0]
-                                    dates[date] = dates.get(date, 0) + 1
-                                
-                                print(f"Répartition des ventes par jour:")
-                                for date, count in sorted(dates.items()):
-                                    print(f"- {date}: {count} ventes")
-                            
-                            # Envoyer les données au serveur
-                            server_response = requests.post(
-                                f"{SERVER_URL}/winpharma_2/create/{out_endpoint}", 
-                                json=data,
-                                headers={'Pharmacy-id': IDNATS}
-                            )
-                            
-                            if server_response.status_code == 200:
-                                print(f"Données envoyées avec succès au serveur pour {in_endpoint}")
-                                results[in_endpoint] = "OK"
-                            else:
-                                error_msg = f"Erreur serveur: {server_response.status_code}: {server_response.text}"
-                                print(error_msg)
-                                results[in_endpoint] = error_msg
-                        elif response.status_code == 204:
-                            # Pas de contenu pour cette date
-                            print(f"Pas de données disponibles pour {in_endpoint} à la date {max_date}")
-                            results[in_endpoint] = f"Pas de données disponibles pour la date {max_date}"
-                        else:
-                            error_msg = f"Erreur après correction de date: {response.status_code}: {response.text}"
-                            print(error_msg)
-                            results[in_endpoint] = error_msg
-                    else:
-                        error_msg = f"Impossible d'extraire la date max: {response.text}"
-                        print(error_msg)
-                        results[in_endpoint] = error_msg
-                except Exception as e:
-                    error_msg = f"Erreur lors du traitement de la correction de date: {str(e)}"
-                    print(error_msg)
-                    results[in_endpoint] = error_msg
-            
             # Gérer le cas où il n'y a pas de données (204 No Content)
             elif response.status_code == 204:
                 print(f"Pas de données disponibles pour {in_endpoint}")
@@ -182,6 +141,8 @@ def handler(event, context, full_dump=True):
             print(error_msg)
             results[in_endpoint] = error_msg
     
+    http.log_stats()
+
     # Retourner le résultat global
     return {
         "statusCode": 200,
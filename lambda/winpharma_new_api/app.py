@@ -1,170 +1,433 @@
+import gzip
+import hashlib
 import json
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
 
 import requests
-from dotenv import load_dotenv
 
-load_dotenv()
+try:
+    import continuation
+    import http_client
+except ImportError:  # exécution locale depuis le dépôt : les modules partagés sont dans lambda/shared
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+    import continuation
+    import http_client
+
+try:  # python-dotenv n'est installé qu'en local : dans Lambda, la configuration vient de l'environnement
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
 
 # Configuration pour nouvelle API WinPharma
 API_URL = os.environ.get('API_URL')  # ex: YXBvdGhpY2Fs
-API_PASSWORD = os.environ.get('API_PASSWORD')  # ex: cGFzczE  
+API_PASSWORD = os.environ.get('API_PASSWORD')  # ex: cGFzczE
 PHARMACY_ID = os.environ.get('PHARMACY_ID')  # ex: 062044623
+# Liste de pharmacies séparées par des virgules (prioritaire sur PHARMACY_ID)
+PHARMACY_IDS = os.environ.get('PHARMACY_IDS')
 SERVER_URL = os.environ.get('SERVER_URL')
-BASE_URL = "https://grpstat.winpharma.com/ApiWp"
+WINPHARMA_HOST = "grpstat.winpharma.com"
+BASE_URL = f"https://{WINPHARMA_HOST}/ApiWp"
 
-def handler(event, context, full_dump=False):  # Forcer False par défaut
+# Lots de pharmacies (voir IDNATS_BATCH_SIZE) traités simultanément
+MAX_CONCURRENT_PHARMACIES = int(os.environ.get('MAX_CONCURRENT_PHARMACIES', 8))
+# Nombre maximum de requêtes par seconde vers grpstat.winpharma.com, toutes pharmacies confondues
+API_RATE_LIMIT = float(os.environ.get('API_RATE_LIMIT', 4))
+# Pharmacies demandées dans un même appel API (paramètre Idnats séparé par des virgules)
+IDNATS_BATCH_SIZE = int(os.environ.get('IDNATS_BATCH_SIZE', 10))
+# Agrège les ventes par (produit, jour) avant l'envoi (endpoint winpharma_new_api/create/sales_aggregated)
+AGGREGATE_SALES = os.environ.get('AGGREGATE_SALES', 'false').lower() in ('1', 'true', 'yes')
+# N'envoie que les produits nouveaux ou modifiés, d'après le manifeste d'empreintes du serveur
+PRODUCT_DIFF = os.environ.get('PRODUCT_DIFF', 'true').lower() in ('1', 'true', 'yes')
+# Pharmacies restant à synchroniser, enregistrées dans le bucket CONTINUATION_BUCKET après chaque lot
+PROGRESS_KEY = 'Winpharma_state/new_api_{mode}.json'
+
+
+# Client partagé par toutes les invocations d'un même conteneur (connexions keep-alive réutilisées)
+http = http_client.HttpClient(
+    pool_size=max(10, MAX_CONCURRENT_PHARMACIES),
+    host_limits={
+        WINPHARMA_HOST: {'max_concurrency': MAX_CONCURRENT_PHARMACIES, 'rate_per_second': API_RATE_LIMIT}
+    },
+)
+
+
+def get_pharmacy_ids(event):
     """
-    Handler principal pour la nouvelle API WinPharma
-    
-    Args:
-        event: Event Lambda
-        context: Context Lambda  
-        full_dump: Si True, récupère toutes les données. Si False, période récente.
+    Liste des pharmacies à synchroniser : event["pharmacy_ids"], sinon PHARMACY_IDS,
+    sinon PHARMACY_ID.
+    """
+    ids = event.get('pharmacy_ids') if isinstance(event, dict) else None
+    if not ids:
+        ids = (PHARMACY_IDS or PHARMACY_ID or '').split(',')
+    if isinstance(ids, str):
+        ids = ids.split(',')
+    return [pharmacy_id.strip() for pharmacy_id in ids if pharmacy_id and pharmacy_id.strip()]
+
+
+def count_records(api_data, api_endpoint):
+    """Nombre d'enregistrements reçus par pharmacie (clé cip_pharma)."""
+    counts = {}
+    if isinstance(api_data, list):
+        for pharmacy_data in api_data:
+            if isinstance(pharmacy_data, dict):
+                cip = str(pharmacy_data.get('cip_pharma', ''))
+                counts[cip] = counts.get(cip, 0) + len(pharmacy_data.get(api_endpoint) or [])
+    return counts
+
+
+def aggregate_sales(api_data):
+    """
+    Réduit les lignes de ventes à une ligne par (produit, jour) et par pharmacie, comme
+    winpharma_new_api.process_sales côté serveur.
+
+    Returns:
+        list [{"cip_pharma": ..., "ventes_agregees": [{"product_id", "date", "qte"}]}]
+    """
+    result = []
+    for pharmacy_data in api_data if isinstance(api_data, list) else []:
+        if not isinstance(pharmacy_data, dict):
+            continue
+        aggregated = {}
+        for sale in pharmacy_data.get('ventes') or []:
+            day = (sale.get('heure') or '')[:10]
+            for line in sale.get('lignes', []):
+                try:
+                    prod_id = line.get('prodId')
+                    if not prod_id or int(prod_id) < 0:
+                        continue
+                    key = (str(prod_id), day)
+                    aggregated[key] = aggregated.get(key, 0) + int(line.get('qte', 0))
+                except (ValueError, TypeError):
+                    continue
+        result.append({
+            'cip_pharma': pharmacy_data.get('cip_pharma'),
+            'ventes_agregees': [
+                {'product_id': product_id, 'date': day, 'qte': qte}
+                for (product_id, day), qte in aggregated.items()
+            ]
+        })
+    return result
+
+
+# Bornes des colonnes de prix du serveur (entiers en centimes)
+MAX_PRICE = Decimal('21474836.47')
+
+
+def to_price(value):
+    """Prix arrondi au centime, borné comme les prix en centimes enregistrés par le serveur."""
+    return max(-MAX_PRICE, min(
+        Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+        MAX_PRICE
+    ))
+
+
+def product_fingerprint(product):
+    """
+    Empreinte (stock, prix TTC, PMP, nom, EAN) d'un produit de l'API.
+
+    Doit rester identique à data.services.product_manifest.product_fingerprint,
+    appliquée aux valeurs telles que le serveur les enregistre.
+    """
+    stock = max(-32768, min(int(product.get('Stock', 0)), 32767))
+    raw = '|'.join([
+        str(stock),
+        f"{to_price(product.get('PrixTTC', 0)):.2f}",
+        f"{to_price(product.get('PrixMP', 0)):.2f}",
+        product.get('Nom', '') or '',
+        product.get('Code13Ref') or '',
+    ])
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def fetch_product_manifests(pharmacy_ids):
+    """
+    Récupère les empreintes produits connues du serveur pour un lot de pharmacies.
+
+    Returns:
+        dict {id_nat: {internal_id: empreinte}} ou None si le manifeste est indisponible.
+    """
+    try:
+        response = http.get(
+            f"{SERVER_URL}/products/manifest",
+            params={'id_nat': ','.join(pharmacy_ids)},
+            timeout=120
+        )
+        if response.status_code == 200:
+            return response.json().get('pharmacies', {})
+        print(f"⚠️ Product manifest unavailable: {response.status_code}")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"⚠️ Product manifest unavailable: {e}")
+    return None
+
+
+def filter_changed_products(api_data, manifests):
+    """
+    Ne garde, pour chaque pharmacie, que les produits absents du manifeste ou dont
+    l'empreinte a changé. Un produit dont l'empreinte ne peut être calculée est conservé.
+
+    Returns:
+        tuple (données filtrées, nombre de produits conservés)
+    """
+    filtered, kept = [], 0
+    for pharmacy_data in api_data if isinstance(api_data, list) else []:
+        if not isinstance(pharmacy_data, dict):
+            continue
+        manifest = manifests.get(str(pharmacy_data.get('cip_pharma', '')), {})
+        changed = []
+        for product in pharmacy_data.get('produits') or []:
+            try:
+                unchanged = manifest.get(str(product.get('ProdId'))) == product_fingerprint(product)
+            except (ValueError, TypeError, ArithmeticError):
+                unchanged = False
+            if not unchanged:
+                changed.append(product)
+        kept += len(changed)
+        filtered.append({**pharmacy_data, 'produits': changed})
+    return filtered, kept
+
+
+def sync_batch(pharmacy_ids, full_dump=False):
+    """
+    Synchronise les trois endpoints pour un lot de pharmacies, en un appel API par endpoint.
+
+    La réponse contient un bloc par pharmacie (cip_pharma) ; elle est transmise telle
+    quelle à Django qui rattache chaque bloc à sa pharmacie.
+
+    Returns:
+        dict: {pharmacy_id: {endpoint API: résultat}}
     """
-    print(f"🚀 Starting WinPharma NEW API handler")
-    print(f"📋 Config: API_URL={API_URL}, PHARMACY_ID={PHARMACY_ID}")
-    print(f"🔄 Full dump: {full_dump}")
-    
     # Mapping des endpoints : API -> Django
     endpoints = {
         'produits': 'products',
-        'achats': 'orders', 
+        'achats': 'orders',
         'ventes': 'sales'
     }
-    
-    results = {}
-    
+
+    label = ','.join(pharmacy_ids) if len(pharmacy_ids) <= 3 else f"{pharmacy_ids[0]}…(+{len(pharmacy_ids) - 1})"
+    results = {pharmacy_id: {} for pharmacy_id in pharmacy_ids}
+
+    def set_result(api_endpoint, result, counts=None):
+        for pharmacy_id in pharmacy_ids:
+            pharmacy_result = dict(result)
+            if counts is not None:
+                pharmacy_result['records'] = counts.get(pharmacy_id, 0)
+            results[pharmacy_id][api_endpoint] = pharmacy_result
+
     for api_endpoint, django_endpoint in endpoints.items():
-        print(f"\n📡 Processing {api_endpoint} -> {django_endpoint}")
-        
+        print(f"📡 [{label}] Processing {api_endpoint} -> {django_endpoint}")
+
         try:
             # Construire l'URL et les paramètres
             url = f"{BASE_URL}/{API_URL}/{api_endpoint}"
             params = {
                 'password': API_PASSWORD,
-                'Idnats': PHARMACY_ID
+                'Idnats': ','.join(pharmacy_ids)
             }
-            
+
             # Ajouter des paramètres temporels pour achats et ventes
             if not full_dump and api_endpoint in ['achats', 'ventes']:
                 # MÊME PÉRIODE pour achats ET ventes : J-2 -> J-1 (2 jours)
                 dt2 = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
                 dt1 = (datetime.now() - timedelta(days=2)).strftime('%Y-%m-%d')
-                
+
                 params.update({'dt1': dt1, 'dt2': dt2})
-                print(f"📅 Period: {dt1} -> {dt2}")
-            
-            # Appel à la nouvelle API
-            print(f"🔍 Calling: {url}")
-            print(f"📋 Params: {params}")
-            
-            response = requests.get(url, params=params, timeout=60)
-            print(f"📊 Status: {response.status_code}")
-            
+                print(f"📅 [{label}] Period: {dt1} -> {dt2}")
+
+            # Appel à la nouvelle API (débit et concurrence limités par le client partagé)
+            response = http.get(url, params=params, timeout=60)
+            print(f"📊 [{label}] {api_endpoint} status: {response.status_code}")
+
             if response.status_code == 200:
                 api_data = response.json()
-                data_count = 0
-                
-                # Compter les données reçues
-                if isinstance(api_data, list) and len(api_data) > 0:
-                    pharmacy_data = api_data[0]
-                    if api_endpoint in pharmacy_data:
-                        data_count = len(pharmacy_data[api_endpoint])
-                
-                print(f"✅ Success: {data_count} records")
-                
-                # Envoyer à Django
+
+                # Compter les données reçues par pharmacie
+                counts = count_records(api_data, api_endpoint)
+                print(f"✅ [{label}] Success: {sum(counts.values())} records, {len(counts)} pharmacies")
+
+                # Envoyer à Django ; le header n'est utile que pour un lot d'une seule pharmacie
                 django_url = f"{SERVER_URL}/winpharma_new_api/create/{django_endpoint}"
-                headers = {'Pharmacy-id': PHARMACY_ID}
-                
-                print(f"📤 Sending to: {django_url}")
-                django_response = requests.post(
-                    django_url, 
-                    json=api_data,
-                    headers=headers,
-                    timeout=120
-                )
-                
-                print(f"📥 Django response: {django_response.status_code}")
-                
+                headers = {'Pharmacy-id': pharmacy_ids[0]} if len(pharmacy_ids) == 1 else {}
+
+                if api_endpoint == 'produits' and PRODUCT_DIFF:
+                    manifests = fetch_product_manifests(pharmacy_ids)
+                    if manifests is not None:
+                        api_data, changed = filter_changed_products(api_data, manifests)
+                        print(f"🔎 [{label}] {changed}/{sum(counts.values())} new or changed products")
+                        if not changed:
+                            set_result(api_endpoint, {"status": "success", "sent": 0}, counts)
+                            continue
+
+                if api_endpoint == 'ventes' and AGGREGATE_SALES:
+                    # Format compact (une ligne par produit et par jour), compressé en gzip
+                    payload = aggregate_sales(api_data)
+                    print(f"🧮 [{label}] {sum(len(p['ventes_agregees']) for p in payload)} aggregated sales")
+                    django_response = http.post(
+                        f"{django_url}_aggregated",
+                        data=gzip.compress(json.dumps(payload).encode('utf-8')),
+                        headers={**headers, 'Content-Type': 'application/json', 'Content-Encoding': 'gzip'},
+                        timeout=120
+                    )
+                else:
+                    django_response = http.post(
+                        django_url,
+                        json=api_data,
+                        headers=headers,
+                        timeout=120
+                    )
+
+                print(f"📥 [{label}] Django response: {django_response.status_code}")
+
                 if django_response.status_code == 200:
-                    print(f"✅ {api_endpoint} processed successfully")
-                    results[api_endpoint] = {
+                    set_result(api_endpoint, {
                         "status": "success",
-                        "records": data_count,
                         "django_status": django_response.status_code
-                    }
+                    }, counts)
                 else:
-                    print(f"❌ Django error: {django_response.text}")
-                    results[api_endpoint] = {
+                    print(f"❌ [{label}] Django error: {django_response.text}")
+                    set_result(api_endpoint, {
                         "status": "django_error",
-                        "records": data_count,
                         "django_status": django_response.status_code,
                         "error": django_response.text
-                    }
-                    
+                    }, counts)
+
             elif response.status_code == 400:
                 error_msg = response.text
-                print(f"⚠️ API Error 400: {error_msg}")
-                results[api_endpoint] = {
+                print(f"⚠️ [{label}] API Error 400: {error_msg}")
+                set_result(api_endpoint, {
                     "status": "api_error_400",
                     "error": error_msg
-                }
-                
+                })
+
             elif response.status_code == 204:
-                print(f"ℹ️ No data available for {api_endpoint}")
-                results[api_endpoint] = {
+                print(f"ℹ️ [{label}] No data available for {api_endpoint}")
+                set_result(api_endpoint, {
                     "status": "no_data",
                     "records": 0
-                }
-                
+                })
+
             else:
-                print(f"❌ API Error {response.status_code}: {response.text}")
-                results[api_endpoint] = {
+                print(f"❌ [{label}] API Error {response.status_code}: {response.text}")
+                set_result(api_endpoint, {
                     "status": f"api_error_{response.status_code}",
                     "error": response.text
-                }
-                
+                })
+
         except requests.exceptions.Timeout:
-            print(f"⏱️ Timeout for {api_endpoint}")
-            results[api_endpoint] = {
+            print(f"⏱️ [{label}] Timeout for {api_endpoint}")
+            set_result(api_endpoint, {
                 "status": "timeout",
                 "error": "Request timeout"
-            }
-            
+            })
+
         except requests.exceptions.RequestException as e:
-            print(f"🔌 Connection error for {api_endpoint}: {e}")
-            results[api_endpoint] = {
-                "status": "connection_error", 
+            print(f"🔌 [{label}] Connection error for {api_endpoint}: {e}")
+            set_result(api_endpoint, {
+                "status": "connection_error",
                 "error": str(e)
-            }
-            
+            })
+
         except Exception as e:
-            print(f"💥 Unexpected error for {api_endpoint}: {e}")
-            results[api_endpoint] = {
+            print(f"💥 [{label}] Unexpected error for {api_endpoint}: {e}")
+            set_result(api_endpoint, {
                 "status": "unexpected_error",
                 "error": str(e)
-            }
-    
+            })
+
+    return results
+
+
+def handler(event, context, full_dump=False):  # Forcer False par défaut
+    """
+    Handler principal pour la nouvelle API WinPharma
+
+    Args:
+        event: Event Lambda (clé optionnelle "pharmacy_ids" : liste ou chaîne séparée par des virgules)
+        context: Context Lambda
+        full_dump: Si True, récupère toutes les données. Si False, période récente.
+
+    Aucun lot n'est démarré après la marge de fin (voir continuation.TIME_MARGIN_SECONDS) :
+    les lots restants sont confiés à une nouvelle invocation de la même fonction, avec
+    {"pharmacy_ids": pharmacies restantes, "iteration": n + 1}. La liste des pharmacies
+    restantes est aussi enregistrée après chaque lot (continuation.ProgressStore) : une
+    invocation sans "pharmacy_ids" reprend d'abord une chaîne interrompue.
+    """
+    event = event if isinstance(event, dict) else {}
+    progress = continuation.ProgressStore(PROGRESS_KEY.format(mode='full' if full_dump else 'incremental'))
+    saved = None if event.get('pharmacy_ids') else progress.load()
+    if saved and saved.get('pharmacy_ids'):
+        print(f"⏯️ Reprise d'une chaîne interrompue : {len(saved['pharmacy_ids'])} pharmacies restantes")
+        event = {**event, 'pharmacy_ids': saved['pharmacy_ids'], 'iteration': saved.get('iteration', 0)}
+
+    pharmacy_ids = get_pharmacy_ids(event)
+    iteration = int(event.get('iteration', 0))
+    deadline = continuation.get_deadline(context)
+    batch_size = max(1, IDNATS_BATCH_SIZE)
+    batches = [pharmacy_ids[i:i + batch_size] for i in range(0, len(pharmacy_ids), batch_size)]
+    max_workers = max(1, min(MAX_CONCURRENT_PHARMACIES, len(batches)))
+
+    print(f"🚀 Starting WinPharma NEW API handler")
+    print(f"📋 Config: API_URL={API_URL}, {len(pharmacy_ids)} pharmacies, "
+          f"{len(batches)} batches of {batch_size}, {max_workers} workers")
+    print(f"🔄 Full dump: {full_dump}")
+
+    pharmacy_results = {}
+    done_ids = set()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch, future in continuation.submit_until_deadline(
+                executor, lambda batch: sync_batch(batch, full_dump), batches, deadline, max_workers):
+            try:
+                pharmacy_results.update(future.result())
+            except Exception as e:
+                print(f"💥 [{','.join(batch)}] Unexpected error: {e}")
+                for pharmacy_id in batch:
+                    pharmacy_results[pharmacy_id] = {"error": {"status": "unexpected_error", "error": str(e)}}
+            done_ids.update(batch)
+            progress.save({
+                'pharmacy_ids': [pharmacy_id for pharmacy_id in pharmacy_ids if pharmacy_id not in done_ids],
+                'iteration': iteration,
+            })
+
+    remaining_ids = [pharmacy_id for pharmacy_id in pharmacy_ids if pharmacy_id not in done_ids]
+
     # Résumé final
     print(f"\n🏁 FINAL RESULTS:")
-    success_count = sum(1 for r in results.values() if r.get("status") == "success")
-    total_count = len(results)
-    
+    success_count = 0
+    total_count = 0
+    for pharmacy_id, results in pharmacy_results.items():
+        pharmacy_success = sum(1 for r in results.values() if r.get("status") == "success")
+        success_count += pharmacy_success
+        total_count += len(results)
+        print(f"   {pharmacy_id}: {pharmacy_success}/{len(results)} endpoints")
+        for endpoint, result in results.items():
+            print(f"      {endpoint}: {result.get('status', 'unknown')} ({result.get('records', 0)} records)")
+
     print(f"✅ Success: {success_count}/{total_count}")
-    for endpoint, result in results.items():
-        status = result.get("status", "unknown")
-        records = result.get("records", 0)
-        print(f"   {endpoint}: {status} ({records} records)")
-    
+    http.log_stats()
+
+    next_event = None
+    continued = False
+    if remaining_ids:
+        print(f"⏳ {len(remaining_ids)} pharmacies reportées à l'invocation suivante")
+        next_event = {'pharmacy_ids': remaining_ids, 'iteration': iteration + 1}
+        continued = continuation.reinvoke(context, next_event)
+    else:
+        progress.clear()
+
     return {
-        'statusCode': 200 if success_count > 0 else 500,
+        'statusCode': 200 if success_count > 0 or remaining_ids else 500,
         'body': json.dumps({
             'message': f'Processed {success_count}/{total_count} endpoints successfully',
-            'results': results,
-            'pharmacy_id': PHARMACY_ID,
+            'results': pharmacy_results,
+            'pharmacy_ids': pharmacy_ids,
+            'continuation': next_event,
+            'continued': continued,
+            'http_stats': http.stats(),
             'timestamp': datetime.now().isoformat()
         })
     }
@@ -182,4 +445,4 @@ if __name__ == "__main__":
     # Test en local
     print("🧪 Testing locally...")
     result = handler({}, {}, full_dump=False)
-    print(f"Result: {json.dumps(result, indent=2)}")
\ No newline at end of file
+    print(f"Result: {json.dumps(result, indent=2)}")
@@ -53,6 +53,8 @@ def create_deployment_package():
         # 2. Copier le code
         print(f"📄 Copying source code...")
         shutil.copy2('app.py', temp_dir / 'app.py')
+        shutil.copy2(Path('..') / 'shared' / 'http_client.py', temp_dir / 'http_client.py')
+        shutil.copy2(Path('..') / 'shared' / 'continuation.py', temp_dir / 'continuation.py')
         
         # 3. Créer le ZIP
         print(f"🗜️ Creating ZIP file...")
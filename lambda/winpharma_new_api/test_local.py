@@ -45,10 +45,12 @@ def test_local():
         print(f"   Message: {body['message']}")
         print(f"   Results:")
         
-        for endpoint, details in body['results'].items():
-            status = details.get('status', 'unknown')
-            records = details.get('records', 0)
-            print(f"      {endpoint}: {status} ({records} records)")
+        for pharmacy_id, results in body['results'].items():
+            print(f"      {pharmacy_id}:")
+            for endpoint, details in results.items():
+                status = details.get('status', 'unknown')
+                records = details.get('records', 0)
+                print(f"         {endpoint}: {status} ({records} records)")
         
         return result
         
@@ -50,11 +50,12 @@ build_cmd = [
     '--platform', 'linux/amd64',
     '--load',  # Important pour charger l'image localement
     '-t', image_tag,
-    '.'
+    '-f', 'winpharma_new_api/Dockerfile',
+    '.'  # Contexte : le dossier lambda/, pour inclure le module partagé shared/http_client.py
 ]
 
 print(f"🔨 Running: {' '.join(build_cmd)}")
-result = subprocess.run(build_cmd, cwd=os.path.dirname(os.path.abspath(__file__)))
+result = subprocess.run(build_cmd, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 if result.returncode != 0:
     print(f"❌ Docker build failed")
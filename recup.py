@@ -8,13 +8,20 @@ Pharmacie : Avec récupération de la TVA depuis les ventes
 import requests
 import json
 import os
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
+import sys
+from datetime import datetime
 import time
-from typing import List, Tuple, Optional
+from typing import Optional
 import logging
 from dotenv import load_dotenv
 
+# Modules partagés avec les Lambdas : client HTTP (pool keep-alive, retries avec backoff, Retry-After)
+# et fenêtres de dates adaptatives
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda', 'shared'))
+import http_client
+import periods
+import response_cache
+
 # Charger les variables d'environnement
 load_dotenv()
 
@@ -35,43 +42,16 @@ API_PASSWORD = os.getenv('API_PASSWORD')
 PHARMACY_ID = os.getenv('PHARMACY_ID')
 SERVER_URL = os.getenv('SERVER_URL')
 
+# Une seule requête à la fois vers chaque hôte, comme le faisait le script séquentiel
+http = http_client.HttpClient(max_per_host=1)
+
+# Cache disque des réponses WinPharma (RESPONSE_CACHE_DIR, voir lambda/shared/response_cache.py)
+CACHE = response_cache.from_env()
+
 # Dates de début et fin
 START_DATE = datetime(2024, 1, 1)
 END_DATE = datetime(2025, 5, 31)
 
-def generate_monthly_periods(start_date: datetime, end_date: datetime) -> List[Tuple[str, str]]:
-    """
-    Génère les périodes mensuelles entre start_date et end_date
-    Retourne une liste de tuples (dt1, dt2) au format YYYY-MM-DD
-    """
-    periods = []
-    current_date = start_date.replace(day=1)  # Premier jour du mois
-    
-    while current_date <= end_date:
-        # Premier jour du mois
-        month_start = current_date
-        # Dernier jour du mois
-        month_end = (current_date + relativedelta(months=1)) - timedelta(days=1)
-        
-        # Si c'est le dernier mois, on s'arrête à end_date
-        if month_end > end_date:
-            month_end = end_date
-            
-        dt1 = month_start.strftime('%Y-%m-%d')
-        dt2 = month_end.strftime('%Y-%m-%d')
-        
-        periods.append((dt1, dt2))
-        logger.info(f"Période générée: {dt1} -> {dt2}")
-        
-        # Passer au mois suivant
-        current_date = current_date + relativedelta(months=1)
-        
-        # Si on a atteint la fin, on s'arrête
-        if month_start > end_date:
-            break
-    
-    return periods
-
 def test_single_request(endpoint: str, dt1: str = "", dt2: str = "") -> Optional[dict]:
     """
     Test une seule requête API pour diagnostic
@@ -84,7 +64,7 @@ def test_single_request(endpoint: str, dt1: str = "", dt2: str = "") -> Optional
     logger.info(f"🔍 TEST: {endpoint} - URL: {url}")
     
     try:
-        response = requests.get(url, timeout=30)
+        response = http.get(url)
         
         logger.info(f"📊 Status Code: {response.status_code}")
         logger.info(f"📋 Headers: {dict(response.headers)}")
@@ -132,97 +112,52 @@ def test_single_request(endpoint: str, dt1: str = "", dt2: str = "") -> Optional
         logger.error(f"💥 Exception: {e}")
         return None
 
-def fetch_winpharma_data(endpoint: str, dt1: str, dt2: str) -> Optional[dict]:
+def fetch_winpharma_data(endpoint: str, dt1: str, dt2: str) -> periods.FetchResult:
     """
     Récupère les données depuis l'API Winpharma pour une période donnée
-    Version améliorée avec gestion d'erreurs et retry
+    
+    Returns:
+        FetchResult : statut 'ok', 'empty', 'late' (dt2 postérieur aux données), 'rejected' ou 'failed'
     """
-    if endpoint == 'produits':
-        url = f"https://grpstat.winpharma.com/ApiWp/{API_URL}/{endpoint}?password={API_PASSWORD}&Idnats={PHARMACY_ID}"
-    else:
-        url = f"https://grpstat.winpharma.com/ApiWp/{API_URL}/{endpoint}?password={API_PASSWORD}&Idnats={PHARMACY_ID}&dt1={dt1}&dt2={dt2}"
+    url = f"https://grpstat.winpharma.com/ApiWp/{API_URL}/{endpoint}"
+    params = {'password': API_PASSWORD, 'Idnats': PHARMACY_ID}
+    if endpoint != 'produits':
+        params.update({'dt1': dt1, 'dt2': dt2})
     
     logger.info(f"Requête: {endpoint} du {dt1} au {dt2}")
-    logger.debug(f"URL: {url}")
     
-    # Retry avec backoff exponentiel
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                # 🆕 DIAGNOSTIC TVA POUR LES VENTES
-                if endpoint == 'ventes' and isinstance(data, list) and len(data) > 0:
-                    ventes = data[0].get('ventes', [])
-                    tva_count = 0
-                    total_lignes = 0
-                    
-                    for vente in ventes[:5]:  # Vérifier les 5 premières ventes
-                        for ligne in vente.get('lignes', []):
-                            total_lignes += 1
-                            if 'tva' in ligne and ligne['tva'] is not None:
-                                tva_count += 1
-                    
-                    if total_lignes > 0:
-                        tva_ratio = (tva_count / total_lignes) * 100
-                        logger.info(f"🔍 TVA présente dans {tva_count}/{total_lignes} lignes ({tva_ratio:.1f}%)")
-                    
-                logger.info(f"✅ {endpoint} {dt1}-{dt2}: {len(data)} enregistrements")
-                return data
-                
-            elif response.status_code == 204:
-                logger.info(f"ℹ️ Pas de données pour {endpoint} {dt1}-{dt2}")
-                return []
-                
-            elif response.status_code == 400:
-                error_text = response.text
-                logger.warning(f"⚠️ Erreur 400 pour {endpoint}: {error_text}")
-                
-                # Gestion spéciale pour les erreurs de date
-                if "dt2 est postérieur" in error_text:
-                    import re
-                    match = re.search(r"dernière date disponible = (\d{4}-\d{2}-\d{2})", error_text)
-                    if match:
-                        max_date = match.group(1)
-                        logger.info(f"🔄 Retry avec date max: {max_date}")
-                        
-                        # Construire nouvelle URL avec date corrigée
-                        if endpoint != 'produits':
-                            url_corrected = f"https://grpstat.winpharma.com/ApiWp/{API_URL}/{endpoint}?password={API_PASSWORD}&Idnats={PHARMACY_ID}&dt1={dt1}&dt2={max_date}"
-                            response = requests.get(url_corrected, timeout=30)
-                            if response.status_code == 200:
-                                data = response.json()
-                                logger.info(f"✅ {endpoint} avec date corrigée: {len(data)} enregistrements")
-                                return data
-                
-                return None
-                
-            else:
-                logger.error(f"❌ Erreur HTTP {response.status_code} pour {endpoint}: {response.text}")
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt
-                    logger.info(f"⏸️ Retry dans {wait_time}s...")
-                    time.sleep(wait_time)
-                    continue
-                return None
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Erreur de requête pour {endpoint} (tentative {attempt + 1}): {e}")
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                logger.info(f"⏸️ Retry dans {wait_time}s...")
-                time.sleep(wait_time)
-                continue
-            return None
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Erreur JSON pour {endpoint}: {e}")
-            logger.error(f"📄 Réponse: {response.text[:500]}...")
-            return None
+    # Les retries (backoff avec jitter, Retry-After) sont gérés par le client partagé
+    result = periods.winpharma_result(http, url, params, cache=CACHE)
     
-    return None
+    if result.status == 'ok':
+        data = result.data
+        
+        # 🆕 DIAGNOSTIC TVA POUR LES VENTES
+        if endpoint == 'ventes' and isinstance(data, list) and len(data) > 0:
+            ventes = data[0].get('ventes', [])
+            tva_count = 0
+            total_lignes = 0
+            
+            for vente in ventes[:5]:  # Vérifier les 5 premières ventes
+                for ligne in vente.get('lignes', []):
+                    total_lignes += 1
+                    if 'tva' in ligne and ligne['tva'] is not None:
+                        tva_count += 1
+            
+            if total_lignes > 0:
+                tva_ratio = (tva_count / total_lignes) * 100
+                logger.info(f"🔍 TVA présente dans {tva_count}/{total_lignes} lignes ({tva_ratio:.1f}%)")
+            
+        logger.info(f"✅ {endpoint} {dt1}-{dt2}: {result.size} octets en {result.elapsed:.1f}s")
+    elif result.status == 'empty':
+        logger.info(f"ℹ️ Pas de données pour {endpoint} {dt1}-{dt2}")
+    elif result.status == 'late':
+        logger.info(f"📅 {endpoint}: dernière date disponible = {result.data}")
+    elif result.status == 'rejected':
+        logger.warning(f"⚠️ Erreur 400 pour {endpoint}: {result.error}")
+    else:
+        logger.error(f"❌ Échec {endpoint} {dt1}-{dt2}: {result.error}")
+    return result
 
 def analyze_tva_data(data: dict) -> dict:
     """
@@ -296,7 +231,7 @@ def send_to_server(endpoint: str, data: dict, diagnostic: bool = False) -> bool:
                         logger.info(f"     TVA {tva_val}%: {count} occurrences")
     
     try:
-        response = requests.post(url, json=data, headers=headers, timeout=60)
+        response = http.post(url, json=data, headers=headers)
         
         logger.info(f"📊 Server response: {response.status_code}")
         
@@ -394,12 +329,7 @@ def main():
         test_mode()
         return
     
-    # Génération des périodes mensuelles
-    periods = generate_monthly_periods(START_DATE, END_DATE)
-    logger.info(f"📅 {len(periods)} périodes à traiter")
-    
     # Compteurs pour le suivi
-    total_requests = len(periods) * 2  # ventes + achats (on fait produits une seule fois)
     current_request = 0
     
     # Stats de succès/échec
@@ -422,9 +352,9 @@ def main():
     logger.info("="*50)
     
     try:
-        products_data = fetch_winpharma_data('produits', '', '')
-        if products_data is not None:
-            success = send_to_server('products', products_data)
+        result = fetch_winpharma_data('produits', '', '')
+        if result.status in ('ok', 'empty'):
+            success = send_to_server('products', result.data)
             if success:
                 stats['products']['success'] += 1
                 logger.info("✅ Produits traités avec succès")
@@ -438,76 +368,58 @@ def main():
         logger.error(f"❌ Exception produits: {e}")
         stats['products']['fail'] += 1
     
-    # 2. Récupération des ventes et achats par période
-    for i, (dt1, dt2) in enumerate(periods, 1):
+    # 2. Ventes puis achats sur toute la période, par fenêtres adaptatives : réduites sur les
+    #    grosses réponses, élargies sur les petites, bornées à la dernière date disponible
+    calendar = periods.VendorCalendar()
+    for endpoint, stream in (('ventes', 'sales'), ('achats', 'orders')):
         logger.info(f"\n" + "="*50)
-        logger.info(f"📊 PÉRIODE {i}/{len(periods)}: {dt1} -> {dt2}")
+        logger.info(f"📊 {endpoint.upper()}: {START_DATE.strftime('%Y-%m-%d')} -> {END_DATE.strftime('%Y-%m-%d')}")
         logger.info("="*50)
         
-        # Récupération des ventes
-        logger.info("💰 Récupération des ventes...")
+        window = periods.AdaptiveWindow()
+        windows = periods.fetch_adaptive(
+            lambda dt1, dt2: fetch_winpharma_data(endpoint, dt1, dt2),
+            START_DATE.strftime('%Y-%m-%d'), END_DATE.strftime('%Y-%m-%d'), window, calendar, log=logger.info
+        )
         try:
-            current_request += 1
-            ventes_data = fetch_winpharma_data('ventes', dt1, dt2)
-            
-            if ventes_data is not None:
-                # 🆕 ANALYSER LA TVA AVANT ENVOI
-                tva_stats = analyze_tva_data(ventes_data)
-                if tva_stats['lignes_avec_tva'] > 0:
-                    global_tva_stats['total_periods_with_tva'] += 1
-                    global_tva_stats['total_products_with_tva'].update(tva_stats['produits_avec_tva'])
-                    
-                    # Fusionner les valeurs TVA
-                    for tva_val, count in tva_stats['tva_values'].items():
-                        global_tva_stats['all_tva_values'][tva_val] = global_tva_stats['all_tva_values'].get(tva_val, 0) + count
-                    
-                    logger.info(f"🔍 TVA cette période: {tva_stats['lignes_avec_tva']} lignes, {len(tva_stats['produits_avec_tva'])} produits")
+            for dt1, dt2, result in windows:
+                current_request += 1
                 
-                success = send_to_server('sales', ventes_data)
-                if success:
-                    stats['sales']['success'] += 1
-                    logger.info(f"✅ Ventes {dt1}-{dt2} traitées")
-                else:
-                    stats['sales']['fail'] += 1
-                    logger.error(f"❌ Échec envoi ventes {dt1}-{dt2}")
-            else:
-                stats['sales']['fail'] += 1
-                logger.error(f"❌ Échec récupération ventes {dt1}-{dt2}")
+                if result.status == 'late':
+                    logger.info(f"⏭️ {endpoint} {dt1}-{dt2}: pas encore disponible")
+                    continue
+                if result.status not in ('ok', 'empty'):
+                    stats[stream]['fail'] += 1
+                    logger.error(f"❌ Échec récupération {endpoint} {dt1}-{dt2}")
+                    continue
                 
-            logger.info(f"Progress: {current_request}/{total_requests} requêtes")
+                # 🆕 ANALYSER LA TVA AVANT ENVOI
+                if endpoint == 'ventes':
+                    tva_stats = analyze_tva_data(result.data)
+                    if tva_stats['lignes_avec_tva'] > 0:
+                        global_tva_stats['total_periods_with_tva'] += 1
+                        global_tva_stats['total_products_with_tva'].update(tva_stats['produits_avec_tva'])
+                        
+                        # Fusionner les valeurs TVA
+                        for tva_val, count in tva_stats['tva_values'].items():
+                            global_tva_stats['all_tva_values'][tva_val] = global_tva_stats['all_tva_values'].get(tva_val, 0) + count
+                        
+                        logger.info(f"🔍 TVA cette période: {tva_stats['lignes_avec_tva']} lignes, {len(tva_stats['produits_avec_tva'])} produits")
                 
-        except Exception as e:
-            logger.error(f"❌ Exception ventes {dt1}-{dt2}: {e}")
-            stats['sales']['fail'] += 1
-        
-        # Récupération des achats  
-        logger.info("🛒 Récupération des achats...")
-        try:
-            current_request += 1
-            achats_data = fetch_winpharma_data('achats', dt1, dt2)
-            
-            if achats_data is not None:
-                success = send_to_server('orders', achats_data)
-                if success:
-                    stats['orders']['success'] += 1
-                    logger.info(f"✅ Achats {dt1}-{dt2} traités")
+                if send_to_server(stream, result.data):
+                    stats[stream]['success'] += 1
+                    logger.info(f"✅ {endpoint} {dt1}-{dt2} traités (fenêtre suivante: {window.days} jours)")
                 else:
-                    stats['orders']['fail'] += 1
-                    logger.error(f"❌ Échec envoi achats {dt1}-{dt2}")
-            else:
-                stats['orders']['fail'] += 1
-                logger.error(f"❌ Échec récupération achats {dt1}-{dt2}")
+                    stats[stream]['fail'] += 1
+                    logger.error(f"❌ Échec envoi {endpoint} {dt1}-{dt2}")
                 
-            logger.info(f"Progress: {current_request}/{total_requests} requêtes")
+                # Petite pause entre les fenêtres pour éviter de surcharger l'API
+                logger.info("⏸️  Pause de 2 secondes...")
+                time.sleep(2)
                 
         except Exception as e:
-            logger.error(f"❌ Exception achats {dt1}-{dt2}: {e}")
-            stats['orders']['fail'] += 1
-        
-        # Petite pause entre les périodes pour éviter de surcharger l'API
-        if i < len(periods):  # Pas de pause après la dernière période
-            logger.info("⏸️  Pause de 2 secondes...")
-            time.sleep(2)
+            logger.error(f"❌ Exception {endpoint}: {e}")
+            stats[stream]['fail'] += 1
     
     # 🆕 STATISTIQUES FINALES AVEC TVA
     logger.info("\n" + "="*50)
@@ -526,7 +438,7 @@ def main():
     
     # 🆕 STATISTIQUES TVA GLOBALES
     logger.info(f"\n📊 STATISTIQUES TVA GLOBALES:")
-    logger.info(f"   - Périodes avec TVA: {global_tva_stats['total_periods_with_tva']}/{len(periods)}")
+    logger.info(f"   - Fenêtres avec TVA: {global_tva_stats['total_periods_with_tva']}/{stats['sales']['success']}")
     logger.info(f"   - Produits uniques avec TVA: {len(global_tva_stats['total_products_with_tva'])}")
     
     if global_tva_stats['all_tva_values']:
@@ -565,4 +477,8 @@ if __name__ == "__main__":
         logger.error(f"❌ Erreur fatale: {e}")
         import traceback
         traceback.print_exc()
-        raise
\ No newline at end of file
+        raise
+    finally:
+        http.log_stats(logger.info)
+        if CACHE:
+            CACHE.log_stats(logger.info)
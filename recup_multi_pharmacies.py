@@ -3,18 +3,32 @@
 Script de récupération historique MULTI-PHARMACIES avec TVA - VERSION CORRIGÉE
 Chaque pharmacie utilise ses propres credentials
 Période : Janvier 2024 -> aout 2025
+
+Les lots de pharmacies sont traités en parallèle (BACKFILL_WORKERS), dans la limite de
+débit de chaque hôte. Chaque étape terminée (pharmacie, flux, période) est enregistrée
+dans CHECKPOINT_FILE : relancer le script reprend exactement là où il s'était arrêté
+(supprimer le fichier pour tout refaire).
 """
 
 import requests
 import json
 import os
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
-import time
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 from typing import List, Tuple, Optional, Dict
+from urllib.parse import urlsplit
 import logging
 from dotenv import load_dotenv
 
+# Modules partagés avec les Lambdas : client HTTP (pool keep-alive, retries, limites par hôte)
+# et outils de reprise (points de reprise, débit)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda', 'shared'))
+import backfill
+import http_client
+import periods
+import response_cache
+
 # Charger les variables d'environnement
 load_dotenv()
 
@@ -31,6 +45,38 @@ logger = logging.getLogger(__name__)
 
 # Configuration de base depuis le .env
 SERVER_URL = os.getenv('SERVER_URL')
+WINPHARMA_HOST = "grpstat.winpharma.com"
+
+# Pharmacies demandées dans un même appel API (paramètre Idnats séparé par des virgules)
+IDNATS_BATCH_SIZE = int(os.getenv('IDNATS_BATCH_SIZE', 10))
+# Lots de pharmacies traités en parallèle
+BACKFILL_WORKERS = int(os.getenv('BACKFILL_WORKERS', 4))
+# Requêtes par seconde et requêtes simultanées maximum vers l'API WinPharma
+WINPHARMA_RATE_LIMIT = float(os.getenv('WINPHARMA_RATE_LIMIT', 2))
+WINPHARMA_MAX_CONCURRENCY = int(os.getenv('WINPHARMA_MAX_CONCURRENCY', 2))
+# Envois simultanés maximum vers notre serveur
+SERVER_MAX_CONCURRENCY = int(os.getenv('SERVER_MAX_CONCURRENCY', 2))
+# Étapes terminées (une ligne JSON par pharmacie, flux et période)
+CHECKPOINT_FILE = os.getenv('CHECKPOINT_FILE', 'winpharma_multi_pharmacies_checkpoint.jsonl')
+# Intervalle (s) entre deux affichages du débit
+PROGRESS_INTERVAL = int(os.getenv('PROGRESS_INTERVAL', 10))
+
+# Cache disque des réponses WinPharma (RESPONSE_CACHE_DIR, voir lambda/shared/response_cache.py) :
+# une reprise rejouée relit les mois déjà téléchargés au lieu de les redemander
+CACHE = response_cache.from_env()
+
+# Dernière date disponible chez WinPharma, apprise à la première erreur "dt2 est postérieur"
+VENDOR_CALENDAR = periods.VendorCalendar()
+
+# Les limites par hôte remplacent les pauses fixes entre périodes et entre lots
+http = http_client.HttpClient(
+    pool_size=max(10, BACKFILL_WORKERS),
+    max_per_host=1,
+    host_limits={
+        WINPHARMA_HOST: {'max_concurrency': WINPHARMA_MAX_CONCURRENCY, 'rate_per_second': WINPHARMA_RATE_LIMIT},
+        urlsplit(SERVER_URL or '').netloc: {'max_concurrency': SERVER_MAX_CONCURRENCY},
+    },
+)
 
 # Dates de début et fin
 START_DATE = datetime(2024, 1, 1)
@@ -143,115 +189,62 @@ PHARMACIES_CONFIG = {
 #     }
 # }
 
-def generate_monthly_periods(start_date: datetime, end_date: datetime) -> List[Tuple[str, str]]:
-    """Génère les périodes mensuelles"""
-    periods = []
-    current_date = start_date.replace(day=1)
-    
-    while current_date <= end_date:
-        month_start = current_date
-        month_end = (current_date + relativedelta(months=1)) - timedelta(days=1)
-        
-        if month_end > end_date:
-            month_end = end_date
-            
-        dt1 = month_start.strftime('%Y-%m-%d')
-        dt2 = month_end.strftime('%Y-%m-%d')
-        periods.append((dt1, dt2))
-        
-        current_date = current_date + relativedelta(months=1)
-        if month_start > end_date:
-            break
-    
-    return periods
-
-def test_pharmacy_credentials(pharmacy_id: str, api_url: str, api_password: str) -> bool:
-    """Test si les credentials d'une pharmacie fonctionnent"""
-    url = f"https://grpstat.winpharma.com/ApiWp/{api_url}/produits"
-    params = {
-        'password': api_password,
-        'Idnats': pharmacy_id
-    }
-    
-    try:
-        response = requests.get(url, params=params, timeout=None)
-        if response.status_code == 200:
-            logger.info(f"✅ Credentials OK pour {pharmacy_id}")
-            return True
-        elif response.status_code == 401:
-            logger.error(f"❌ Credentials invalides pour {pharmacy_id}")
-            return False
-        else:
-            logger.warning(f"⚠️ Réponse inattendue {response.status_code} pour {pharmacy_id}")
-            return False
-    except Exception as e:
-        logger.error(f"❌ Erreur de test pour {pharmacy_id}: {e}")
-        return False
+def build_batches(pharmacies_config: dict) -> List[List[str]]:
+    """Regroupe les pharmacies partageant les mêmes credentials en lots de IDNATS_BATCH_SIZE"""
+    groups = {}
+    for pharmacy_id, config in pharmacies_config.items():
+        groups.setdefault((config['api_url'], config['api_password']), []).append(pharmacy_id)
+    
+    batch_size = max(1, IDNATS_BATCH_SIZE)
+    batches = []
+    for pharmacy_ids in groups.values():
+        batches.extend(pharmacy_ids[i:i + batch_size] for i in range(0, len(pharmacy_ids), batch_size))
+    return batches
 
-def fetch_winpharma_data(endpoint: str, pharmacy_id: str, api_url: str, api_password: str, dt1: str = "", dt2: str = "") -> Optional[dict]:
-    """Récupère les données depuis l'API Winpharma pour une pharmacie"""
-    if endpoint == 'produits':
-        url = f"https://grpstat.winpharma.com/ApiWp/{api_url}/{endpoint}"
-        params = {'password': api_password, 'Idnats': pharmacy_id}
+def split_by_pharmacy(data) -> Dict[str, list]:
+    """Découpe une réponse multi-Idnats en {cip_pharma: [bloc]}"""
+    blocks = {}
+    if isinstance(data, list):
+        for pharmacy_data in data:
+            if isinstance(pharmacy_data, dict):
+                blocks.setdefault(str(pharmacy_data.get('cip_pharma', '')), []).append(pharmacy_data)
+    return blocks
+
+def count_records(data, endpoint: str) -> int:
+    """Nombre d'enregistrements d'une réponse multi-Idnats, tous blocs confondus"""
+    if not isinstance(data, list):
+        return 0
+    return sum(len(block.get(endpoint) or []) for block in data if isinstance(block, dict))
+
+def fetch_winpharma_data(endpoint: str, pharmacy_id: str, api_url: str, api_password: str, dt1: str = "", dt2: str = "",
+                         meter: Optional[backfill.ThroughputMeter] = None) -> periods.FetchResult:
+    """
+    Récupère les données depuis l'API Winpharma (pharmacy_id : un ou plusieurs Idnats séparés par des virgules)
+    
+    Returns:
+        FetchResult : statut 'ok', 'empty', 'late' (dt2 postérieur aux données), 'rejected' ou 'failed'
+    """
+    url = f"https://{WINPHARMA_HOST}/ApiWp/{api_url}/{endpoint}"
+    params = {'password': api_password, 'Idnats': pharmacy_id}
+    if endpoint != 'produits':
+        params.update({'dt1': dt1, 'dt2': dt2})
+    
+    # Les retries (backoff avec jitter, Retry-After) sont gérés par le client partagé
+    result = periods.winpharma_result(http, url, params, cache=CACHE)
+    
+    if result.status == 'ok':
+        logger.info(f"✅ {endpoint} {pharmacy_id} {dt1}-{dt2}: {result.size} octets en {result.elapsed:.1f}s")
+        if meter:
+            meter.add(size=result.size)
+    elif result.status == 'empty':
+        logger.info(f"ℹ️ Pas de données pour {endpoint} {pharmacy_id} {dt1}-{dt2}")
+    elif result.status == 'late':
+        logger.info(f"📅 {endpoint} {pharmacy_id}: dernière date disponible = {result.data}")
+    elif result.status == 'rejected':
+        logger.warning(f"⚠️ Erreur 400 pour {endpoint} {pharmacy_id} {dt1}-{dt2}: {result.error}")
     else:
-        url = f"https://grpstat.winpharma.com/ApiWp/{api_url}/{endpoint}"
-        params = {'password': api_password, 'Idnats': pharmacy_id, 'dt1': dt1, 'dt2': dt2}
-    
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, params=params, timeout=None)
-            
-            if response.status_code == 200:
-                data = response.json()
-                logger.info(f"✅ {endpoint} {pharmacy_id} {dt1}-{dt2}: {len(json.dumps(data))} caractères")
-                return data
-                
-            elif response.status_code == 204:
-                logger.info(f"ℹ️ Pas de données pour {endpoint} {pharmacy_id} {dt1}-{dt2}")
-                return []
-                
-            elif response.status_code == 400:
-                error_text = response.text
-                logger.warning(f"⚠️ Erreur 400 pour {endpoint} {pharmacy_id}: {error_text}")
-                
-                # Gestion des erreurs de date
-                if "dt2 est postérieur" in error_text:
-                    import re
-                    match = re.search(r"dernière date disponible = (\d{4}-\d{2}-\d{2})", error_text)
-                    if match:
-                        max_date = match.group(1)
-                        logger.info(f"🔄 Retry avec date max: {max_date}")
-                        
-                        params['dt2'] = max_date
-                        response = requests.get(url, params=params, timeout=None)
-                        if response.status_code == 200:
-                            return response.json()
-                
-                return None
-                
-            elif response.status_code == 401:
-                logger.error(f"❌ Accès refusé (401) pour {pharmacy_id} - Credentials invalides")
-                return None
-                
-            else:
-                logger.error(f"❌ Erreur HTTP {response.status_code} pour {pharmacy_id}: {response.text}")
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt
-                    logger.info(f"⏸️ Retry dans {wait_time}s...")
-                    time.sleep(wait_time)
-                    continue
-                return None
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Erreur de requête pour {pharmacy_id} (tentative {attempt + 1}): {e}")
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                time.sleep(wait_time)
-                continue
-            return None
-    
-    return None
+        logger.error(f"❌ Échec {endpoint} {pharmacy_id} {dt1}-{dt2}: {result.error}")
+    return result
 
 def analyze_tva_data(data: dict) -> dict:
     """Analyse les données de ventes pour extraire les informations TVA"""
@@ -266,7 +259,7 @@ def analyze_tva_data(data: dict) -> dict:
     if not isinstance(data, list) or len(data) == 0:
         return tva_stats
     
-    ventes = data[0].get('ventes', [])
+    ventes = [vente for pharmacy_data in data for vente in pharmacy_data.get('ventes', [])]
     tva_stats['total_ventes'] = len(ventes)
     
     for vente in ventes:
@@ -285,12 +278,14 @@ def analyze_tva_data(data: dict) -> dict:
     return tva_stats
 
 def send_to_server(endpoint: str, pharmacy_id: str, data: dict) -> bool:
-    """Envoie les données au serveur Django"""
+    """Envoie les données au serveur Django (chaque bloc y est rattaché à sa pharmacie via cip_pharma)"""
     url = f"{SERVER_URL}/winpharma_historical/create/{endpoint}"
-    headers = {'Pharmacy-id': pharmacy_id, 'Content-Type': 'application/json'}
+    headers = {'Content-Type': 'application/json'}
+    if ',' not in pharmacy_id:
+        headers['Pharmacy-id'] = pharmacy_id
     
     try:
-        response = requests.post(url, json=data, headers=headers, timeout=None)
+        response = http.post(url, json=data, headers=headers)
         
         if response.status_code == 200:
             return True
@@ -302,30 +297,10 @@ def send_to_server(endpoint: str, pharmacy_id: str, data: dict) -> bool:
         logger.error(f"❌ Erreur envoi {endpoint} pour {pharmacy_id}: {e}")
         return False
 
-def process_single_pharmacy(pharmacy_id: str, config: dict, periods: List[Tuple[str, str]]) -> Dict:
-    """Traite une seule pharmacie avec ses credentials spécifiques"""
-    pharmacy_name = config['name']
-    api_url = config['api_url']
-    api_password = config['api_password']
-    
-    logger.info(f"\n🏥 TRAITEMENT: {pharmacy_name} ({pharmacy_id})")
-    logger.info("="*80)
-    
-    # 1. Test des credentials
-    if not test_pharmacy_credentials(pharmacy_id, api_url, api_password):
-        logger.error(f"❌ Credentials invalides pour {pharmacy_name} - SKIP")
-        return {
-            'pharmacy_id': pharmacy_id,
-            'pharmacy_name': pharmacy_name,
-            'status': 'credentials_error',
-            'products': {'success': 0, 'fail': 1},
-            'sales': {'success': 0, 'fail': 0},
-            'orders': {'success': 0, 'fail': 0}
-        }
-    
-    pharmacy_stats = {
+def new_pharmacy_stats(pharmacy_id: str) -> Dict:
+    return {
         'pharmacy_id': pharmacy_id,
-        'pharmacy_name': pharmacy_name,
+        'pharmacy_name': PHARMACIES_CONFIG[pharmacy_id]['name'],
         'status': 'processing',
         'products': {'success': 0, 'fail': 0},
         'sales': {'success': 0, 'fail': 0},
@@ -336,94 +311,131 @@ def process_single_pharmacy(pharmacy_id: str, config: dict, periods: List[Tuple[
             'all_tva_values': {}
         }
     }
+
+def merge_tva_stats(all_stats: Dict[str, Dict], ventes_data) -> None:
+    """Ajoute aux stats TVA de chaque pharmacie du lot l'analyse de ses blocs de ventes"""
+    for cip_pharma, blocks in split_by_pharmacy(ventes_data).items():
+        if cip_pharma not in all_stats:
+            continue
+        tva_stats = analyze_tva_data(blocks)
+        pharmacy_tva = all_stats[cip_pharma]['tva_stats']
+        if tva_stats['lignes_avec_tva'] > 0:
+            pharmacy_tva['total_periods_with_tva'] += 1
+            pharmacy_tva['total_products_with_tva'].update(tva_stats['produits_avec_tva'])
+            
+            for tva_val, count in tva_stats['tva_values'].items():
+                pharmacy_tva['all_tva_values'][tva_val] = pharmacy_tva['all_tva_values'].get(tva_val, 0) + count
+
+def process_pharmacy_batch(pharmacy_ids: List[str], plan_periods: List[Tuple[str, str]],
+                           checkpoint: backfill.CheckpointStore, meter: backfill.ThroughputMeter) -> List[Dict]:
+    """
+    Traite un lot de pharmacies partageant les mêmes credentials : un appel API multi-Idnats par endpoint
+    et par fenêtre de dates (voir lambda/shared/periods.py).
+    
+    Seules les pharmacies dont l'étape n'est pas dans le point de reprise sont demandées ;
+    une période n'y est enregistrée qu'une fois toutes ses fenêtres envoyées au serveur.
+    """
+    config = PHARMACIES_CONFIG[pharmacy_ids[0]]
+    api_url = config['api_url']
+    api_password = config['api_password']
     
-    # 2. Récupération des produits
-    logger.info("📦 Récupération des produits...")
-    try:
-        products_data = fetch_winpharma_data('produits', pharmacy_id, api_url, api_password)
-        if products_data is not None:
-            success = send_to_server('products', pharmacy_id, products_data)
-            if success:
-                pharmacy_stats['products']['success'] = 1
-                logger.info("✅ Produits traités avec succès")
-            else:
-                pharmacy_stats['products']['fail'] = 1
-                logger.error("❌ Échec envoi produits")
+    logger.info(f"🏥 TRAITEMENT LOT: {', '.join(pharmacy_ids)}")
+    
+    all_stats = {pharmacy_id: new_pharmacy_stats(pharmacy_id) for pharmacy_id in pharmacy_ids}
+    
+    def record(endpoint: str, pending: List[str], success: bool, dt1: str = '', dt2: str = '', records: int = 0):
+        for pharmacy_id in pending:
+            all_stats[pharmacy_id][endpoint]['success' if success else 'fail'] += 1
+        if success:
+            checkpoint.mark_done(pending, endpoint, dt1, dt2, records=records)
+            meter.add(steps=len(pending), records=records)
         else:
-            pharmacy_stats['products']['fail'] = 1
-            logger.error("❌ Échec récupération produits")
-    except Exception as e:
-        logger.error(f"❌ Exception produits: {e}")
-        pharmacy_stats['products']['fail'] = 1
+            meter.add(failed=len(pending))
     
-    # 3. Récupération des ventes et achats par période
-    for i, (dt1, dt2) in enumerate(periods, 1):
-        logger.info(f"📊 Période {i}/{len(periods)}: {dt1} -> {dt2}")
-        
-        # Ventes
+    # 1. Récupération des produits (sert aussi de test des credentials du lot)
+    pending = checkpoint.pending(pharmacy_ids, 'products')
+    if pending:
+        idnats = ','.join(pending)
         try:
-            ventes_data = fetch_winpharma_data('ventes', pharmacy_id, api_url, api_password, dt1, dt2)
-            
-            if ventes_data is not None:
-                # Analyser la TVA
-                tva_stats = analyze_tva_data(ventes_data)
-                if tva_stats['lignes_avec_tva'] > 0:
-                    pharmacy_stats['tva_stats']['total_periods_with_tva'] += 1
-                    pharmacy_stats['tva_stats']['total_products_with_tva'].update(tva_stats['produits_avec_tva'])
-                    
-                    for tva_val, count in tva_stats['tva_values'].items():
-                        pharmacy_stats['tva_stats']['all_tva_values'][tva_val] = pharmacy_stats['tva_stats']['all_tva_values'].get(tva_val, 0) + count
-                
-                success = send_to_server('sales', pharmacy_id, ventes_data)
-                if success:
-                    pharmacy_stats['sales']['success'] += 1
-                else:
-                    pharmacy_stats['sales']['fail'] += 1
-            else:
-                pharmacy_stats['sales']['fail'] += 1
-                
+            result = fetch_winpharma_data('produits', idnats, api_url, api_password, meter=meter)
+            products_data = result.data if result.status in ('ok', 'empty') else None
         except Exception as e:
-            logger.error(f"❌ Exception ventes {dt1}-{dt2}: {e}")
-            pharmacy_stats['sales']['fail'] += 1
+            logger.error(f"❌ Exception produits {idnats}: {e}")
+            products_data = None
         
-        # Achats
-        try:
-            achats_data = fetch_winpharma_data('achats', pharmacy_id, api_url, api_password, dt1, dt2)
-            
-            if achats_data is not None:
-                success = send_to_server('orders', pharmacy_id, achats_data)
-                if success:
-                    pharmacy_stats['orders']['success'] += 1
-                else:
-                    pharmacy_stats['orders']['fail'] += 1
-            else:
-                pharmacy_stats['orders']['fail'] += 1
-                
-        except Exception as e:
-            logger.error(f"❌ Exception achats {dt1}-{dt2}: {e}")
-            pharmacy_stats['orders']['fail'] += 1
+        if products_data is None:
+            logger.error(f"❌ Échec récupération produits pour le lot {idnats} - SKIP")
+            for stats in all_stats.values():
+                stats['status'] = 'credentials_error'
+            record('products', pending, False)
+            return list(all_stats.values())
         
-        # Pause entre périodes
-        if i < len(periods):
-            time.sleep(1)
-    
-    # Statistiques finales de la pharmacie
-    pharmacy_stats['status'] = 'completed'
+        success = send_to_server('products', idnats, products_data)
+        record('products', pending, success, records=count_records(products_data, 'produits'))
+        if not success:
+            logger.error(f"❌ Échec envoi produits {idnats}")
+    
+    # 2. Ventes puis achats, par fenêtres adaptatives sur chaque suite de périodes restant à faire :
+    #    les fenêtres se réduisent sur les grosses réponses et s'élargissent sur les petites
+    for endpoint, stream in (('ventes', 'sales'), ('achats', 'orders')):
+        window = periods.AdaptiveWindow()
+        for run_ids, run_periods in checkpoint.pending_runs(pharmacy_ids, stream, plan_periods):
+            idnats = ','.join(run_ids)
+            chunks, marked = [], set()
+            
+            def fetch(dt1, dt2):
+                return fetch_winpharma_data(endpoint, idnats, api_url, api_password, dt1, dt2, meter=meter)
+            
+            try:
+                for dt1, dt2, result in periods.fetch_adaptive(fetch, run_periods[0][0], run_periods[-1][1], window,
+                                                               VENDOR_CALENDAR, log=logger.info):
+                    if result.status == 'ok':
+                        if endpoint == 'ventes':
+                            merge_tva_stats(all_stats, result.data)
+                        meter.add(records=count_records(result.data, endpoint))
+                        if not send_to_server(stream, idnats, result.data):
+                            result = result._replace(status='failed', error='envoi serveur')
+                    elif result.status == 'late':
+                        logger.info(f"⏭️ {stream} {idnats}: {dt1}->{dt2} pas encore disponible, à reprendre plus tard")
+                    chunks.append((dt1, dt2, result))
+                    
+                    for period in periods.covered_periods(run_periods, chunks):
+                        if period not in marked:
+                            marked.add(period)
+                            record(stream, run_ids, True, *period)
+            except Exception as e:
+                logger.error(f"❌ Exception {endpoint} {idnats}: {e}")
+            
+            for period in run_periods:
+                if period not in marked:
+                    record(stream, run_ids, False)
     
-    logger.info(f"\n📊 STATISTIQUES {pharmacy_name}:")
-    for endpoint, stat in pharmacy_stats.items():
-        if endpoint not in ['pharmacy_id', 'pharmacy_name', 'status', 'tva_stats']:
+    # Statistiques finales du lot
+    for pharmacy_stats in all_stats.values():
+        pharmacy_stats['status'] = 'completed'
+        
+        logger.info(f"\n📊 STATISTIQUES {pharmacy_stats['pharmacy_name']}:")
+        for endpoint in ['products', 'sales', 'orders']:
+            stat = pharmacy_stats[endpoint]
             total = stat['success'] + stat['fail']
             if total > 0:
                 success_rate = (stat['success'] / total) * 100
                 logger.info(f"   {endpoint.upper()}: {stat['success']}/{total} succès ({success_rate:.1f}%)")
+        
+        # Statistiques TVA
+        tva_stats = pharmacy_stats['tva_stats']
+        if tva_stats['total_periods_with_tva'] > 0:
+            logger.info(f"   TVA: {len(tva_stats['total_products_with_tva'])} produits uniques avec TVA")
     
-    # Statistiques TVA
-    tva_stats = pharmacy_stats['tva_stats']
-    if tva_stats['total_periods_with_tva'] > 0:
-        logger.info(f"   TVA: {len(tva_stats['total_products_with_tva'])} produits uniques avec TVA")
-    
-    return pharmacy_stats
+    return list(all_stats.values())
+
+def count_pending_steps(checkpoint: backfill.CheckpointStore, pharmacy_ids: List[str], plan_periods: List[Tuple[str, str]]) -> int:
+    """Nombre d'étapes (pharmacie, flux, période) restant à faire"""
+    steps = len(checkpoint.pending(pharmacy_ids, 'products'))
+    for dt1, dt2 in plan_periods:
+        steps += len(checkpoint.pending(pharmacy_ids, 'sales', dt1, dt2))
+        steps += len(checkpoint.pending(pharmacy_ids, 'orders', dt1, dt2))
+    return steps
 
 def main():
     """Fonction principale du script multi-pharmacies"""
@@ -433,8 +445,17 @@ def main():
     logger.info(f"🏥 Nombre de pharmacies configurées: {len(PHARMACIES_CONFIG)}")
     
     # Génération des périodes
-    periods = generate_monthly_periods(START_DATE, END_DATE)
-    logger.info(f"📅 {len(periods)} périodes à traiter par pharmacie")
+    plan_periods = periods.monthly_periods(START_DATE, END_DATE)
+    logger.info(f"📅 {len(plan_periods)} périodes à traiter par pharmacie")
+    
+    # Reprise : étapes déjà terminées lors d'une exécution précédente
+    checkpoint = backfill.CheckpointStore(CHECKPOINT_FILE)
+    total_steps = len(PHARMACIES_CONFIG) * (1 + 2 * len(plan_periods))
+    pending_steps = count_pending_steps(checkpoint, list(PHARMACIES_CONFIG), plan_periods)
+    logger.info(f"💾 Point de reprise {CHECKPOINT_FILE}: {total_steps - pending_steps}/{total_steps} étapes déjà faites")
+    if not pending_steps:
+        logger.info("✅ Rien à reprendre")
+        return
     
     # Afficher aperçu des pharmacies configurées
     logger.info(f"🔍 Pharmacies configurées:")
@@ -445,7 +466,8 @@ def main():
     logger.warning("⚠️ IMPORTANT: Ce script ne traite que les pharmacies avec credentials configurés")
     logger.warning("⚠️ Pour ajouter d'autres pharmacies, vous devez obtenir leurs credentials API")
     
-    confirm = input(f"\n❓ Traiter {len(PHARMACIES_CONFIG)} pharmacies sur {len(periods)} périodes ? (oui/non): ").lower().strip()
+    confirm = input(f"\n❓ Traiter {len(PHARMACIES_CONFIG)} pharmacies sur {len(plan_periods)} périodes "
+                    f"({pending_steps} étapes restantes) ? (oui/non): ").lower().strip()
     
     if confirm not in ['oui', 'o', 'yes', 'y']:
         logger.info("⏹️ Traitement annulé")
@@ -461,31 +483,40 @@ def main():
         'global_tva_values': {}
     }
     
-    # Traitement de chaque pharmacie
-    for pharmacy_id, config in PHARMACIES_CONFIG.items():
-        try:
-            pharmacy_stats = process_single_pharmacy(pharmacy_id, config, periods)
-            
-            if pharmacy_stats['status'] == 'credentials_error':
-                global_stats['pharmacies_credentials_error'] += 1
-            elif pharmacy_stats['status'] == 'completed':
-                global_stats['pharmacies_processed'] += 1
+    # Traitement par lots de pharmacies (un appel multi-Idnats par endpoint et période),
+    # BACKFILL_WORKERS lots à la fois ; le débit de chaque hôte est borné par le client HTTP
+    batches = [
+        pharmacy_ids for pharmacy_ids in build_batches(PHARMACIES_CONFIG)
+        if count_pending_steps(checkpoint, pharmacy_ids, plan_periods)
+    ]
+    logger.info(f"📦 {len(batches)} lots de {IDNATS_BATCH_SIZE} pharmacies maximum, {BACKFILL_WORKERS} en parallèle")
+    
+    with backfill.ThroughputMeter(pending_steps, interval=PROGRESS_INTERVAL, log=logger.info) as meter, \
+            ThreadPoolExecutor(max_workers=max(1, BACKFILL_WORKERS)) as executor:
+        futures = {
+            executor.submit(process_pharmacy_batch, pharmacy_ids, plan_periods, checkpoint, meter): pharmacy_ids
+            for pharmacy_ids in batches
+        }
+        
+        for future in as_completed(futures):
+            pharmacy_ids = futures[future]
+            try:
+                for pharmacy_stats in future.result():
+                    if pharmacy_stats['status'] == 'credentials_error':
+                        global_stats['pharmacies_credentials_error'] += 1
+                    elif pharmacy_stats['status'] == 'completed':
+                        global_stats['pharmacies_processed'] += 1
+                        
+                        # Fusionner les stats TVA globales
+                        global_stats['total_tva_products'].update(pharmacy_stats['tva_stats']['total_products_with_tva'])
+                        for tva_val, count in pharmacy_stats['tva_stats']['all_tva_values'].items():
+                            global_stats['global_tva_values'][tva_val] = global_stats['global_tva_values'].get(tva_val, 0) + count
+                    else:
+                        global_stats['pharmacies_failed'] += 1
                 
-                # Fusionner les stats TVA globales
-                global_stats['total_tva_products'].update(pharmacy_stats['tva_stats']['total_products_with_tva'])
-                for tva_val, count in pharmacy_stats['tva_stats']['all_tva_values'].items():
-                    global_stats['global_tva_values'][tva_val] = global_stats['global_tva_values'].get(tva_val, 0) + count
-            else:
-                global_stats['pharmacies_failed'] += 1
-            
-            # Pause entre pharmacies
-            logger.info("⏸️ Pause de 3 secondes avant la pharmacie suivante...")
-            time.sleep(3)
-            
-        except Exception as e:
-            logger.error(f"💥 Erreur fatale pour {config['name']}: {e}")
-            global_stats['pharmacies_failed'] += 1
-            continue
+            except Exception as e:
+                logger.error(f"💥 Erreur fatale pour le lot {','.join(pharmacy_ids)}: {e}")
+                global_stats['pharmacies_failed'] += len(pharmacy_ids)
     
     # Statistiques finales
     logger.info("\n" + "="*80)
@@ -538,4 +569,8 @@ if __name__ == "__main__":
         logger.error(f"❌ Erreur fatale: {e}")
         import traceback
         traceback.print_exc()
-        raise
\ No newline at end of file
+        raise
+    finally:
+        http.log_stats(logger.info)
+        if CACHE:
+            CACHE.log_stats(logger.info)